@@ -0,0 +1,185 @@
+import json
+from math import ceil
+from types import SimpleNamespace
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, serializers, status
+from authentication.api.serializers import (
+    AsyncPhoneVerificationSerializer,
+    AsyncResendPhoneVerificationSerializer,
+    LoginSerializer,
+    SignupSerializer,
+    UserSerializer,
+)
+from authentication.authentication import CachedJWTAuthentication
+from authentication.throttling import IPThrottle, PhoneNumberThrottle, UserIdThrottle
+from authentication.utils.hashing import HashingPoolSaturated, amake_password
+from authentication.utils.jwt_token import aget_tokens_for_user
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncAuthView(View):
+    """
+    Base of the async authentication views (served natively under ASGI), JSON in and out.
+    Subclasses implement `ahandle`, the password hashing runs in the bounded hashing pool
+    """
+    http_method_names = ["post"]
+    #same name as the AuthViewSet action, for the throttle rates
+    action = None
+    throttle_classes = []
+
+    async def post(self, request):
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"detail": "JSON parse error"}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(data, dict):
+            return JsonResponse({"detail": "Expected a JSON object"}, status=status.HTTP_400_BAD_REQUEST)
+
+        wait = await self.athrottle(request, data)
+        if wait is not None:
+            return JsonResponse(
+                {"detail": f"Request was throttled. Expected available in {ceil(wait)} seconds."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(ceil(wait))},
+            )
+
+        try:
+            return await self.ahandle(request, data)
+        except serializers.ValidationError as e:
+            return JsonResponse(e.detail, status=status.HTTP_400_BAD_REQUEST, safe=False)
+        except HashingPoolSaturated:
+            return JsonResponse(
+                {"detail": "Server busy, retry later"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "1"},
+            )
+
+    async def athrottle(self, request, data):
+        """
+        Run the throttles, returns the seconds to wait when the request is throttled
+        """
+        #the throttles only need the client address and the body
+        throttle_request = SimpleNamespace(META=request.META, data=data, user=AnonymousUser())
+        for throttle_class in self.throttle_classes:
+            throttle = throttle_class()
+            if not await throttle.aallow_request(throttle_request, self):
+                return throttle.wait()
+        return None
+
+    async def ahandle(self, request, data):
+        raise NotImplementedError
+
+
+class AsyncSignupView(AsyncAuthView):
+    """
+    Async version of AuthViewSet.signup
+    """
+    action = "signup"
+
+    async def ahandle(self, request, data):
+        serializer = SignupSerializer(data=data)
+        await serializer.ais_valid(raise_exception=True)
+
+        password_hash = await amake_password(serializer.validated_data.get("password"))
+
+        user, security_otp = await serializer.asave(password_hash)
+        result = {
+            "user_id" : user.id,
+            "security_token" : security_otp.token,
+        }
+
+        return JsonResponse(result, status=status.HTTP_201_CREATED)
+
+
+class AsyncPhoneVerificationView(AsyncAuthView):
+    """
+    Async version of AuthViewSet.verify_phone_number
+    """
+    action = "verify_phone_number"
+    throttle_classes = [IPThrottle, UserIdThrottle]
+
+    async def ahandle(self, request, data):
+        serializer = AsyncPhoneVerificationSerializer(data=data)
+        await serializer.ais_valid(raise_exception=True)
+        user = await serializer.asave()
+        jwt = await aget_tokens_for_user(user)
+
+        data = {
+            "user": UserSerializer(user).data,
+            "tokens": jwt,
+        }
+
+        return JsonResponse(data, status=status.HTTP_200_OK)
+
+
+class AsyncResendPhoneVerificationView(AsyncAuthView):
+    """
+    Async version of AuthViewSet.resend_phone_verification
+    """
+    action = "resend_phone_verification"
+    throttle_classes = [IPThrottle, UserIdThrottle]
+
+    async def ahandle(self, request, data):
+        serializer = AsyncResendPhoneVerificationSerializer(data=data)
+        await serializer.ais_valid(raise_exception=True)
+        await serializer.asave()
+
+        data = {
+            "message": "Code resent successfully"
+        }
+
+        return JsonResponse(data, status=status.HTTP_200_OK)
+
+
+class AsyncLoginView(AsyncAuthView):
+    """
+    Async version of AuthViewSet.login
+    """
+    action = "login"
+    throttle_classes = [IPThrottle, PhoneNumberThrottle]
+
+    async def ahandle(self, request, data):
+        serializer = LoginSerializer(data=data)
+        await serializer.ais_valid(raise_exception=True)
+        user = serializer.save()
+        jwt = await aget_tokens_for_user(user)
+
+        data = {
+            "user": UserSerializer(user).data,
+            "tokens": jwt,
+        }
+
+        return JsonResponse(data, status=status.HTTP_200_OK)
+
+
+class AsyncUserView(View):
+    """
+    Async version of AuthViewSet.user, authenticated like the sync views (CachedJWTAuthentication)
+    """
+    http_method_names = ["get"]
+
+    async def get(self, request):
+        authenticator = CachedJWTAuthentication()
+        try:
+            auth = await authenticator.aauthenticate(request)
+        except exceptions.AuthenticationFailed as e:
+            return self._unauthorized(request, authenticator, e.detail)
+        if auth is None:
+            return self._unauthorized(request, authenticator, {"detail": exceptions.NotAuthenticated.default_detail})
+
+        user, _ = auth
+        return JsonResponse(UserSerializer(user).data, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def _unauthorized(request, authenticator, detail):
+        if not isinstance(detail, dict):
+            detail = {"detail": detail}
+        return JsonResponse(
+            detail,
+            status=status.HTTP_401_UNAUTHORIZED,
+            headers={"WWW-Authenticate": authenticator.authenticate_header(request)},
+        )
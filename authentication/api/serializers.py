@@ -1,12 +1,62 @@
 from rest_framework import serializers
 from authentication.constants import RegexCts, TokenCts
+from django.conf import settings
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
 
-from authentication.utils.otp import clear_otps, generate_and_save_otp_for, regenerate_otp, verify_code
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from authentication.utils.hashing import acheck_password
+from authentication.utils.jwt_token import RefreshToken, rotate_tokens
+from authentication.utils.otp import (
+    aget_otps,
+    aregenerate_otp,
+    averify_code,
+    check_code,
+    clear_many_otps,
+    generate_and_save_otps_for,
+    get_otps,
+    regenerate_otp,
+    verify_code,
+)
+from authentication.utils.otp_delivery import aqueue_otp_delivery, queue_otp_delivery
+from authentication.utils.phone import normalize_phone_number, phone_number_q
+from authentication.utils.revocation import RevocationList
 
 User = get_user_model()
 
-class SignupSerializer(serializers.Serializer):
+
+class AsyncValidationMixin:
+    """
+    Adds ais_valid to a serializer, validating with its `avalidate` coroutine instead of `validate`,
+    so that async views can query the db with the async ORM.
+    The fields (and validate_<field> methods) must not query the db
+    """
+    
+    async def avalidate(self, attrs):
+        return attrs
+    
+    async def ais_valid(self, raise_exception=False):
+        if not hasattr(self, "_validated_data"):
+            try:
+                attrs = self.to_internal_value(self.initial_data)
+                self._validated_data = await self.avalidate(attrs)
+            except serializers.ValidationError as exc:
+                self._validated_data = {}
+                self._errors = serializers.as_serializer_error(exc)
+            else:
+                self._errors = {}
+        
+        if self._errors and raise_exception:
+            raise serializers.ValidationError(self.errors)
+        
+        return not bool(self._errors)
+
+
+class SignupSerializer(AsyncValidationMixin, serializers.Serializer):
     phone_number = serializers.RegexField(max_length=120, regex=RegexCts.PHONE_REGEX, required=True)
     email = serializers.EmailField(required=False)
     first_name = serializers.CharField(max_length=120, required=False)
@@ -14,62 +64,116 @@ class SignupSerializer(serializers.Serializer):
     password = serializers.CharField(max_length=120, required=True)
     
     
+    def validate_phone_number(self, value):
+        return normalize_phone_number(value)
+    
     def validate_password(self, value):
         #use django password validators
         return value
     
     
-    def validate_phone_number(self, value):
+    def validate(self, attrs):
         #check if a user with the phone number exists
-        existing_users = User.objects.filter(phone_number=value, phone_is_verified=True)
+        existing_users = User.objects.filter(self._phone_number_q(), phone_is_verified=True)
         if existing_users.exists():
-            raise serializers.ValidationError("User with this phone number already exists")
+            self._raise_existing_user()
         
-        return value
+        return attrs
     
+    async def avalidate(self, attrs):
+        existing_users = User.objects.filter(self._phone_number_q(), phone_is_verified=True)
+        if await existing_users.aexists():
+            self._raise_existing_user()
+        
+        return attrs
     
-    def save(self, **kwargs):
-        #extract [phone_number, email, first_name, last_name]
-        phone_number = self.validated_data.get("phone_number")
+    def _phone_number_q(self):
+        #the number as given, for the users not normalized yet
+        return phone_number_q(self.initial_data.get("phone_number"))
+    
+    def _raise_existing_user(self):
+        raise serializers.ValidationError({"phone_number": "User with this phone number already exists"})
+    
+    
+    def save(self, password_hash=None, **kwargs):
+        """
+        password_hash: the password already hashed (e.g. by the async view, in the hashing pool),
+        it is hashed here otherwise
+        """
+        user, otp_tokens = self._save_user_and_otps(password_hash)
         
-        #check if user tried to signup and not finish the process
-        User.objects.filter(phone_number=phone_number, phone_is_verified=False).delete()
+        #send the phone number token once the signup is committed
+        queue_otp_delivery(otp_tokens[TokenCts.PHONE_NUMBER_TOKEN])
         
-        user = User.objects.create_user(**self.validated_data)
+        return user, otp_tokens[TokenCts.SIGNUP_SECURITY_TOKEN]
+    
+    async def asave(self, password_hash):
+        """
+        Async version of save: the writes run in a single transaction, in one call of the sync ORM
+        (the async ORM can't run them in a transaction), the otp is sent once they are committed
+        """
+        user, otp_tokens = await sync_to_async(transaction.atomic(self._save_user_and_otps))(password_hash)
+        await aqueue_otp_delivery(otp_tokens[TokenCts.PHONE_NUMBER_TOKEN])
         
-        #generate token for phone number verification
-        generate_and_save_otp_for(
-            extra_data={},
-            kind=TokenCts.PHONE_NUMBER_TOKEN,
-            user=user,
-        )
+        return user, otp_tokens[TokenCts.SIGNUP_SECURITY_TOKEN]
+    
+    def _save_user_and_otps(self, password_hash=None):
+        #check if user tried to signup and not finish the process,
+        #the account is reused instead of deleted (abandoned ones are purged in background, see authentication.tasks)
+        user = User.objects.filter(self._phone_number_q(), phone_is_verified=False).first()
+        
+        if user is None:
+            user = User.objects.create_user(**self.validated_data, password_hash=password_hash)
+        else:
+            for field in ["email", "first_name", "last_name"]:
+                setattr(user, field, self.validated_data.get(field, ""))
+            if password_hash is None:
+                user.set_password(self.validated_data.get("password"))
+            else:
+                user.password = password_hash
+            user.date_joined = timezone.now()
+            user.save()
         
-        #generate security token
-        security_otp = generate_and_save_otp_for(
+        #generate tokens for phone number verification and security, in a single write
+        otp_tokens = generate_and_save_otps_for(
             extra_data={},
-            kind=TokenCts.SIGNUP_SECURITY_TOKEN,
+            kinds=[TokenCts.PHONE_NUMBER_TOKEN, TokenCts.SIGNUP_SECURITY_TOKEN],
             user=user,
         )
         
-        return user,security_otp
+        return user, otp_tokens
     
 class WithSecurityToken(serializers.Serializer):
     security_token = serializers.CharField(required=True)
     
     
-    def _validate_security_token(self, value, user, kind):
+    def _validate_security_token(self, value, user, kind, otp_tokens=None):
+        """
+        otp_tokens: the otps of the user already loaded (see get_otps), the security otp is looked up otherwise
+        """
         security_token = value
         try:
-            security_otp = verify_code(
-                kind=kind,
-                user=user,
-                code=security_token,
-            )
+            if otp_tokens is None:
+                security_otp = verify_code(
+                    kind=kind,
+                    user=user,
+                    code=security_token,
+                )
+            else:
+                security_otp = check_code(otp_tokens.get(kind), security_token)
             self.security_otp = security_otp
         except Exception as e:
             raise serializers.ValidationError({"security_token": str(e)})
         
         return value
+    
+    async def _avalidate_security_token(self, value, user, kind):
+        try:
+            self.security_otp = await averify_code(kind=kind, user=user, code=value)
+        except Exception as e:
+            raise serializers.ValidationError({"security_token": str(e)})
+        
+        return value
 
 class PhoneVerificationSerializer(WithSecurityToken):
     otp = serializers.CharField(required=True)
@@ -80,25 +184,27 @@ class PhoneVerificationSerializer(WithSecurityToken):
         user = attrs.get("user")
         otp = attrs.get("otp")
         
+        #load the security and phone number otps with a single lookup
+        otp_tokens = get_otps([TokenCts.SIGNUP_SECURITY_TOKEN, TokenCts.PHONE_NUMBER_TOKEN], user)
+        self._check_otps(user, otp, otp_tokens)
+        
+        return attrs
+    
+    def _check_otps(self, user, otp, otp_tokens):
         #verify of the security token
         self._validate_security_token(
             value=self.initial_data.get("security_token"),
             user=user,
             kind=TokenCts.SIGNUP_SECURITY_TOKEN,
+            otp_tokens=otp_tokens,
         )
         
         try:
-            otp_token = verify_code(
-                kind=TokenCts.PHONE_NUMBER_TOKEN,
-                user=user,
-                code=otp,
-            )
+            otp_token = check_code(otp_tokens.get(TokenCts.PHONE_NUMBER_TOKEN), otp)
             self.otp_token = otp_token
         except Exception as e:
             raise serializers.ValidationError(str(e))
         
-        return attrs
-        
         
     def save(self, **kwargs):
         user:User = self.validated_data.get("user") #type: ignore
@@ -106,9 +212,8 @@ class PhoneVerificationSerializer(WithSecurityToken):
         user.save(
             update_fields=["phone_is_verified",]
         )
-        self.otp_token.delete()
-        #delete security token
-        self.security_otp.delete()
+        #delete the phone number and security tokens
+        clear_many_otps(kinds=[TokenCts.PHONE_NUMBER_TOKEN, TokenCts.SIGNUP_SECURITY_TOKEN], user=user)
         
         return user
     
@@ -132,26 +237,108 @@ class ResendPhoneVerificationSerializer(WithSecurityToken):
     def save(self, **kwargs):
         user:User = self.validated_data.get("user") #type: ignore
         
-        regenerate_otp(
+        otp_token = regenerate_otp(
             kind=TokenCts.PHONE_NUMBER_TOKEN,
             user=user,
         )
+        queue_otp_delivery(otp_token)
         
         return user
         
     
 
-class LoginSerializer(serializers.Serializer):
+async def _aget_unverified_user(user_id):
+    #the PrimaryKeyRelatedField of the sync serializers would query the db with the sync ORM
+    user = await User.objects.filter(pk=user_id, phone_is_verified=False).afirst()
+    if user is None:
+        message = serializers.PrimaryKeyRelatedField.default_error_messages["does_not_exist"]
+        raise serializers.ValidationError({"user": [message.format(pk_value=user_id)]})
+    return user
+
+
+class AsyncPhoneVerificationSerializer(AsyncValidationMixin, PhoneVerificationSerializer):
+    """
+    PhoneVerificationSerializer for the async views, the user and the otps are loaded with the async ORM
+    """
+    user = serializers.IntegerField(required=True)
+    
+    async def avalidate(self, attrs):
+        user = await _aget_unverified_user(attrs.get("user"))
+        attrs["user"] = user
+        
+        otp_tokens = await aget_otps([TokenCts.SIGNUP_SECURITY_TOKEN, TokenCts.PHONE_NUMBER_TOKEN], user)
+        self._check_otps(user, attrs.get("otp"), otp_tokens)
+        
+        return attrs
+    
+    async def asave(self):
+        #the user update and the otps deletion in a single transaction, like the sync view
+        return await sync_to_async(transaction.atomic(self.save))()
+
+
+class AsyncResendPhoneVerificationSerializer(AsyncValidationMixin, ResendPhoneVerificationSerializer):
+    """
+    ResendPhoneVerificationSerializer for the async views
+    """
+    user = serializers.IntegerField(required=True)
+    
+    async def avalidate(self, attrs):
+        user = await _aget_unverified_user(attrs.get("user"))
+        attrs["user"] = user
+        
+        await self._avalidate_security_token(
+            value=self.initial_data.get("security_token"),
+            user=user,
+            kind=TokenCts.SIGNUP_SECURITY_TOKEN,
+        )
+        
+        return attrs
+    
+    async def asave(self):
+        user:User = self.validated_data.get("user") #type: ignore
+        
+        otp_token = await aregenerate_otp(
+            kind=TokenCts.PHONE_NUMBER_TOKEN,
+            user=user,
+        )
+        await aqueue_otp_delivery(otp_token)
+        
+        return user
+
+
+class LoginSerializer(AsyncValidationMixin, serializers.Serializer):
     phone_number = serializers.RegexField(max_length=120, regex=RegexCts.PHONE_REGEX, required=True)
     password = serializers.CharField(max_length=120, required=True)
     
     
+    def validate_phone_number(self, value):
+        return normalize_phone_number(value)
+    
     def validate(self, attrs):
-        phone_number = attrs.get("phone_number")
         password = attrs.get("password")
         
         #try to get user
-        user = User.objects.filter(phone_number=phone_number).first()
+        user = User.objects.filter(phone_number_q(self.initial_data.get("phone_number"))).first()
+        self._check_user(user)
+        
+        if not user.check_password(password):
+            raise serializers.ValidationError("Invalid User credentials")
+        
+        return attrs
+    
+    async def avalidate(self, attrs):
+        password = attrs.get("password")
+        
+        user = await User.objects.filter(phone_number_q(self.initial_data.get("phone_number"))).afirst()
+        self._check_user(user)
+        
+        #the hashing runs in the bounded pool, not on the event loop
+        if not await acheck_password(user, password):
+            raise serializers.ValidationError("Invalid User credentials")
+        
+        return attrs
+    
+    def _check_user(self, user):
         self.user = user
         
         if not user:
@@ -159,14 +346,52 @@ class LoginSerializer(serializers.Serializer):
         
         if not user.phone_is_verified:
             raise serializers.ValidationError("Phone number is not verified")
+    
+    def save(self, **kwargs):
+        return self.user
+
+
+class WithRefreshToken(serializers.Serializer):
+    refresh = serializers.CharField(required=True)
+    
+    def validate_refresh(self, value):
+        #the blacklist is checked in db, refresh and logout are not hot paths
+        try:
+            return RefreshToken(value)
+        except TokenError as e:
+            raise serializers.ValidationError(str(e))
+
+
+class RefreshSerializer(WithRefreshToken):
+    
+    def validate(self, attrs):
+        #the claims are refreshed from the user, who may have been deactivated meanwhile
+        user_id = attrs.get("refresh").get(api_settings.USER_ID_CLAIM)
+        self.user = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+        if not self.user or not self.user.is_active:
+            raise serializers.ValidationError({"refresh": "User not found"})
         
-        if not user.check_password(password):
-            raise serializers.ValidationError("Invalid User credentials")
+        return attrs
+    
+    def save(self, **kwargs):
+        return rotate_tokens(self.validated_data.get("refresh"), self.user)
+
+
+class LogoutSerializer(WithRefreshToken):
+    
+    def validate(self, attrs):
+        request = self.context.get("request")
+        if attrs.get("refresh").get(api_settings.USER_ID_CLAIM) != request.user.pk:
+            raise serializers.ValidationError({"refresh": "Token does not belong to the user"})
         
         return attrs
     
     def save(self, **kwargs):
-        return self.user
+        request = self.context.get("request")
+        #the access tokens issued from the refresh token are revoked with it,
+        #the one of the request is revoked as well in case it was issued before
+        RevocationList.revoke(self.validated_data.get("refresh"))
+        RevocationList.revoke(request.auth)
     
     
 class UserSerializer(serializers.ModelSerializer):
@@ -183,4 +408,23 @@ class UserSerializer(serializers.ModelSerializer):
         ]
         
         
-    
\ No newline at end of file
+    
+
+class ContactDiscoverySerializer(serializers.Serializer):
+    phone_numbers = serializers.ListField(
+        child=serializers.RegexField(max_length=120, regex=RegexCts.PHONE_REGEX),
+        max_length=settings.CONTACT_DISCOVERY_MAX_NUMBERS,
+        required=False,
+    )
+    hashes = serializers.ListField(
+        child=serializers.RegexField(regex=RegexCts.SHA256_HEX_REGEX),
+        max_length=settings.CONTACT_DISCOVERY_MAX_NUMBERS,
+        required=False,
+        help_text="Hex sha256 of the E.164 phone numbers",
+    )
+    
+    def validate(self, attrs):
+        if bool(attrs.get("phone_numbers")) == bool(attrs.get("hashes")):
+            raise serializers.ValidationError("Either phone_numbers or hashes must be given")
+        
+        return attrs
@@ -1,13 +1,17 @@
+import json
 from rest_framework import viewsets
-from authentication.api.serializers import SignupSerializer, LoginSerializer, PhoneVerificationSerializer, UserSerializer, ResendPhoneVerificationSerializer
+from authentication.api.serializers import ContactDiscoverySerializer, SignupSerializer, LoginSerializer, LogoutSerializer, PhoneVerificationSerializer, RefreshSerializer, UserSerializer, ResendPhoneVerificationSerializer
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from authentication.throttling import IPThrottle, PhoneNumberThrottle, UserIdThrottle
+from authentication.utils.contacts import discover_contacts
 from authentication.utils.jwt_token import get_tokens_for_user
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django.db import transaction
+from django.http import StreamingHttpResponse
 
 #Auth viewSet with swagger documentation
 class AuthViewSet(viewsets.ViewSet):
@@ -83,6 +87,7 @@ class AuthViewSet(viewsets.ViewSet):
             ),
             status.HTTP_400_BAD_REQUEST: openapi.Response(description="Bad Request"),
             status.HTTP_401_UNAUTHORIZED: openapi.Response(description="Unauthorized"),
+            status.HTTP_429_TOO_MANY_REQUESTS: openapi.Response(description="Too Many Requests"),
         },
         tags=['Authentication'],
     )
@@ -90,6 +95,7 @@ class AuthViewSet(viewsets.ViewSet):
         methods=["POST"],
         detail=False,
         permission_classes=[AllowAny],
+        throttle_classes=[IPThrottle, UserIdThrottle],
         url_path="phone-verification",
         url_name="phone_verification",
     )
@@ -121,6 +127,7 @@ class AuthViewSet(viewsets.ViewSet):
             ),
             status.HTTP_400_BAD_REQUEST: openapi.Response(description="Bad Request"),
             status.HTTP_401_UNAUTHORIZED: openapi.Response(description="Unauthorized"),
+            status.HTTP_429_TOO_MANY_REQUESTS: openapi.Response(description="Too Many Requests"),
         },
         tags=['Authentication'],
     )
@@ -128,6 +135,7 @@ class AuthViewSet(viewsets.ViewSet):
         methods=["POST"],
         detail=False,
         permission_classes=[AllowAny],
+        throttle_classes=[IPThrottle, UserIdThrottle],
         url_path="resend-phone-verification",
         url_name="resend_phone_verification",
     )
@@ -169,6 +177,7 @@ class AuthViewSet(viewsets.ViewSet):
                 },
             ),
             status.HTTP_400_BAD_REQUEST: openapi.Response(description="Bad Request"),
+            status.HTTP_429_TOO_MANY_REQUESTS: openapi.Response(description="Too Many Requests"),
         },
         tags=['Authentication'],
     )
@@ -176,10 +185,10 @@ class AuthViewSet(viewsets.ViewSet):
         methods=["POST"],
         detail=False,
         permission_classes=[AllowAny],
+        throttle_classes=[IPThrottle, PhoneNumberThrottle],
         url_path="login",
         url_name="login",
     )
-    @transaction.atomic
     def login(self, request):
         """
         This endpoint is used to login a user
@@ -199,6 +208,69 @@ class AuthViewSet(viewsets.ViewSet):
     
     
     
+    @swagger_auto_schema(
+        request_body=RefreshSerializer,
+        responses={
+            status.HTTP_200_OK: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "access": openapi.Schema(type=openapi.TYPE_STRING),
+                    "refresh": openapi.Schema(type=openapi.TYPE_STRING),
+                },
+            ),
+            status.HTTP_400_BAD_REQUEST: openapi.Response(description="Bad Request"),
+            status.HTTP_429_TOO_MANY_REQUESTS: openapi.Response(description="Too Many Requests"),
+        },
+        tags=['Authentication'],
+    )
+    @action(
+        methods=["POST"],
+        detail=False,
+        permission_classes=[AllowAny],
+        throttle_classes=[IPThrottle],
+        url_path="refresh",
+        url_name="refresh",
+    )
+    @transaction.atomic
+    def refresh(self, request):
+        """
+        This endpoint is used to get new tokens from a refresh token, the given refresh token is revoked
+        """
+        serializer = RefreshSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        jwt = serializer.save()
+        
+        return Response(jwt, status=status.HTTP_200_OK)
+    
+    
+    @swagger_auto_schema(
+        request_body=LogoutSerializer,
+        responses={
+            status.HTTP_204_NO_CONTENT: openapi.Response(description="Logged out"),
+            status.HTTP_400_BAD_REQUEST: openapi.Response(description="Bad Request"),
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(description="Unauthorized"),
+        },
+        tags=['Authentication'],
+    )
+    @action(
+        methods=["POST"],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path="logout",
+        url_name="logout",
+    )
+    @transaction.atomic
+    def logout(self, request):
+        """
+        This endpoint is used to logout, the refresh token and the access tokens are revoked
+        """
+        serializer = LogoutSerializer(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    
     @swagger_auto_schema(
         responses={
             status.HTTP_200_OK: openapi.Schema(
@@ -219,7 +291,6 @@ class AuthViewSet(viewsets.ViewSet):
         url_path="user",
         url_name="user",
     )
-    @transaction.atomic
     def user(self, request):
         """
         
@@ -237,4 +308,74 @@ class AuthViewSet(viewsets.ViewSet):
         
         
         
-        
\ No newline at end of file
+        
+
+class ContactViewSet(viewsets.ViewSet):
+    """
+    This viewset handles the address book related endpoints
+    """
+    
+    @swagger_auto_schema(
+        request_body=ContactDiscoverySerializer,
+        responses={
+            status.HTTP_200_OK: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "matches": openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                "phone_number": openapi.Schema(type=openapi.TYPE_STRING, description="Or hash, as given"),
+                                "user_id": openapi.Schema(type=openapi.TYPE_INTEGER),
+                            },
+                        ),
+                    ),
+                },
+            ),
+            status.HTTP_400_BAD_REQUEST: openapi.Response(description="Bad Request"),
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(description="Unauthorized"),
+            status.HTTP_429_TOO_MANY_REQUESTS: openapi.Response(description="Too Many Requests"),
+        },
+        tags=['Contacts'],
+    )
+    @action(
+        methods=["POST"],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        throttle_classes=[UserIdThrottle],
+        url_path="discover",
+        url_name="discover",
+    )
+    def discover(self, request):
+        """
+        This endpoint is used to find the registered users among the phone numbers of an address book.
+        The numbers are given in any format accepted at signup, or as the hex sha256 of their
+        E.164 form (e.g. sha256("+237600000001")).
+        
+        At most CONTACT_DISCOVERY_MAX_NUMBERS (10 000) numbers per request, looked up by chunks of
+        CONTACT_DISCOVERY_CHUNK_SIZE with one indexed query per chunk: a 10 000 numbers request is
+        expected to take less than 500 ms. The matches are streamed as the chunks are looked up
+        """
+        serializer = ContactDiscoverySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        hashed = bool(serializer.validated_data.get("hashes"))
+        values = serializer.validated_data.get("hashes" if hashed else "phone_numbers")
+        chunks = discover_contacts(values, hashed=hashed)
+        
+        return StreamingHttpResponse(
+            _stream_matches(chunks, "hash" if hashed else "phone_number"),
+            content_type="application/json",
+        )
+
+
+def _stream_matches(chunks, value_name):
+    #a json object written chunk by chunk
+    yield '{"matches": ['
+    separator = ""
+    for matches in chunks:
+        for value, user_id in matches:
+            yield separator + json.dumps({value_name: value, "user_id": user_id})
+            separator = ","
+    yield "]}"
@@ -1,6 +1,26 @@
+import logging
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+logger = logging.getLogger(__name__)
 
 
 class AuthenticationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'authentication'
+
+    def ready(self):
+        import authentication.checks  # noqa: F401
+        import authentication.signals  # noqa: F401
+
+        post_migrate.connect(self.report_missing_indexes, sender=self)
+
+    @staticmethod
+    def report_missing_indexes(using, **kwargs):
+        from authentication.indexes import missing_indexes
+
+        #a plain CREATE INDEX would lock the writes of a live table during the deploy
+        names = [index.name for _, index in missing_indexes(using)]
+        if names:
+            logger.warning(f"Missing indexes {', '.join(names)}, run the create_indexes_concurrently command")
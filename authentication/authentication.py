@@ -0,0 +1,144 @@
+import hashlib
+from functools import lru_cache
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from authentication.utils.jwt_token import REFRESH_JTI_CLAIM
+from authentication.utils.revocation import RevocationList
+
+
+User = get_user_model()
+
+
+@lru_cache(maxsize=None)
+def _get_model_version() -> str:
+    #changes with the user fields, so that a deploy never reads users pickled by the previous model
+    fields = ",".join(field.attname for field in User._meta.concrete_fields)
+    return hashlib.md5(fields.encode()).hexdigest()[:8]
+
+
+def get_user_cache_key(user_id) -> str:
+    return f"jwt_user:{_get_model_version()}:{user_id}"
+
+
+def get_user_cache():
+    return caches[settings.JWT_USER_CACHE_ALIAS]
+
+
+def invalidate_cached_user(user_id):
+    get_user_cache().delete(get_user_cache_key(user_id))
+
+
+def invalidate_cached_users(user_ids):
+    get_user_cache().delete_many([get_user_cache_key(user_id) for user_id in user_ids])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication keeping the users in the django cache (JWT_USER_CACHE_ALIAS) for
+    JWT_USER_CACHE_TTL seconds, the cached user is dropped whenever the user is saved, updated or deleted.
+
+    Revoked tokens (logout, rotation) are rejected, checked against the in memory RevocationList.
+
+    With JWT_STATELESS_AUTH, the user is built from the token claims (see get_tokens_for_user)
+    without any lookup. The claims are as old as the token, so staff users are still looked up
+    """
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        #in memory check, see RevocationList
+        if RevocationList.is_revoked(*self._get_jtis(validated_token)):
+            raise InvalidToken(_("Token is blacklisted"))
+        return validated_token
+
+    async def aauthenticate(self, request):
+        """
+        Async version of authenticate, for the async views: the cache and the db are queried without blocking
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        #the signature check is cpu only (and cached, see CachedTokenBackend)
+        validated_token = super().get_validated_token(raw_token)
+        if await RevocationList.ais_revoked(*self._get_jtis(validated_token)):
+            raise InvalidToken(_("Token is blacklisted"))
+
+        return await self.aget_user(validated_token), validated_token
+
+    @staticmethod
+    def _get_jtis(validated_token):
+        return validated_token.get(api_settings.JTI_CLAIM), validated_token.get(REFRESH_JTI_CLAIM)
+
+    def get_user(self, validated_token):
+        user_id = self._get_user_id(validated_token)
+
+        if settings.JWT_STATELESS_AUTH and self.has_user_claims(validated_token):
+            return TokenUser(validated_token)
+
+        cache = get_user_cache()
+        cache_key = get_user_cache_key(user_id)
+        user = cache.get(cache_key)
+        if user is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            cache.set(cache_key, user, timeout=settings.JWT_USER_CACHE_TTL)
+
+        return self._check_user(user, validated_token)
+
+    async def aget_user(self, validated_token):
+        user_id = self._get_user_id(validated_token)
+
+        if settings.JWT_STATELESS_AUTH and self.has_user_claims(validated_token):
+            return TokenUser(validated_token)
+
+        cache = get_user_cache()
+        cache_key = get_user_cache_key(user_id)
+        user = await cache.aget(cache_key)
+        if user is None:
+            try:
+                user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            await cache.aset(cache_key, user, timeout=settings.JWT_USER_CACHE_TTL)
+
+        return self._check_user(user, validated_token)
+
+    @staticmethod
+    def _get_user_id(validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    @staticmethod
+    def _check_user(user, validated_token):
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
+
+    @staticmethod
+    def has_user_claims(validated_token) -> bool:
+        #tokens issued before the claims were added, or for staff users
+        return "phone_number" in validated_token and validated_token.get("is_staff") is False
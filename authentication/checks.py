@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS
+from django.core.checks import Tags, Warning, register
+from common.utils.cache import is_shared_cache
+
+
+@register(Tags.caches)
+def check_otp_delivery_cache(app_configs, **kwargs):
+    """
+    The otp messages buffered in a per process cache would never be seen by the flush_otp_deliveries task
+    """
+    if settings.OTP_DELIVERY_BUFFERED and not is_shared_cache(settings.OTP_DELIVERY_CACHE_ALIAS):
+        return [Warning(
+            f"OTP_DELIVERY_BUFFERED is set but the {settings.OTP_DELIVERY_CACHE_ALIAS!r} cache is not shared by the processes",
+            hint="Set REDIS_URL (or OTP_DELIVERY_CACHE_ALIAS to a shared cache), the messages are not buffered meanwhile",
+            id="authentication.W001",
+        )]
+    return []
+
+
+@register(Tags.caches)
+def check_throttle_cache(app_configs, **kwargs):
+    """
+    The throttle counters kept in a per process cache are multiplied by the number of workers
+    """
+    if settings.REST_FRAMEWORK.get("DEFAULT_THROTTLE_RATES") and not is_shared_cache(DEFAULT_CACHE_ALIAS):
+        return [Warning(
+            f"The throttle counters are kept in the {DEFAULT_CACHE_ALIAS!r} cache, which is not shared by the processes",
+            hint="Set REDIS_URL, each worker allows the full rate meanwhile",
+            id="authentication.W002",
+        )]
+    return []
@@ -0,0 +1,30 @@
+from django.core.validators import MaxValueValidator, MinLengthValidator, MinValueValidator
+from authentication.constants import TokenCts
+from common.config import ConfigKey, config
+
+
+for kind in TokenCts.TOKEN_TYPES_AS_LIST:
+    config.register(
+        ConfigKey(
+            name=f"{kind}_TTL",
+            value_type=int,
+            default=60*5,
+            validators=[MinValueValidator(1)],
+            description="Lifetime of the token in seconds",
+        ),
+        ConfigKey(
+            name=f"{kind}_LENGTH",
+            value_type=int,
+            default=6,
+            #OTPToken.token max_length
+            validators=[MinValueValidator(4), MaxValueValidator(120)],
+            description="Number of characters of the token",
+        ),
+        ConfigKey(
+            name=f"{kind}_ALPHABET",
+            value_type=str,
+            default="0123456789",
+            validators=[MinLengthValidator(2)],
+            description="Characters the token is made of",
+        ),
+    )
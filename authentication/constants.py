@@ -6,6 +6,7 @@ class RegexCts:
     # PHONE_REGEX =  r'^\+(?:[0-9] ?){6,14}[0-9]$'
     # Make the "+" optional
     PHONE_REGEX = r'^(?:\+)?(?:[0-9] ?){6,14}[0-9]$'
+    SHA256_HEX_REGEX = r'^[0-9a-f]{64}$'
 
 
 class AdditionalPhoneNumberCts:
@@ -29,4 +30,10 @@ class TokenCts:
         (SIGNUP_SECURITY_TOKEN,SIGNUP_SECURITY_TOKEN),
     )
     
-    TOKEN_TYPES_AS_LIST = [t[0] for t in TOKEN_TYPES]
\ No newline at end of file
+    TOKEN_TYPES_AS_LIST = [t[0] for t in TOKEN_TYPES]
+
+class OTPDeliveryCts:
+    SMS = "sms"
+    WHATSAPP = AdditionalPhoneNumberCts.WHATSAPP
+    
+    PROVIDERS = [SMS, WHATSAPP]
@@ -0,0 +1,58 @@
+from typing import List, Tuple, Type
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Index, Model, Q
+from authentication.models import AdditionalPhoneNumber, CustomUser
+
+
+#indexes of the hot query shapes, kept out of the models Meta so that they can be built on the live tables
+#with CREATE INDEX CONCURRENTLY (see the create_indexes_concurrently command), without blocking the writes.
+#migrate only reports the missing ones, run create_indexes_concurrently after it
+CONCURRENT_INDEXES = [
+    #purge of the abandoned signups: phone_is_verified = false AND date_joined < ?, a small part of the users
+    (CustomUser, Index(
+        fields=["date_joined"],
+        condition=Q(phone_is_verified=False),
+        name="customuser_unverified_idx",
+    )),
+    #contact discovery: normalized_phone_number IN (...) AND is_verified = true
+    (AdditionalPhoneNumber, Index(
+        fields=["normalized_phone_number"],
+        condition=Q(is_verified=True),
+        name="additionalphone_verified_idx",
+    )),
+]
+
+
+def missing_indexes(using:str=DEFAULT_DB_ALIAS) -> List[Tuple[Type[Model], Index]]:
+    """
+    This function helps to get the CONCURRENT_INDEXES not built yet
+    """
+    connection = connections[using]
+    missing = []
+    for model, index in CONCURRENT_INDEXES:
+        with connection.cursor() as cursor:
+            existing = connection.introspection.get_constraints(cursor, model._meta.db_table)
+        if index.name not in existing:
+            missing.append((model, index))
+    return missing
+
+
+def create_indexes(concurrently:bool, using:str=DEFAULT_DB_ALIAS) -> List[str]:
+    """
+    This function helps to build the missing CONCURRENT_INDEXES, returns their names
+    """
+    connection = connections[using]
+    created = []
+    for model, index in missing_indexes(using):
+        #CREATE INDEX CONCURRENTLY can't run in a transaction
+        with connection.schema_editor(atomic=not concurrently) as schema_editor:
+            try:
+                schema_editor.add_index(model, index, concurrently=concurrently)
+            except Exception:
+                #a failed concurrent build leaves an invalid index behind
+                if concurrently:
+                    schema_editor.remove_index(model, index, concurrently=True)
+                raise
+        created.append(index.name)
+
+    return created
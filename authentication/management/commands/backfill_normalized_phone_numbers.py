@@ -0,0 +1,35 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from authentication.utils.normalization import backfill_normalized_phone_numbers, has_missing_normalized_phone_numbers
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill normalized_phone_number of the users and additional phone numbers saved before it existed, by batches. "
+        "Users sharing the same canonical number are resolved: the unverified ones are deleted, the verified ones soft deleted. "
+        "Run it with --dry-run first to review them"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000, help="Number of rows read and written at once")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be done, without writing anything")
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="Database to backfill")
+
+    def handle(self, *args, batch_size, dry_run, database, **options):
+        started_at = time.monotonic()
+
+        report = backfill_normalized_phone_numbers(batch_size, dry_run=dry_run, using=database)
+        for label, users in [("deleted", report.deleted), ("soft deleted", report.soft_deleted)]:
+            for user_id, phone_number, winner_id in users:
+                self.stdout.write(f"User {user_id} ({phone_number}) {label}, the number is kept by user {winner_id}")
+        self.stdout.write(f"Normalized {report.users} user phone numbers")
+        self.stdout.write(f"Normalized {report.additional_phone_numbers} additional phone numbers")
+
+        elapsed = time.monotonic() - started_at
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f"Dry run done in {elapsed:.1f}s, nothing was written"))
+        elif has_missing_normalized_phone_numbers(database):
+            raise CommandError("Some phone numbers could not be normalized")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Backfill done in {elapsed:.1f}s"))
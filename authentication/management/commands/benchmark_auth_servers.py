@@ -0,0 +1,119 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from authentication.models import CustomUser
+from authentication.utils.jwt_token import get_tokens_for_user
+from common.utils.benchmark import Timings, format_duration
+
+
+PHONE_NUMBER = "+999000000001"
+PASSWORD = "benchmark-password"
+#the users signed up by the benchmark, "+9990001" followed by the deployment and the request number
+SIGNUP_PHONE_NUMBER_PREFIX = "+9990001"
+SCENARIOS = ["user", "login", "signup"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load benchmark of the authentication endpoints over concurrent keep-alive connections: "
+        "the sync views on the WSGI deployment vs the async views on the ASGI one (see docker-compose.yml). "
+        "The user scenario only reads, login and signup hash a password. "
+        "The servers must run with throttle rates allowing the load (e.g. LOGIN_IP_THROTTLE_RATE, LOGIN_PHONE_NUMBER_THROTTLE_RATE), "
+        "the throttled requests are reported apart"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--wsgi-url", default="http://localhost:8000", help="Base url of the WSGI deployment")
+        parser.add_argument("--asgi-url", default="http://localhost:8001", help="Base url of the ASGI deployment")
+        parser.add_argument("--connections", type=int, default=50, help="Number of concurrent connections")
+        parser.add_argument("--requests", type=int, default=2000, help="Number of requests per deployment and scenario")
+        parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS, help="Endpoints to load")
+
+    def handle(self, *args, wsgi_url, asgi_url, connections, requests, scenarios, **options):
+        #the servers share the database of this command, left by an interrupted run otherwise
+        self.clean_up()
+        #hashed like the servers hash it (PASSWORD_HASHERS), the login cost is the one of production
+        user = CustomUser.objects.create_user(phone_number=PHONE_NUMBER, password=PASSWORD, phone_is_verified=True)
+        try:
+            headers = {"Authorization": f"Bearer {get_tokens_for_user(user)['access']}"}
+            deployments = [("WSGI", wsgi_url, "auth"), ("ASGI", asgi_url, "async_auth")]
+            for scenario in scenarios:
+                for index, (label, base_url, namespace) in enumerate(deployments):
+                    if scenario == "user":
+                        method, path, expected_status = "GET", reverse(f"{namespace}-user"), 200
+                        build_body = lambda i: None
+                        request_headers = headers
+                    elif scenario == "login":
+                        method, path, expected_status = "POST", reverse(f"{namespace}-login"), 200
+                        build_body = lambda i: {"phone_number": PHONE_NUMBER, "password": PASSWORD}
+                        request_headers = {}
+                    else:
+                        method, path, expected_status = "POST", reverse(f"{namespace}-signup"), 201
+                        #a new user per request, the deployments don't reuse the signups of each other
+                        build_body = lambda i, index=index: {
+                            "phone_number": f"{SIGNUP_PHONE_NUMBER_PREFIX}{index}{i:06d}",
+                            "password": PASSWORD,
+                        }
+                        request_headers = {}
+
+                    result = self.run(base_url, method, path, request_headers, build_body, expected_status, connections, requests)
+                    self.stdout.write(f"{scenario} {label} {method} {base_url}{path}: {result}")
+        finally:
+            self.clean_up()
+
+    @staticmethod
+    def clean_up():
+        CustomUser.all_objects.filter(phone_number=PHONE_NUMBER).delete()
+        CustomUser.all_objects.filter(phone_number__startswith=SIGNUP_PHONE_NUMBER_PREFIX).delete()
+
+    @staticmethod
+    def run(
+        base_url:str, method:str, path:str, headers:dict, build_body:Callable[[int], Optional[dict]],
+        expected_status:int, connections:int, requests:int,
+    ) -> str:
+        url = urlsplit(base_url)
+        connection_class = HTTPSConnection if url.scheme == "https" else HTTPConnection
+        #one keep-alive connection per client thread
+        local = threading.local()
+        errors = []
+        throttled = []
+
+        def send(i):
+            if not hasattr(local, "connection"):
+                local.connection = connection_class(url.hostname, url.port)
+            body = build_body(i)
+            request_headers = headers
+            if body is not None:
+                body = json.dumps(body)
+                request_headers = {**headers, "Content-Type": "application/json"}
+            started_at = time.perf_counter()
+            try:
+                local.connection.request(method, path, body=body, headers=request_headers)
+                response = local.connection.getresponse()
+                response.read()
+                if response.status == 429:
+                    throttled.append(i)
+                elif response.status != expected_status:
+                    errors.append(response.status)
+            except (OSError, HTTPException) as e:
+                errors.append(type(e).__name__)
+                local.connection.close()
+                del local.connection
+            return time.perf_counter() - started_at
+
+        started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            timings = Timings(list(executor.map(send, range(requests))))
+        elapsed = time.monotonic() - started_at
+
+        return (
+            f"{requests / elapsed:.0f} req/s over {connections} connections, "
+            f"p50 {format_duration(timings.percentile(50))}, p99 {format_duration(timings.percentile(99))}, "
+            f"{len(throttled)} throttled, {len(errors)} errors"
+        )
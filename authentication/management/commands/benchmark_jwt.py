@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework_simplejwt.settings import api_settings
+from authentication.authentication import CachedJWTAuthentication
+from authentication.models import CustomUser
+from authentication.utils.jwt_token import AccessToken
+from authentication.utils.token_backend import CachedTokenBackend, token_backend
+from common.utils.benchmark import measure
+
+
+PHONE_NUMBER = "+999000000000"
+
+
+class Command(BaseCommand):
+    help = "Measure the JWT overhead of a request: signing, verifying with and without the verification cache, authenticating"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=10000, help="Number of calls per scenario")
+
+    def handle(self, *args, iterations, **options):
+        #left by an interrupted run
+        CustomUser.all_objects.filter(phone_number=PHONE_NUMBER).delete()
+        #deleted at the end
+        user = CustomUser.objects.create_user(phone_number=PHONE_NUMBER, password=None, phone_is_verified=True)
+        try:
+            self.run(user, iterations)
+        finally:
+            CustomUser.all_objects.filter(pk=user.pk).delete()
+
+    def run(self, user, iterations):
+        token = str(AccessToken.for_user(user))
+        uncached_backend = CachedTokenBackend(
+            api_settings.ALGORITHM,
+            api_settings.SIGNING_KEY,
+            api_settings.VERIFYING_KEY,
+            api_settings.AUDIENCE,
+            api_settings.ISSUER,
+            api_settings.JWK_URL,
+            api_settings.LEEWAY,
+            api_settings.JSON_ENCODER,
+            cache_size=0,
+        )
+        authentication = CachedJWTAuthentication()
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        self.stdout.write(f"{api_settings.ALGORITHM}, verification cache of {token_backend.cache_size} tokens")
+        scenarios = [
+            ("sign", lambda i: str(AccessToken.for_user(user))),
+            ("verify (no cache)", lambda i: uncached_backend.decode(token)),
+            ("verify (cached)", lambda i: token_backend.decode(token)),
+            ("authenticate (cached token and user)", lambda i: authentication.authenticate(request)),
+        ]
+        for label, func in scenarios:
+            timings = measure(func, iterations, warm_up=1)
+            self.stdout.write(f"{label}: {timings.summary()}")
@@ -0,0 +1,51 @@
+import asyncio
+import os
+import time
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand
+from authentication.models import CustomUser
+from authentication.utils.hashing import acheck_password
+
+
+PASSWORD = "benchmark-password"
+
+
+class Command(BaseCommand):
+    help = "Compare the login password checks per second on the request thread vs in the hashing pool (PASSWORD_HASHING_EXECUTOR)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=200, help="Number of password checks per scenario")
+
+    def handle(self, *args, logins, **options):
+        #an unsaved user, only its password hash is read
+        user = CustomUser(password=make_password(PASSWORD))
+        workers = settings.PASSWORD_HASHING_WORKERS
+        self.stdout.write(
+            f"{settings.PASSWORD_HASHERS[0]}, {settings.PASSWORD_HASHING_EXECUTOR} pool of {workers} workers, "
+            f"{os.cpu_count()} cpus"
+        )
+
+        started_at = time.monotonic()
+        for _ in range(logins):
+            check_password(PASSWORD, user.password)
+        self.report("request thread", logins, time.monotonic() - started_at, cores=1)
+
+        started_at = time.monotonic()
+        asyncio.run(self.check_in_pool(user, logins))
+        self.report("hashing pool", logins, time.monotonic() - started_at, cores=min(workers, os.cpu_count() or 1))
+
+    @staticmethod
+    async def check_in_pool(user, logins:int):
+        #at most PASSWORD_HASHING_MAX_PENDING checks at once, the pool rejects the next ones
+        pending = asyncio.Semaphore(settings.PASSWORD_HASHING_MAX_PENDING)
+
+        async def login():
+            async with pending:
+                await acheck_password(user, PASSWORD)
+
+        await asyncio.gather(*[login() for _ in range(logins)])
+
+    def report(self, label:str, logins:int, elapsed:float, cores:int):
+        per_second = logins / max(elapsed, 1e-9)
+        self.stdout.write(f"{label}: {logins} checks in {elapsed:.2f}s, {per_second:.1f} logins/s, {per_second / cores:.1f} per core")
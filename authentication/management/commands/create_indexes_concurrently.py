@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from authentication.indexes import CONCURRENT_INDEXES, create_indexes
+
+
+class Command(BaseCommand):
+    help = "Build the missing indexes of authentication.indexes with CREATE INDEX CONCURRENTLY, without blocking the writes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="Database to build the indexes on")
+
+    def handle(self, *args, database, **options):
+        started_at = time.monotonic()
+        self.stdout.write(f"Checking {len(CONCURRENT_INDEXES)} indexes")
+
+        created = create_indexes(concurrently=True, using=database)
+        for name in created:
+            self.stdout.write(f"Built {name}")
+
+        elapsed = time.monotonic() - started_at
+        self.stdout.write(self.style.SUCCESS(f"Built {len(created)} indexes in {elapsed:.1f}s"))
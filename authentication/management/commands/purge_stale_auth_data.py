@@ -0,0 +1,33 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from authentication.utils.purge import purge_expired_otps, purge_expired_tokens, purge_unverified_users
+
+
+class Command(BaseCommand):
+    help = "Delete the expired otps and jwt tokens and the users who never verified their phone number, by batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.AUTH_PURGE_BATCH_SIZE, help="Number of rows deleted at once")
+        parser.add_argument("--pause", type=float, default=settings.AUTH_PURGE_BATCH_PAUSE, help="Seconds to wait between two batches")
+        parser.add_argument("--unverified-hours", type=int, default=settings.UNVERIFIED_USER_RETENTION_HOURS, help="Age (in hours) of the unverified users to delete")
+
+    def handle(self, *args, batch_size, pause, unverified_hours, **options):
+        started_at = time.monotonic()
+
+        otps = purge_expired_otps(batch_size=batch_size, pause=pause)
+        self.stdout.write(f"Deleted {otps} expired otps")
+
+        tokens = purge_expired_tokens(batch_size=batch_size, pause=pause)
+        self.stdout.write(f"Deleted {tokens} expired tokens")
+
+        users = purge_unverified_users(
+            older_than=timedelta(hours=unverified_hours),
+            batch_size=batch_size,
+            pause=pause,
+        )
+        self.stdout.write(f"Deleted {users} unverified users")
+
+        elapsed = time.monotonic() - started_at
+        self.stdout.write(self.style.SUCCESS(f"Purge done in {elapsed:.1f}s"))
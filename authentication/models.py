@@ -3,6 +3,7 @@ from django.contrib.auth.base_user import BaseUserManager
 from django.core.validators import RegexValidator
 from django.contrib.auth.models import AbstractUser
 from authentication.constants import AdditionalPhoneNumberCts, RegexCts, TokenCts
+from authentication.utils.phone import normalize_phone_number
 from django.utils.timezone import now
 
 from django.contrib.auth.base_user import BaseUserManager
@@ -11,32 +12,87 @@ from django.contrib.auth.validators import UnicodeUsernameValidator
 
 
 # Create your models here.
+class PhoneNumberHash(models.Func):
+    """
+    Hex sha256 of a phone number, as sent by the clients to the contact discovery.
+    Uses the builtin sha256 of postgres (no pgcrypto), which can be indexed
+    """
+    template = "ENCODE(SHA256(%(expressions)s::bytea), 'hex')"
+    output_field = models.CharField()
+
+
+def set_normalized_phone_number(instance, save_kwargs):
+    #canonicalization on write, kept in sync when only some fields are saved
+    instance.normalized_phone_number = normalize_phone_number(instance.phone_number)
+    update_fields = save_kwargs.get("update_fields")
+    if update_fields is not None and "phone_number" in update_fields:
+        save_kwargs["update_fields"] = {*update_fields, "normalized_phone_number"}
+
+
 phone_validator = RegexValidator(
     regex=RegexCts.PHONE_REGEX, message="Invalid phone number"
 )
 
 
 
+class CustomUserQuerySet(models.QuerySet):
+
+    def update(self, **kwargs):
+        #no post_save signal here, the cached users of the updated rows (see CachedJWTAuthentication)
+        #are dropped so that a soft deleted or deactivated user is not authenticated until the cache expires
+        from authentication.authentication import invalidate_cached_users
+
+        user_ids = list(self.values_list("pk", flat=True))
+        updated = super().update(**kwargs)
+        invalidate_cached_users(user_ids)
+        return updated
+
+    update.alters_data = True
+
+
 class CustomUserManager(BaseUserManager):
 
+    def get_queryset(self):
+        return CustomUserQuerySet(self.model, using=self._db)
+
     # with phone number
-    def _create_user(self, phone_number, password, **extra_fields):
+    def _create_user(self, phone_number, password, password_hash=None, **extra_fields):
+        user = self._build_user(phone_number, password, password_hash, **extra_fields)
+        user.save(using=self._db)
+        return user
+
+    def _build_user(self, phone_number, password, password_hash=None, **extra_fields):
         if not phone_number:
             raise ValueError("The given phone number must be set")
-        phone_number = self.normalize_email(phone_number)
+        phone_number = normalize_phone_number(phone_number)
         user = self.model(phone_number=phone_number, **extra_fields)
-        user.set_password(password)
-        user.save(using=self._db)
+        #the password may have been hashed beforehand (e.g. off the event loop)
+        if password_hash is None:
+            user.set_password(password)
+        else:
+            user.password = password_hash
         return user
 
-    def create_user(self, phone_number, password=None, **extra_fields):
+    def create_user(self, phone_number, password=None, password_hash=None, **extra_fields):
         extra_fields.setdefault("is_staff", False)
         extra_fields.setdefault("is_superuser", False)
-        return self._create_user(phone_number, password, **extra_fields)
+        return self._create_user(phone_number, password, password_hash, **extra_fields)
+
+    async def acreate_user(self, phone_number, password_hash, **extra_fields):
+        """
+        Async version of create_user, the password must be hashed beforehand (see authentication.utils.hashing)
+        """
+        extra_fields.setdefault("is_staff", False)
+        extra_fields.setdefault("is_superuser", False)
+        user = self._build_user(phone_number, None, password_hash, **extra_fields)
+        await user.asave(using=self._db)
+        return user
 
     def create_superuser(self, phone_number, password, **extra_fields):
         extra_fields.setdefault("is_staff", True)
         extra_fields.setdefault("is_superuser", True)
+        #created from the command line, there is no otp to verify the phone number
+        extra_fields.setdefault("phone_is_verified", True)
 
         if extra_fields.get("is_staff") is not True:
             raise ValueError("Superuser must have is_staff=True.")
@@ -63,6 +119,15 @@ class CustomUser(AbstractUser):
         validators=[phone_validator],
     )
 
+    #canonical form of phone_number (see normalize_phone_number), all the lookups go through it
+    normalized_phone_number = models.CharField(
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        max_length=16,
+    )
+
     username = models.CharField(
         _("username"),
         max_length=150,
@@ -91,6 +156,16 @@ class CustomUser(AbstractUser):
 
     USERNAME_FIELD = "phone_number"
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            #contact discovery by hashed phone numbers
+            models.Index(PhoneNumberHash("normalized_phone_number"), name="customuser_phone_hash_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        set_normalized_phone_number(self, kwargs)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.last_name} {self.first_name} ({self.phone_number})"
     
@@ -104,11 +179,28 @@ class AdditionalPhoneNumber(models.Model):
         validators=[phone_validator],
     )
     
+    #indexed for the verified numbers only, see authentication.indexes
+    normalized_phone_number = models.CharField(
+        null=True,
+        blank=True,
+        editable=False,
+        max_length=16,
+    )
+    
     type = models.CharField(max_length=120, blank=False, null=False, choices=AdditionalPhoneNumberCts.PHONE_NUMBER_TYPE_CHOICES, default=AdditionalPhoneNumberCts.NORMAL)
     
     is_verified = models.BooleanField(default=False)
     
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="additional_phone_numbers")
+
+    class Meta:
+        indexes = [
+            models.Index(PhoneNumberHash("normalized_phone_number"), name="additionalphone_hash_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        set_normalized_phone_number(self, kwargs)
+        super().save(*args, **kwargs)
     
     
     
@@ -116,7 +208,7 @@ class OTPToken(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     kind = models.CharField(max_length=50, choices=TokenCts.TOKEN_TYPES)
     token = models.CharField(max_length=120)
-    token_epires_at = models.DateTimeField(default=now)
+    token_epires_at = models.DateTimeField(default=now, db_index=True)
     extra_data = models.JSONField(blank=True, null=True)
 
     class Meta:
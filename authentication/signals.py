@@ -0,0 +1,13 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from authentication.authentication import invalidate_cached_user
+
+
+User = get_user_model()
+
+
+@receiver([post_save, post_delete], sender=User)
+def drop_cached_user(sender, instance, **kwargs):
+    #the next authenticated request loads the user from the db again
+    invalidate_cached_user(instance.pk)
@@ -0,0 +1,44 @@
+import logging
+from celery import shared_task
+from django.conf import settings
+from authentication.utils.otp_delivery import OTPDeliveryError, OTPMessage, deliver, flush
+from authentication.utils.purge import purge_expired_otps, purge_expired_tokens, purge_unverified_users
+
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def purge_stale_auth_data():
+    """
+    Periodic task (see CELERY_BEAT_SCHEDULE) deleting the expired otps and jwt tokens and the abandoned signups
+    """
+    otps = purge_expired_otps()
+    tokens = purge_expired_tokens()
+    users = purge_unverified_users()
+    logger.info(f"Purged {otps} expired otps, {tokens} expired tokens and {users} unverified users")
+
+
+@shared_task(
+    autoretry_for=(OTPDeliveryError,),
+    retry_backoff=True,
+    max_retries=settings.OTP_DELIVERY_MAX_RETRIES,
+    ignore_result=True,
+)
+def deliver_otps(provider, messages):
+    """
+    Send a batch of otp messages through a provider, retried with backoff when the provider fails.
+    Each batch has its own task (see otp_delivery.flush), so a retry never sends the other batches again
+    """
+    deliver(provider, [OTPMessage(**message) for message in messages])
+
+
+@shared_task(ignore_result=True)
+def flush_otp_deliveries():
+    """
+    Periodic task (see CELERY_BEAT_SCHEDULE) sending the otp messages buffered by the requests, for every provider
+    """
+    for provider in settings.OTP_DELIVERY_GATEWAYS:
+        count = flush(provider)
+        if count:
+            logger.info(f"Queued {count} {provider} otp messages")
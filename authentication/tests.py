@@ -1,3 +1,1083 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import time
+from dataclasses import asdict
+from datetime import timedelta
+from types import SimpleNamespace
+from typing import Optional
+from unittest import mock, skipUnless
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import Encoding, NoEncryption, PrivateFormat, PublicFormat
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import Q, QuerySet
+from django.db.models.signals import post_migrate
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from authentication.api.serializers import UserSerializer
+from authentication.checks import check_otp_delivery_cache, check_throttle_cache
+from authentication.constants import TokenCts
+from authentication.indexes import create_indexes
+from authentication.models import AdditionalPhoneNumber, CustomUser, OTPToken, PhoneNumberHash
+from authentication.tasks import deliver_otps
+from authentication.throttling import IPThrottle
+from authentication.utils.hashing import HashingPoolSaturated, _get_pending_slots, acheck_password, amake_password
+from authentication.utils.jwt_token import AccessToken, get_tokens_for_user
+from authentication.utils.normalization import backfill_normalized_phone_numbers, has_missing_normalized_phone_numbers
+from authentication.utils import otp_delivery
+from authentication.utils.otp_delivery import (
+    SLOT_WRITE_TIMEOUT, FakeOTPGateway, OTPDeliveryError, buffer_messages, flush, get_gateway, is_buffered, queue_otp_delivery,
+)
+from authentication.utils.otp_store import CacheOTPStore, DatabaseOTPStore, OTPStore
+from authentication.utils.phone import phone_number_q
+from authentication.utils.purge import purge_expired_otps, purge_unverified_users
+from authentication.utils.revocation import RevocationList
+from authentication.utils.token_backend import CachedTokenBackend
+from common.config import config
+from common.key_manager import KeyManager
+from common.models import KeyGeneration
+from common.utils.cache import incr_with_ttl
 
-# Create your tests here.
+
+#max number of queries of each AuthViewSet endpoint, savepoints and periodic queries (see below) excluded
+QUERY_BUDGETS = {
+    #existing verified user check, unfinished signup lookup, user insert, otps upsert
+    "signup": 4,
+    #user lookup, otps lookup, user update, otps delete, refresh token record
+    "phone_verification": 5,
+    #user lookup, security otp lookup, otp upsert
+    "resend_phone_verification": 3,
+    #user lookup, refresh token record
+    "login": 2,
+    #user lookup (JWT authentication), on a cache miss
+    "user": 1,
+    #cached or stateless user
+    "user_cached": 0,
+}
+
+#queries run by a worker at most once per interval, on top of the endpoint ones. The budget tests run
+#each request right when they are due (the worst case) and count them on their own
+PERIODIC_QUERY_BUDGETS = {
+    #KeyManager generation check, every KEY_MANAGER_REFRESH_INTERVAL seconds
+    KeyGeneration._meta.db_table: 1,
+    #revocation list sync, every JWT_REVOCATION_SYNC_INTERVAL seconds
+    BlacklistedToken._meta.db_table: 1,
+}
+
+PHONE_NUMBER = "+237600000001"
+PASSWORD = "secret-password"
+
+
+def _is_savepoint(sql:str) -> bool:
+    return "SAVEPOINT" in sql.upper()
+
+
+def _periodic_query_table(sql:str) -> Optional[str]:
+    for table in PERIODIC_QUERY_BUDGETS:
+        if f'FROM "{table}"' in sql:
+            return table
+    return None
+
+
+def _make_periodic_queries_due():
+    #the warm up run by the first request of the process is not part of the budgets
+    KeyManager.warm_up_once()
+    #as if the refresh intervals had just elapsed
+    KeyManager._generation_checked_at = float("-inf")
+    RevocationList._synced_at = None
+
+
+@override_settings(
+    #fast hashing, the budgets are about queries
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+)
+class AuthViewSetQueryBudgetTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        #throttle counters
+        cache.clear()
+        #the config keys are read from the KeyManager cache
+        config.preload()
+        #the revoked tokens are checked in memory
+        RevocationList.sync()
+
+    def assertQueryBudget(self, endpoint, request):
+        _make_periodic_queries_due()
+        with CaptureQueriesContext(connection) as context:
+            response = request()
+
+        queries = [query["sql"] for query in context.captured_queries if not _is_savepoint(query["sql"])]
+        for table, budget in PERIODIC_QUERY_BUDGETS.items():
+            periodic = [sql for sql in queries if _periodic_query_table(sql) == table]
+            self.assertLessEqual(len(periodic), budget, msg=f"{endpoint} ran {len(periodic)} queries on {table}:\n" + "\n".join(periodic))
+
+        queries = [sql for sql in queries if _periodic_query_table(sql) is None]
+        self.assertLessEqual(
+            len(queries),
+            QUERY_BUDGETS[endpoint],
+            msg=f"{endpoint} ran {len(queries)} queries (budget {QUERY_BUDGETS[endpoint]}):\n" + "\n".join(queries),
+        )
+        return response
+
+    def _signup(self):
+        response = self.client.post(
+            reverse("auth-signup"),
+            {"phone_number": PHONE_NUMBER, "password": PASSWORD},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def _create_verified_user(self):
+        return CustomUser.objects.create_user(
+            phone_number=PHONE_NUMBER,
+            password=PASSWORD,
+            phone_is_verified=True,
+        )
+
+    def test_signup(self):
+        response = self.assertQueryBudget("signup", lambda: self.client.post(
+            reverse("auth-signup"),
+            {"phone_number": PHONE_NUMBER, "password": PASSWORD},
+            format="json",
+        ))
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(OTPToken.objects.filter(user_id=response.data["user_id"]).count(), 2)
+
+    def test_signup_again_before_verification(self):
+        self._signup()
+
+        response = self.assertQueryBudget("signup", lambda: self.client.post(
+            reverse("auth-signup"),
+            {"phone_number": PHONE_NUMBER, "password": PASSWORD},
+            format="json",
+        ))
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(CustomUser.objects.filter(phone_number=PHONE_NUMBER).count(), 1)
+
+    def test_phone_verification(self):
+        signup = self._signup()
+        otp = OTPToken.objects.get(user_id=signup["user_id"], kind=TokenCts.PHONE_NUMBER_TOKEN)
+
+        response = self.assertQueryBudget("phone_verification", lambda: self.client.post(
+            reverse("auth-phone_verification"),
+            {"user": signup["user_id"], "otp": otp.token, "security_token": signup["security_token"]},
+            format="json",
+        ))
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertTrue(response.data["user"]["phone_is_verified"])
+        self.assertFalse(OTPToken.objects.filter(user_id=signup["user_id"]).exists())
+
+    def test_resend_phone_verification(self):
+        signup = self._signup()
+
+        response = self.assertQueryBudget("resend_phone_verification", lambda: self.client.post(
+            reverse("auth-resend_phone_verification"),
+            {"user": signup["user_id"], "security_token": signup["security_token"]},
+            format="json",
+        ))
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(OTPToken.objects.filter(user_id=signup["user_id"]).count(), 2)
+
+    def test_login(self):
+        self._create_verified_user()
+
+        response = self.assertQueryBudget("login", lambda: self.client.post(
+            reverse("auth-login"),
+            {"phone_number": PHONE_NUMBER, "password": PASSWORD},
+            format="json",
+        ))
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertIn("access", response.data["tokens"])
+
+    def test_user(self):
+        user = self._create_verified_user()
+        tokens = get_tokens_for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+
+        response = self.assertQueryBudget("user", lambda: self.client.get(reverse("auth-user")))
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data["id"], user.id)
+
+    def test_user_cached(self):
+        user = self._create_verified_user()
+        tokens = get_tokens_for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.client.get(reverse("auth-user"))
+
+        response = self.assertQueryBudget("user_cached", lambda: self.client.get(reverse("auth-user")))
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data["id"], user.id)
+
+    def test_user_cache_invalidated_on_save(self):
+        user = self._create_verified_user()
+        tokens = get_tokens_for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.client.get(reverse("auth-user"))
+
+        user.first_name = "Updated"
+        user.save()
+        response = self.client.get(reverse("auth-user"))
+
+        self.assertEqual(response.data["first_name"], "Updated")
+
+    def test_user_cache_invalidated_on_bulk_updates(self):
+        user = self._create_verified_user()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {get_tokens_for_user(user)['access']}")
+        self.assertEqual(self.client.get(reverse("auth-user")).status_code, 200)
+
+        #QuerySet.update() sends no post_save
+        CustomUser.objects.filter(pk=user.pk).update(is_active=False)
+        self.assertEqual(self.client.get(reverse("auth-user")).status_code, 401)
+
+        CustomUser.all_objects.filter(pk=user.pk).update(is_active=True, is_deleted=True)
+        self.assertEqual(self.client.get(reverse("auth-user")).status_code, 401)
+
+    def test_user_soft_deleted_by_the_backfill_not_authenticated(self):
+        user = self._create_verified_user()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {get_tokens_for_user(user)['access']}")
+        self.assertEqual(self.client.get(reverse("auth-user")).status_code, 200)
+        #saved before normalized_phone_number existed, and a more recent account has the same number
+        CustomUser.all_objects.filter(pk=user.pk).update(phone_number="237 600 000 001", normalized_phone_number=None)
+        self.assertEqual(self.client.get(reverse("auth-user")).status_code, 200)
+        CustomUser.objects.create_user(phone_number=PHONE_NUMBER, password=PASSWORD, phone_is_verified=True, last_login=timezone.now())
+
+        backfill_normalized_phone_numbers()
+
+        self.assertTrue(CustomUser.all_objects.get(pk=user.pk).is_deleted)
+        self.assertEqual(self.client.get(reverse("auth-user")).status_code, 401)
+
+    @override_settings(JWT_STATELESS_AUTH=True)
+    def test_user_stateless(self):
+        user = self._create_verified_user()
+        tokens = get_tokens_for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+
+        response = self.assertQueryBudget("user_cached", lambda: self.client.get(reverse("auth-user")))
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data, UserSerializer(user).data)
+
+    def test_no_user_claims_without_the_stateless_mode(self):
+        user = self._create_verified_user()
+
+        access = AccessToken(get_tokens_for_user(user)["access"])
+
+        self.assertNotIn("phone_number", access.payload)
+        self.assertEqual(access["user_id"], user.id)
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    JWT_REVOCATION_SYNC_INTERVAL=60*60,
+)
+class TokenRevocationTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        RevocationList.sync()
+        self.user = CustomUser.objects.create_user(
+            phone_number=PHONE_NUMBER,
+            password=PASSWORD,
+            phone_is_verified=True,
+        )
+        self.tokens = get_tokens_for_user(self.user)
+
+    def _authenticate(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def test_refresh_rotates_the_tokens(self):
+        response = self.client.post(reverse("auth-refresh"), {"refresh": self.tokens["refresh"]}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+
+        self._authenticate(response.data["access"])
+        self.assertEqual(self.client.get(reverse("auth-user")).status_code, 200)
+
+        #the previous refresh token and its access token are revoked
+        response = self.client.post(reverse("auth-refresh"), {"refresh": self.tokens["refresh"]}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self._authenticate(self.tokens["access"])
+        self.assertEqual(self.client.get(reverse("auth-user")).status_code, 401)
+
+    def test_logout_revokes_the_tokens(self):
+        self._authenticate(self.tokens["access"])
+
+        response = self.client.post(reverse("auth-logout"), {"refresh": self.tokens["refresh"]}, format="json")
+        self.assertEqual(response.status_code, 204)
+
+        self.assertEqual(self.client.get(reverse("auth-user")).status_code, 401)
+        response = self.client.post(reverse("auth-refresh"), {"refresh": self.tokens["refresh"]}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_logout_with_the_refresh_token_of_another_user(self):
+        other_user = CustomUser.objects.create_user(phone_number="+237600000002", password=PASSWORD)
+        self._authenticate(self.tokens["access"])
+
+        response = self.client.post(
+            reverse("auth-logout"),
+            {"refresh": get_tokens_for_user(other_user)["refresh"]},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_revocation_synced_from_db(self):
+        #revoked by another worker: only in db until the next sync
+        RevocationList.revoke(AccessToken(self.tokens["access"]))
+        with RevocationList._lock:
+            RevocationList._revoked.clear()
+
+        RevocationList.sync(full=False)
+
+        self._authenticate(self.tokens["access"])
+        self.assertEqual(self.client.get(reverse("auth-user")).status_code, 401)
+
+
+class CachedTokenBackendTest(TestCase):
+
+    def setUp(self):
+        self.backend = CachedTokenBackend("HS256", "secret-signing-key", cache_size=2)
+
+    def _encode(self, jti, lifetime=60):
+        return self.backend.encode({"jti": jti, "exp": int(time.time()) + lifetime})
+
+    def test_verified_payload_is_cached(self):
+        token = self._encode("a")
+
+        self.assertEqual(self.backend.decode(token), self.backend.decode(token))
+        self.assertEqual(len(self.backend._cache), 1)
+
+    def test_tampered_token_is_verified(self):
+        token = self._encode("a")
+        self.backend.decode(token)
+
+        with self.assertRaises(TokenBackendError):
+            self.backend.decode(token[:-2] + ("AA" if not token.endswith("AA") else "BB"))
+
+    def test_least_recently_used_token_is_evicted(self):
+        tokens = [self._encode(jti) for jti in "abc"]
+        for token in tokens:
+            self.backend.decode(token)
+
+        self.assertEqual(len(self.backend._cache), 2)
+
+    def test_expired_token_is_not_served_from_the_cache(self):
+        token = self._encode("a", lifetime=1)
+        self.backend.decode(token)
+        time.sleep(2)
+
+        with self.assertRaises(TokenBackendError):
+            self.backend.decode(token)
+
+    def test_verifier_with_the_public_key_only(self):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        private_pem = private_key.private_bytes(Encoding.PEM, PrivateFormat.PKCS8, NoEncryption()).decode()
+        public_pem = private_key.public_key().public_bytes(Encoding.PEM, PublicFormat.SubjectPublicKeyInfo).decode()
+        signer = CachedTokenBackend("RS256", private_pem, public_pem)
+        token = signer.encode({"jti": "a", "exp": int(time.time()) + 60})
+
+        verifier = CachedTokenBackend("RS256", "", public_pem, cache_size=2)
+
+        self.assertEqual(verifier.decode(token)["jti"], "a")
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class ContactDiscoveryTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        RevocationList.sync()
+        self.user = CustomUser.objects.create_user(phone_number=PHONE_NUMBER, password=PASSWORD, phone_is_verified=True)
+        self.contact = CustomUser.objects.create_user(phone_number="+237600000002", password=PASSWORD, phone_is_verified=True)
+        AdditionalPhoneNumber.objects.create(user=self.contact, phone_number="+237600000003", is_verified=True)
+        #not verified, not discoverable
+        CustomUser.objects.create_user(phone_number="+237600000004", password=PASSWORD)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {get_tokens_for_user(self.user)['access']}")
+
+    def _discover(self, data):
+        response = self.client.post(reverse("contacts-discover"), data, format="json")
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b"".join(response.streaming_content))["matches"]
+
+    def test_discover_phone_numbers(self):
+        matches = self._discover({"phone_numbers": ["+237600000002", "+237600000003", "+237600000004", "+237699999999"]})
+
+        self.assertEqual(matches, [
+            {"phone_number": "+237600000002", "user_id": self.contact.id},
+            {"phone_number": "+237600000003", "user_id": self.contact.id},
+        ])
+
+    def test_discover_hashes(self):
+        hashes = [hashlib.sha256(phone_number.encode()).hexdigest() for phone_number in ["+237600000003", "+237600000004"]]
+
+        matches = self._discover({"hashes": hashes})
+
+        self.assertEqual(matches, [{"hash": hashes[0], "user_id": self.contact.id}])
+
+    def test_discover_by_chunks(self):
+        phone_numbers = [f"+2376{i:08d}" for i in range(settings.CONTACT_DISCOVERY_MAX_NUMBERS)]
+        chunks = -(-len(phone_numbers) // settings.CONTACT_DISCOVERY_CHUNK_SIZE)
+
+        _make_periodic_queries_due()
+        with CaptureQueriesContext(connection) as context:
+            matches = self._discover({"phone_numbers": phone_numbers})
+
+        #one query per chunk, plus the user lookup of the authentication, the periodic ones apart
+        queries = [query["sql"] for query in context.captured_queries if _periodic_query_table(query["sql"]) is None]
+        self.assertEqual(len(queries), chunks + 1, msg="\n".join(queries))
+        self.assertLessEqual(len(context.captured_queries) - len(queries), sum(PERIODIC_QUERY_BUDGETS.values()))
+
+        #the user, the contact and its additional number
+        self.assertEqual(len(matches), 3)
+
+    def test_too_many_phone_numbers(self):
+        phone_numbers = [f"+2376{i:08d}" for i in range(settings.CONTACT_DISCOVERY_MAX_NUMBERS + 1)]
+
+        response = self.client.post(reverse("contacts-discover"), {"phone_numbers": phone_numbers}, format="json")
+
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class PhoneNumberNormalizationTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def test_phone_number_stored_in_e164(self):
+        user = CustomUser.objects.create_user(phone_number="237 600 000 001", password=PASSWORD)
+
+        self.assertEqual(user.phone_number, PHONE_NUMBER)
+        self.assertEqual(user.normalized_phone_number, PHONE_NUMBER)
+
+    def test_login_whatever_the_format(self):
+        CustomUser.objects.create_user(phone_number=PHONE_NUMBER, password=PASSWORD, phone_is_verified=True)
+
+        response = self.client.post(
+            reverse("auth-login"),
+            {"phone_number": "237 6000 00001", "password": PASSWORD},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_signup_with_a_registered_number_in_another_format(self):
+        CustomUser.objects.create_user(phone_number=PHONE_NUMBER, password=PASSWORD, phone_is_verified=True)
+
+        response = self.client.post(
+            reverse("auth-signup"),
+            {"phone_number": "237600000001", "password": PASSWORD},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("phone_number", response.data)
+
+    def _legacy_user(self, phone_number, **fields):
+        #saved before normalized_phone_number existed, in any format
+        placeholder = f"+999{CustomUser.all_objects.count()}"
+        user = CustomUser.objects.create_user(phone_number=placeholder, password=PASSWORD, **fields)
+        CustomUser.all_objects.filter(pk=user.pk).update(phone_number=phone_number, normalized_phone_number=None)
+        return user
+
+    def test_login_after_the_backfill(self):
+        self._legacy_user("237 600 000 001", phone_is_verified=True)
+        call_command("backfill_normalized_phone_numbers", stdout=io.StringIO())
+
+        response = self.client.post(
+            reverse("auth-login"),
+            {"phone_number": "237 600 000 001", "password": PASSWORD},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_lookup_is_a_single_index_probe(self):
+        self.assertEqual(phone_number_q("237 600 000 001"), Q(normalized_phone_number=PHONE_NUMBER))
+
+    def test_dry_run_reports_the_conflicts(self):
+        unverified = self._legacy_user("237600000001")
+        verified = self._legacy_user("237 600 000 001", phone_is_verified=True)
+        stdout = io.StringIO()
+
+        call_command("backfill_normalized_phone_numbers", dry_run=True, stdout=stdout)
+
+        self.assertIn(f"User {unverified.pk} (237600000001) deleted, the number is kept by user {verified.pk}", stdout.getvalue())
+        #nothing written
+        self.assertTrue(CustomUser.all_objects.filter(pk=unverified.pk).exists())
+        self.assertEqual(CustomUser.all_objects.filter(normalized_phone_number=None).count(), 2)
+
+    def test_migrate_does_not_backfill(self):
+        legacy = self._legacy_user("237 600 000 001", phone_is_verified=True)
+
+        post_migrate.send(sender=apps.get_app_config("authentication"), app_config=apps.get_app_config("authentication"), using="default")
+
+        self.assertIsNone(CustomUser.all_objects.get(pk=legacy.pk).normalized_phone_number)
+
+    def test_backfill_resolves_the_conflicts(self):
+        unverified = self._legacy_user("237600000001")
+        verified = self._legacy_user("237 600 000 001", phone_is_verified=True, last_login=timezone.now())
+        older = self._legacy_user("+237 600 000 001", phone_is_verified=True)
+
+        report = backfill_normalized_phone_numbers()
+
+        self.assertEqual(report.deleted, [(unverified.pk, "237600000001", verified.pk)])
+        self.assertEqual(report.soft_deleted, [(older.pk, "+237 600 000 001", verified.pk)])
+        self.assertFalse(has_missing_normalized_phone_numbers())
+        self.assertEqual(CustomUser.objects.get(normalized_phone_number=PHONE_NUMBER).pk, verified.pk)
+        self.assertFalse(CustomUser.all_objects.filter(pk=unverified.pk).exists())
+        self.assertTrue(CustomUser.all_objects.get(pk=older.pk).is_deleted)
+
+    def test_backfill_gives_the_number_to_a_verified_user(self):
+        #an unfinished signup already holds the canonical number
+        unverified = CustomUser.objects.create_user(phone_number=PHONE_NUMBER, password=PASSWORD)
+        verified = self._legacy_user("237 600 000 001", phone_is_verified=True)
+
+        backfill_normalized_phone_numbers()
+
+        self.assertEqual(CustomUser.objects.get(normalized_phone_number=PHONE_NUMBER).pk, verified.pk)
+        self.assertFalse(CustomUser.all_objects.filter(pk=unverified.pk).exists())
+
+
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN plans of postgres")
+class QueryPlanTest(TestCase):
+    """
+    The hot query shapes use the indexes designed for them (see authentication.indexes and the models Meta)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        #built by the create_indexes_concurrently command on a real deploy
+        create_indexes(concurrently=False)
+
+    def setUp(self):
+        #the test tables are tiny, a sequential scan would always win otherwise
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        self.user = CustomUser.objects.create_user(phone_number=PHONE_NUMBER, password=PASSWORD)
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, msg=plan)
+
+    def test_login_lookup(self):
+        self.assertUsesIndex(
+            CustomUser.objects.filter(normalized_phone_number=PHONE_NUMBER),
+            "authentication_customuser_normalized_phone_number",
+        )
+
+    def test_unverified_users_purge(self):
+        self.assertUsesIndex(
+            CustomUser.all_objects.filter(phone_is_verified=False, date_joined__lt=timezone.now()),
+            "customuser_unverified_idx",
+        )
+
+    def test_otp_lookup(self):
+        self.assertUsesIndex(
+            OTPToken.objects.filter(user=self.user, kind__in=[TokenCts.PHONE_NUMBER_TOKEN, TokenCts.SIGNUP_SECURITY_TOKEN]),
+            "Index",
+        )
+
+    def test_contact_discovery(self):
+        self.assertUsesIndex(
+            AdditionalPhoneNumber.objects.filter(is_verified=True, normalized_phone_number__in=[PHONE_NUMBER]),
+            "additionalphone_verified_idx",
+        )
+
+    def test_contact_discovery_by_hash(self):
+        self.assertUsesIndex(
+            CustomUser.objects.annotate(value=PhoneNumberHash("normalized_phone_number")).filter(
+                value__in=[hashlib.sha256(PHONE_NUMBER.encode()).hexdigest()],
+            ),
+            "customuser_phone_hash_idx",
+        )
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class PurgeTest(TestCase):
+    """
+    The purge deletes the stale rows only, by batches
+    """
+
+    def _user(self, phone_number:str, verified:bool, days:int) -> CustomUser:
+        user = CustomUser.objects.create_user(phone_number=phone_number, password=PASSWORD, phone_is_verified=verified)
+        CustomUser.all_objects.filter(pk=user.pk).update(date_joined=timezone.now() - timedelta(days=days))
+        return user
+
+    def test_unverified_users(self):
+        stale = [self._user(f"+23760000001{i}", False, 2) for i in range(3)]
+        fresh = self._user("+237600000020", False, 0)
+        verified = self._user("+237600000021", True, 2)
+
+        self.assertEqual(purge_unverified_users(timedelta(days=1), batch_size=2, pause=0), len(stale))
+        self.assertEqual(
+            set(CustomUser.all_objects.values_list("pk", flat=True)),
+            {fresh.pk, verified.pk},
+        )
+
+    def test_staff_accounts_are_kept(self):
+        superuser = CustomUser.objects.create_superuser(phone_number="+237600000010", password=PASSWORD)
+        staff = self._user("+237600000011", False, 2)
+        stale = self._user("+237600000012", False, 2)
+        #an old unverified superuser (created before create_superuser verified the phone number)
+        CustomUser.all_objects.filter(pk=superuser.pk).update(
+            phone_is_verified=False, date_joined=timezone.now() - timedelta(days=2),
+        )
+        CustomUser.all_objects.filter(pk=staff.pk).update(is_staff=True)
+
+        self.assertEqual(purge_unverified_users(timedelta(days=1), batch_size=2, pause=0), 1)
+        self.assertEqual(
+            set(CustomUser.all_objects.values_list("pk", flat=True)),
+            {superuser.pk, staff.pk},
+        )
+        self.assertFalse(CustomUser.all_objects.filter(pk=stale.pk).exists())
+
+    def test_superusers_are_verified(self):
+        superuser = CustomUser.objects.create_superuser(phone_number="+237600000010", password=PASSWORD)
+        self.assertTrue(superuser.phone_is_verified)
+
+    def test_rows_changed_after_the_select_are_kept(self):
+        stale = self._user("+237600000010", False, 2)
+        verifying = self._user("+237600000011", False, 2)
+        values_list = QuerySet.values_list
+        batches = []
+
+        def select(queryset, *fields, **kwargs):
+            if fields != ("pk",) or batches:
+                return values_list(queryset, *fields, **kwargs)
+
+            batches.append(list(values_list(queryset, *fields, **kwargs)))
+            #the user verifies his phone number between the select and the delete of the batch
+            CustomUser.all_objects.filter(pk=verifying.pk).update(phone_is_verified=True)
+            return batches[0]
+
+        with mock.patch.object(QuerySet, "values_list", autospec=True, side_effect=select):
+            deleted = purge_unverified_users(timedelta(days=1), batch_size=2, pause=0)
+
+        self.assertEqual(sorted(batches[0]), sorted([stale.pk, verifying.pk]))
+
+        self.assertEqual(deleted, 1)
+        self.assertTrue(CustomUser.all_objects.filter(pk=verifying.pk).exists())
+        self.assertFalse(CustomUser.all_objects.filter(pk=stale.pk).exists())
+
+    def test_expired_otps(self):
+        user = self._user(PHONE_NUMBER, False, 0)
+        expired = OTPToken.objects.create(
+            user=user, kind=TokenCts.PHONE_NUMBER_TOKEN, token="1234",
+            token_epires_at=timezone.now() - timedelta(seconds=settings.OTP_EXPIRED_RETENTION + 60),
+        )
+        valid = OTPToken.objects.create(
+            user=user, kind=TokenCts.SIGNUP_SECURITY_TOKEN, token="5678",
+            token_epires_at=timezone.now() + timedelta(minutes=5),
+        )
+
+        self.assertEqual(purge_expired_otps(batch_size=1, pause=0), 1)
+        self.assertFalse(OTPToken.objects.filter(pk=expired.pk).exists())
+        self.assertTrue(OTPToken.objects.filter(pk=valid.pk).exists())
+
+
+class OTPStoreTestMixin:
+    """
+    Behaviour shared by the otp stores
+    """
+    store: OTPStore
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(phone_number=PHONE_NUMBER, password=PASSWORD)
+
+    def _otp_token(self, kind, token, extra_data=None):
+        return OTPToken(
+            user=self.user, kind=kind, token=token,
+            token_epires_at=timezone.now() + timedelta(minutes=5), extra_data=extra_data,
+        )
+
+    def test_put_and_get_many(self):
+        self.store.put(self._otp_token(TokenCts.PHONE_NUMBER_TOKEN, "1111"), self._otp_token(TokenCts.SIGNUP_SECURITY_TOKEN, "2222"))
+
+        otp_tokens = self.store.get_many(TokenCts.TOKEN_TYPES_AS_LIST, self.user)
+
+        self.assertEqual({kind: otp_token.token for kind, otp_token in otp_tokens.items()}, {
+            TokenCts.PHONE_NUMBER_TOKEN: "1111",
+            TokenCts.SIGNUP_SECURITY_TOKEN: "2222",
+        })
+
+    def test_put_replaces(self):
+        self.store.put(self._otp_token(TokenCts.PHONE_NUMBER_TOKEN, "1111", {"attempt": 1}))
+        self.store.put(self._otp_token(TokenCts.PHONE_NUMBER_TOKEN, "2222", {"attempt": 2}))
+
+        otp_token = self.store.get(TokenCts.PHONE_NUMBER_TOKEN, self.user)
+        self.assertEqual((otp_token.token, otp_token.extra_data), ("2222", {"attempt": 2}))
+
+    def test_put_keeps_the_extra_data(self):
+        self.store.put(self._otp_token(TokenCts.PHONE_NUMBER_TOKEN, "1111", {"attempt": 1}))
+        self.store.put(self._otp_token(TokenCts.PHONE_NUMBER_TOKEN, "2222", {"attempt": 2}), keep_extra_data=True)
+
+        otp_token = self.store.get(TokenCts.PHONE_NUMBER_TOKEN, self.user)
+        self.assertEqual((otp_token.token, otp_token.extra_data), ("2222", {"attempt": 1}))
+
+    def test_delete_many(self):
+        self.store.put(self._otp_token(TokenCts.PHONE_NUMBER_TOKEN, "1111"), self._otp_token(TokenCts.SIGNUP_SECURITY_TOKEN, "2222"))
+
+        self.store.delete_many([TokenCts.PHONE_NUMBER_TOKEN], self.user)
+
+        self.assertEqual(list(self.store.get_many(TokenCts.TOKEN_TYPES_AS_LIST, self.user)), [TokenCts.SIGNUP_SECURITY_TOKEN])
+
+    async def test_async_versions(self):
+        await self.store.aput(self._otp_token(TokenCts.PHONE_NUMBER_TOKEN, "1111"))
+        self.assertEqual((await self.store.aget(TokenCts.PHONE_NUMBER_TOKEN, self.user)).token, "1111")
+
+        await self.store.adelete(TokenCts.PHONE_NUMBER_TOKEN, self.user)
+        self.assertIsNone(await self.store.aget(TokenCts.PHONE_NUMBER_TOKEN, self.user))
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class DatabaseOTPStoreTest(OTPStoreTestMixin, TestCase):
+    store = DatabaseOTPStore()
+
+    def test_upsert_single_query(self):
+        self.store.put(self._otp_token(TokenCts.PHONE_NUMBER_TOKEN, "1111"))
+
+        #INSERT ... ON CONFLICT DO UPDATE, for new and existing tokens at once
+        with self.assertNumQueries(1):
+            self.store.put(self._otp_token(TokenCts.PHONE_NUMBER_TOKEN, "2222"), self._otp_token(TokenCts.SIGNUP_SECURITY_TOKEN, "3333"))
+
+        self.assertEqual(OTPToken.objects.filter(user=self.user).count(), 2)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class CacheOTPStoreTest(OTPStoreTestMixin, TestCase):
+    store = CacheOTPStore()
+
+    def test_no_query(self):
+        with self.assertNumQueries(0):
+            self.store.put(self._otp_token(TokenCts.PHONE_NUMBER_TOKEN, "1111"))
+            self.store.get(TokenCts.PHONE_NUMBER_TOKEN, self.user)
+
+    @override_settings(OTP_EXPIRED_RETENTION=0)
+    def test_expired_token_dropped(self):
+        otp_token = self._otp_token(TokenCts.PHONE_NUMBER_TOKEN, "1111")
+        otp_token.token_epires_at = timezone.now() - timedelta(seconds=1)
+        self.store.put(otp_token)
+
+        self.assertIsNone(self.store.get(TokenCts.PHONE_NUMBER_TOKEN, self.user))
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class HashingPoolTest(TestCase):
+
+    def setUp(self):
+        _get_pending_slots.cache_clear()
+
+    def tearDown(self):
+        _get_pending_slots.cache_clear()
+
+    async def test_make_and_check_password(self):
+        user = CustomUser(password=await amake_password(PASSWORD))
+
+        self.assertTrue(await acheck_password(user, PASSWORD))
+        self.assertFalse(await acheck_password(user, "wrong-password"))
+
+    @override_settings(PASSWORD_HASHING_MAX_PENDING=1)
+    async def test_saturated_pool_rejects(self):
+        pending_slots = _get_pending_slots()
+        #a hashing operation is already pending
+        pending_slots.acquire()
+        try:
+            with self.assertRaises(HashingPoolSaturated):
+                await amake_password(PASSWORD)
+        finally:
+            pending_slots.release()
+
+        self.assertTrue(await amake_password(PASSWORD))
+
+
+@override_settings(OTP_DELIVERY_BUFFERED=True, OTP_DELIVERY_BATCH_SIZE=2)
+class OTPDeliveryTest(TestCase):
+    """
+    The otp messages of the requests are buffered and sent together, by batches
+    """
+
+    def setUp(self):
+        cache.clear()
+        FakeOTPGateway.outbox.clear()
+
+    def _message(self, i):
+        return {"phone_number": f"+23760000000{i}", "code": str(i), "kind": TokenCts.PHONE_NUMBER_TOKEN}
+
+    def test_messages_of_several_requests_sent_by_batches(self):
+        for i in range(3):
+            buffer_messages("sms", [self._message(i)])
+        self.assertEqual(FakeOTPGateway.outbox, [])
+
+        with mock.patch.object(deliver_otps, "delay") as delay:
+            self.assertEqual(flush("sms"), 3)
+
+        self.assertEqual(
+            [call.args for call in delay.call_args_list],
+            [("sms", [self._message(0), self._message(1)]), ("sms", [self._message(2)])],
+        )
+
+    def test_messages_sent_once(self):
+        buffer_messages("sms", [self._message(0)])
+
+        self.assertEqual(flush("sms"), 1)
+        self.assertEqual(flush("sms"), 0)
+        self.assertEqual([message.code for message in FakeOTPGateway.outbox], ["0"])
+
+    def test_lost_slot_skipped_after_a_while(self):
+        buffer_messages("sms", [self._message(0)])
+        #a writer died between taking its slot and writing it
+        cache.incr("otp_outbox:sms:head")
+        buffer_messages("sms", [self._message(2)])
+
+        self.assertEqual(flush("sms"), 1)
+        #the slot may still be on its way
+        self.assertEqual(flush("sms"), 0)
+        with mock.patch("time.time", return_value=time.time() + SLOT_WRITE_TIMEOUT):
+            self.assertEqual(flush("sms"), 1)
+        self.assertEqual([message.code for message in FakeOTPGateway.outbox], ["0", "2"])
+
+    def test_flush_overlapping_another_one(self):
+        _flush = otp_delivery._flush
+        overlapping = []
+
+        def first_flush(cache_, provider):
+            if not overlapping:
+                #a request buffers its messages while the flush is running, its own flush can't take the lock
+                buffer_messages("sms", [self._message(1)])
+                overlapping.append(flush("sms"))
+            return _flush(cache_, provider)
+
+        buffer_messages("sms", [self._message(0)])
+        with mock.patch.object(otp_delivery, "_flush", side_effect=first_flush):
+            self.assertEqual(flush("sms"), 2)
+
+        #the running flush sent its messages before leaving
+        self.assertEqual(overlapping, [0])
+        self.assertEqual([message.code for message in FakeOTPGateway.outbox], ["0", "1"])
+
+    def test_not_buffered_in_a_per_process_cache(self):
+        #the tests use the memory cache, the flush_otp_deliveries task of the celery workers would not see it
+        self.assertFalse(is_buffered())
+        self.assertEqual(
+            [message.id for message in check_otp_delivery_cache(None)],
+            ["authentication.W001"],
+        )
+
+        user = CustomUser.objects.create_user(phone_number=PHONE_NUMBER, password=PASSWORD)
+        otp_token = OTPToken(user=user, kind=TokenCts.PHONE_NUMBER_TOKEN, token="1234")
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_otp_delivery(otp_token)
+
+        self.assertEqual([message.code for message in FakeOTPGateway.outbox], ["1234"])
+        self.assertIsNone(cache.get("otp_outbox:sms:head"))
+
+    def test_buffered_in_a_shared_cache(self):
+        user = CustomUser.objects.create_user(phone_number=PHONE_NUMBER, password=PASSWORD)
+        otp_token = OTPToken(user=user, kind=TokenCts.PHONE_NUMBER_TOKEN, token="1234")
+        with mock.patch.object(otp_delivery, "is_shared_cache", return_value=True):
+            with self.captureOnCommitCallbacks(execute=True):
+                queue_otp_delivery(otp_token)
+
+        self.assertEqual(FakeOTPGateway.outbox, [])
+        self.assertEqual(flush("sms"), 1)
+        self.assertEqual([message.code for message in FakeOTPGateway.outbox], ["1234"])
+
+    def test_failed_batch_retried_alone(self):
+        gateway = get_gateway("sms")
+        sent = []
+
+        def send_many(messages):
+            #the provider fails the first time it gets the second batch
+            if messages[0]["code"] == "2" and not any(batch[0]["code"] == "2" for batch in sent):
+                sent.append(messages)
+                raise OTPDeliveryError()
+            sent.append(messages)
+
+        for i in range(3):
+            buffer_messages("sms", [self._message(i)])
+
+        with mock.patch.object(gateway, "send_many", side_effect=lambda messages: send_many([asdict(m) for m in messages])):
+            flush("sms")
+
+        self.assertEqual(
+            [[message["code"] for message in batch] for batch in sent],
+            [["0", "1"], ["2"], ["2"]],
+        )
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    PASSWORD_HASHING_EXECUTOR="thread",
+)
+class AsyncAuthViewsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        FakeOTPGateway.outbox.clear()
+
+    async def _post(self, name, data):
+        return await self.async_client.post(reverse(name), data, content_type="application/json")
+
+    async def _signup(self):
+        response = await self._post("async_auth-signup", {"phone_number": PHONE_NUMBER, "password": PASSWORD})
+        self.assertEqual(response.status_code, 201, response.json())
+        return response.json()
+
+    async def test_signup_and_phone_verification(self):
+        signup = await self._signup()
+        otp = FakeOTPGateway.outbox[-1].code
+
+        response = await self._post("async_auth-phone_verification", {
+            "user": signup["user_id"], "otp": otp, "security_token": signup["security_token"],
+        })
+
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertTrue(response.json()["user"]["phone_is_verified"])
+        self.assertFalse(await OTPToken.objects.filter(user_id=signup["user_id"]).aexists())
+
+    async def test_signup_rolled_back_when_the_otps_write_fails(self):
+        with mock.patch("authentication.api.serializers.generate_and_save_otps_for", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                await self._post("async_auth-signup", {"phone_number": PHONE_NUMBER, "password": PASSWORD})
+
+        self.assertFalse(await CustomUser.all_objects.filter(phone_number=PHONE_NUMBER).aexists())
+        self.assertEqual(FakeOTPGateway.outbox, [])
+
+    async def test_phone_verification_rolled_back_when_the_otps_deletion_fails(self):
+        signup = await self._signup()
+        otp = FakeOTPGateway.outbox[-1].code
+
+        with mock.patch("authentication.api.serializers.clear_many_otps", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                await self._post("async_auth-phone_verification", {
+                    "user": signup["user_id"], "otp": otp, "security_token": signup["security_token"],
+                })
+
+        self.assertFalse((await CustomUser.objects.aget(pk=signup["user_id"])).phone_is_verified)
+
+    async def test_phone_verification_with_an_invalid_otp(self):
+        signup = await self._signup()
+
+        response = await self._post("async_auth-phone_verification", {
+            "user": signup["user_id"], "otp": "invalid", "security_token": signup["security_token"],
+        })
+
+        self.assertEqual(response.status_code, 400)
+
+    async def test_phone_verification_of_an_unknown_user(self):
+        response = await self._post("async_auth-phone_verification", {"user": 0, "otp": "0", "security_token": "0"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("user", response.json())
+
+    async def test_resend_phone_verification(self):
+        signup = await self._signup()
+
+        response = await self._post("async_auth-resend_phone_verification", {
+            "user": signup["user_id"], "security_token": signup["security_token"],
+        })
+
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertEqual(len(FakeOTPGateway.outbox), 2)
+
+    async def test_login_and_user(self):
+        await CustomUser.objects.acreate_user(
+            phone_number=PHONE_NUMBER,
+            password_hash=make_password(PASSWORD),
+            phone_is_verified=True,
+        )
+        login = await self._post("async_auth-login", {"phone_number": PHONE_NUMBER, "password": PASSWORD})
+        self.assertEqual(login.status_code, 200, login.json())
+
+        response = await self.async_client.get(
+            reverse("async_auth-user"),
+            AUTHORIZATION=f"Bearer {login.json()['tokens']['access']}",
+        )
+
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertEqual(response.json()["phone_number"], PHONE_NUMBER)
+
+    async def test_user_without_token(self):
+        response = await self.async_client.get(reverse("async_auth-user"))
+
+        self.assertEqual(response.status_code, 401)
+
+
+@mock.patch.object(IPThrottle, "THROTTLE_RATES", {"login.ip": "3/min"})
+class SlidingWindowThrottleTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.view = SimpleNamespace(action="login")
+        self.now = 600.0
+
+    def _allow(self, remote_addr="10.0.0.1", **meta):
+        throttle = IPThrottle()
+        throttle.timer = lambda: self.now
+        request = SimpleNamespace(META={"REMOTE_ADDR": remote_addr, **meta}, data={}, user=AnonymousUser())
+        return throttle.allow_request(request, self.view)
+
+    def test_rate(self):
+        self.assertEqual([self._allow() for _ in range(4)], [True, True, True, False])
+        #another client
+        self.assertTrue(self._allow(remote_addr="10.0.0.2"))
+
+    def test_forwarded_for_header_is_not_trusted(self):
+        for i in range(3):
+            self._allow(HTTP_X_FORWARDED_FOR=f"1.1.1.{i}")
+
+        self.assertFalse(self._allow(HTTP_X_FORWARDED_FOR="1.1.1.9"))
+
+    def test_previous_window_is_weighted(self):
+        for _ in range(3):
+            self._allow()
+
+        #half of the previous window still counts: 1.5 + 1
+        self.now += 90
+        self.assertTrue(self._allow())
+        self.assertFalse(self._allow())
+
+    def test_not_shared_cache_reported(self):
+        #the tests use the memory cache, each worker would count on its own
+        self.assertEqual([message.id for message in check_throttle_cache(None)], ["authentication.W002"])
+
+    def test_counter_created_by_the_decrement_expires(self):
+        #the counter expired between the increment and the decrement of a rejected request
+        with mock.patch("time.time", return_value=1000.0):
+            self.assertEqual(incr_with_ttl(cache, "counter", -1, timeout=60), -1)
+            self.assertEqual(incr_with_ttl(cache, "counter", 1, timeout=60), 0)
+
+        with mock.patch("time.time", return_value=1061.0):
+            self.assertIsNone(cache.get("counter"))
+
+    def test_rejected_requests_dont_use_the_quota(self):
+        for _ in range(10):
+            self._allow()
+
+        #the previous window holds the 3 accepted requests only: 1.5 + 1 (5 + 1 if the rejected ones counted)
+        self.now += 90
+        self.assertTrue(self._allow())
@@ -0,0 +1,144 @@
+from asgiref.sync import sync_to_async
+from rest_framework.throttling import SimpleRateThrottle
+from authentication.utils.phone import normalize_phone_number
+from common.utils.cache import incr_with_ttl
+
+
+def _get_data(request, field):
+    #the body may not be an object, the serializer reports it later
+    if not hasattr(request.data, "get"):
+        return None
+    return request.data.get(field)
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    Sliding window rate limit, shared by all the workers through the django cache.
+
+    Each ident has one counter per fixed window, the count of the sliding window being
+    the current counter plus the previous one weighted by its overlap with the sliding window.
+    That's two cache operations per request whatever the rate (incr, get), instead of a list of timestamps.
+    The counter is incremented before the check (atomic, concurrent requests can't all see the same count)
+    and decremented back when the request is rejected, both by incr_with_ttl so that it always expires.
+    The counters are only shared when the default cache is (see check_throttle_cache)
+
+    The rate is looked up in DEFAULT_THROTTLE_RATES under "<view action>.<ident_type>"
+    (e.g. "login.ip"), actions without a rate are not throttled
+    """
+    ident_type = None
+    cache_format = 'throttle_%(scope)s_%(ident)s'
+
+    def __init__(self):
+        #the rate depends on the view action, it is determined in allow_request
+        pass
+
+    def get_request_ident(self, request, view):
+        """
+        Value the requests are counted by, None when the request should not be throttled
+        """
+        raise NotImplementedError('.get_request_ident() must be overridden')
+
+    def get_cache_key(self, request, view):
+        ident = self.get_request_ident(request, view)
+        if ident is None or ident == "":
+            return None
+
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': "".join(str(ident).split()),
+        }
+
+    def allow_request(self, request, view):
+        window_keys = self._get_window_keys(request, view)
+        if window_keys is None:
+            return True
+
+        #counted before the check, so that concurrent requests can't all see the same count
+        current_key, previous_key = window_keys
+        current = self._incr(current_key, 1)
+
+        if self._is_over_limit(current, self.cache.get(previous_key, 0)):
+            #the rejected requests don't use the quota
+            self._incr(current_key, -1)
+            return self.throttle_failure()
+        return True
+
+    async def aallow_request(self, request, view):
+        """
+        Async version of allow_request, for the async views
+        """
+        window_keys = self._get_window_keys(request, view)
+        if window_keys is None:
+            return True
+
+        current_key, previous_key = window_keys
+        current = await sync_to_async(self._incr)(current_key, 1)
+
+        if self._is_over_limit(current, await self.cache.aget(previous_key, 0)):
+            await sync_to_async(self._incr)(current_key, -1)
+            return self.throttle_failure()
+        return True
+
+    def _incr(self, key, delta:int) -> int:
+        #the counter lives for two windows, so that it can be weighted as the previous one
+        return incr_with_ttl(self.cache, key, delta, timeout=2 * self.duration)
+
+    def _get_window_keys(self, request, view):
+        """
+        Cache keys of the current and previous window counters, None when the request is not throttled
+        """
+        self.scope = f"{getattr(view, 'action', None)}.{self.ident_type}"
+        self.rate = self.THROTTLE_RATES.get(self.scope)
+        if self.rate is None:
+            return None
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return None
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        self.elapsed = self.now - window * self.duration
+
+        return [f"{self.key}_{window}", f"{self.key}_{window - 1}"]
+
+    def _is_over_limit(self, current:int, previous:int) -> bool:
+        #current includes this request
+        previous_weight = 1 - self.elapsed / self.duration
+        return previous * previous_weight + current > self.num_requests
+
+    def wait(self):
+        #the current window has to end before the count goes down significantly
+        return self.duration - self.elapsed
+
+
+class IPThrottle(SlidingWindowThrottle):
+    """
+    Counts by client address: X-Forwarded-For is only trusted for the NUM_PROXIES proxies
+    in front of the app (REMOTE_ADDR when 0), a client can't get a new counter by sending its own header
+    """
+    ident_type = "ip"
+
+    def get_request_ident(self, request, view):
+        return self.get_ident(request)
+
+
+class PhoneNumberThrottle(SlidingWindowThrottle):
+    ident_type = "phone_number"
+
+    def get_request_ident(self, request, view):
+        phone_number = _get_data(request, "phone_number")
+        if not isinstance(phone_number, str):
+            return None
+        #the same counter whatever the format of the number
+        return normalize_phone_number(phone_number)
+
+
+class UserIdThrottle(SlidingWindowThrottle):
+    ident_type = "user_id"
+
+    def get_request_ident(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return _get_data(request, "user")
@@ -1,9 +1,27 @@
+from django.urls import path
 from rest_framework import routers
 
-from authentication.api.views import AuthViewSet
+from authentication.api.async_views import (
+    AsyncLoginView,
+    AsyncPhoneVerificationView,
+    AsyncResendPhoneVerificationView,
+    AsyncSignupView,
+    AsyncUserView,
+)
+from authentication.api.views import AuthViewSet, ContactViewSet
 
 router = routers.SimpleRouter()
 
 router.register(r"auth" , AuthViewSet , basename="auth")
+router.register(r"contacts" , ContactViewSet , basename="contacts")
 
-urlpatterns = router.urls
\ No newline at end of file
+#async versions of the endpoints, to be served under ASGI (fi/asgi.py)
+async_urlpatterns = [
+    path("async/auth/signup/", AsyncSignupView.as_view(), name="async_auth-signup"),
+    path("async/auth/phone-verification/", AsyncPhoneVerificationView.as_view(), name="async_auth-phone_verification"),
+    path("async/auth/resend-phone-verification/", AsyncResendPhoneVerificationView.as_view(), name="async_auth-resend_phone_verification"),
+    path("async/auth/login/", AsyncLoginView.as_view(), name="async_auth-login"),
+    path("async/auth/user/", AsyncUserView.as_view(), name="async_auth-user"),
+]
+
+urlpatterns = router.urls + async_urlpatterns
@@ -0,0 +1,60 @@
+from typing import Iterator, List, Tuple
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from authentication.models import AdditionalPhoneNumber, PhoneNumberHash
+from authentication.utils.phone import normalize_phone_number
+
+
+User = get_user_model()
+
+
+def discover_contacts(values:List[str], hashed:bool=False) -> Iterator[List[Tuple[str, int]]]:
+    """
+    This function helps to find the registered users among phone numbers, or the hashes of their
+    canonical form (see PhoneNumberHash and normalize_phone_number).
+    The values are looked up by chunks of CONTACT_DISCOVERY_CHUNK_SIZE, with a single query per chunk
+    on the indexed phone numbers (main and additional ones, verified only).
+    Yields the (value, user id) matches of each chunk
+    """
+    #the looked up value of each given one, the duplicates are looked up once and the order is kept
+    if hashed:
+        lookup_values = {value.lower(): value for value in values}
+    else:
+        lookup_values = {normalize_phone_number(value): value for value in values}
+    keys = list(lookup_values)
+    chunk_size = settings.CONTACT_DISCOVERY_CHUNK_SIZE
+
+    for start in range(0, len(keys), chunk_size):
+        chunk = keys[start:start + chunk_size]
+        yield [(lookup_values[key], user_id) for key, user_id in _match(chunk, hashed)]
+
+
+def _match(chunk:List[str], hashed:bool) -> Iterator[Tuple[str, int]]:
+    users = User.objects.filter(phone_is_verified=True)
+    additional_phone_numbers = AdditionalPhoneNumber.objects.filter(
+        is_verified=True,
+        user__phone_is_verified=True,
+        user__is_deleted=False,
+    )
+
+    if hashed:
+        #the filter matches the expression indexes
+        users = users.annotate(value=PhoneNumberHash("normalized_phone_number"))
+        additional_phone_numbers = additional_phone_numbers.annotate(value=PhoneNumberHash("normalized_phone_number"))
+        lookup = "value__in"
+        field = "value"
+    else:
+        lookup = "normalized_phone_number__in"
+        field = "normalized_phone_number"
+
+    matches = users.filter(**{lookup: chunk}).values_list(field, "id").union(
+        additional_phone_numbers.filter(**{lookup: chunk}).values_list(field, "user_id"),
+        all=True,
+    )
+
+    #a number may be both the main number of a user and an additional one of another
+    seen = set()
+    for value, user_id in matches:
+        if value not in seen:
+            seen.add(value)
+            yield value, user_id
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+
+class HashingPoolSaturated(Exception):
+    pass
+
+
+def _init_worker():
+    #worker processes may be spawned (not forked), django has to be set up there
+    django.setup()
+
+
+@lru_cache(maxsize=None)
+def get_hashing_executor() -> Executor:
+    """
+    Pool running the password hashing (PBKDF2), off the event loop.
+    Threads are enough for the default hasher since hashlib releases the GIL while hashing
+    """
+    if settings.PASSWORD_HASHING_EXECUTOR == "process":
+        return ProcessPoolExecutor(
+            max_workers=settings.PASSWORD_HASHING_WORKERS,
+            initializer=_init_worker,
+        )
+    return ThreadPoolExecutor(
+        max_workers=settings.PASSWORD_HASHING_WORKERS,
+        thread_name_prefix="password-hashing",
+    )
+
+
+@lru_cache(maxsize=None)
+def _get_pending_slots() -> threading.BoundedSemaphore:
+    return threading.BoundedSemaphore(settings.PASSWORD_HASHING_MAX_PENDING)
+
+
+async def _run_in_pool(func, *args):
+    """
+    This function helps to run a hashing function in the pool.
+    At most PASSWORD_HASHING_MAX_PENDING calls are running or queued, the next ones are rejected
+    with HashingPoolSaturated instead of piling up (backpressure)
+    """
+    pending_slots = _get_pending_slots()
+    if not pending_slots.acquire(blocking=False):
+        raise HashingPoolSaturated("Too many password hashing operations pending")
+
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_hashing_executor(), func, *args)
+    finally:
+        pending_slots.release()
+
+
+async def acheck_password(user, raw_password:str) -> bool:
+    """
+    Async version of user.check_password, the hash is not upgraded when the hasher changed
+    """
+    return await _run_in_pool(check_password, raw_password, user.password)
+
+
+async def amake_password(raw_password:str) -> str:
+    return await _run_in_pool(make_password, raw_password)
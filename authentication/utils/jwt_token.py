@@ -1,12 +1,94 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+from authentication.utils.revocation import RevocationList
+from authentication.utils.token_backend import token_backend
 
 User = get_user_model()
 
 
+#simplejwt tokens using the CachedTokenBackend
+class AccessToken(tokens.AccessToken):
+    _token_backend = token_backend
+
+
+class RefreshToken(tokens.RefreshToken):
+    _token_backend = token_backend
+    access_token_class = AccessToken
+
+
+#user fields copied in the tokens with JWT_STATELESS_AUTH, enough for UserSerializer in the stateless mode (see CachedJWTAuthentication)
+USER_CLAIMS = [
+    "phone_number",
+    "email",
+    "first_name",
+    "last_name",
+    "phone_is_verified",
+    "email_is_verified",
+    "is_staff",
+]
+
+#jti of the refresh token an access token comes from, revoking the refresh token revokes its access tokens
+REFRESH_JTI_CLAIM = "rjti"
+
+
 def get_tokens_for_user(user:User): # type: ignore
     refresh = RefreshToken.for_user(user)
+    set_user_claims(refresh, user)
+    return _get_token_pair(refresh)
+
+
+async def aget_tokens_for_user(user:User): # type: ignore
+    """
+    Async version of get_tokens_for_user, the refresh token is recorded in db with the async ORM
+    """
+    #Token.for_user, BlacklistMixin.for_user would record the token with the sync ORM
+    refresh = super(tokens.BlacklistMixin, RefreshToken).for_user(user)
+    await OutstandingToken.objects.acreate(
+        user=user,
+        jti=refresh[api_settings.JTI_CLAIM],
+        token=str(refresh),
+        created_at=refresh.current_time,
+        expires_at=datetime_from_epoch(refresh["exp"]),
+    )
+    set_user_claims(refresh, user)
+    return _get_token_pair(refresh)
+
+
+def set_user_claims(token, user:User): # type: ignore
+    #copied to the access token as well. Only read in the stateless mode, they would make every token bigger otherwise
+    for claim in USER_CLAIMS:
+        if settings.JWT_STATELESS_AUTH:
+            token[claim] = getattr(user, claim)
+        else:
+            #a refresh token issued while the stateless mode was on
+            token.payload.pop(claim, None)
+
+
+def rotate_tokens(refresh:RefreshToken, user:User): # type: ignore
+    """
+    This function helps to get a new token pair from a valid refresh token,
+    with the current claims of the user.
+    The given refresh token is revoked when ROTATE_REFRESH_TOKENS and BLACKLIST_AFTER_ROTATION are set
+    """
+    if api_settings.ROTATE_REFRESH_TOKENS:
+        if api_settings.BLACKLIST_AFTER_ROTATION:
+            RevocationList.revoke(refresh)
+        refresh.set_jti()
+        refresh.set_exp()
+        refresh.set_iat()
+
+    set_user_claims(refresh, user)
+    return _get_token_pair(refresh)
+
+
+def _get_token_pair(refresh:RefreshToken):
+    access = refresh.access_token
+    access[REFRESH_JTI_CLAIM] = refresh[api_settings.JTI_CLAIM]
     return {
         "refresh": str(refresh),
-        "access": str(refresh.access_token),
-    }
\ No newline at end of file
+        "access": str(access),
+    }
@@ -0,0 +1,126 @@
+import logging
+from collections import defaultdict
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+from django.db import DEFAULT_DB_ALIAS, transaction
+from authentication.models import AdditionalPhoneNumber, CustomUser
+from authentication.utils.phone import normalize_phone_number
+
+
+logger = logging.getLogger(__name__)
+
+_USER_FIELDS = ["id", "phone_number", "normalized_phone_number", "is_deleted", "phone_is_verified", "last_login"]
+
+
+@dataclass
+class BackfillReport:
+    users: int = 0
+    additional_phone_numbers: int = 0
+    #users who lost a conflict (see _resolve_conflicts), as (user id, phone number, id of the user keeping the number)
+    deleted: List[Tuple[int, str, int]] = field(default_factory=list)
+    soft_deleted: List[Tuple[int, str, int]] = field(default_factory=list)
+
+
+def backfill_normalized_phone_numbers(batch_size:int=2000, dry_run:bool=False, using:str=DEFAULT_DB_ALIAS) -> BackfillReport:
+    """
+    This function helps to fill normalized_phone_number of the rows saved before it existed, walking the primary key.
+    Users whose numbers share the same canonical form are resolved (see _resolve_conflicts),
+    afterwards every user that is not deleted has a normalized_phone_number.
+    A dry run does the same in a transaction rolled back at the end, so the report is exact but nothing is written
+    """
+    report = BackfillReport()
+    with transaction.atomic(using=using) if dry_run else nullcontext():
+        report.users = _backfill(CustomUser.all_objects.db_manager(using), batch_size, report)
+        report.additional_phone_numbers = _backfill(AdditionalPhoneNumber.objects.db_manager(using), batch_size)
+        if dry_run:
+            transaction.set_rollback(True, using=using)
+    return report
+
+
+def has_missing_normalized_phone_numbers(using:str=DEFAULT_DB_ALIAS) -> bool:
+    #the deleted users who lost a conflict are left without one
+    return (
+        CustomUser.objects.db_manager(using).filter(normalized_phone_number=None).exists()
+        or AdditionalPhoneNumber.objects.db_manager(using).filter(normalized_phone_number=None).exists()
+    )
+
+
+def _backfill(manager, batch_size:int, report:Optional[BackfillReport]=None) -> int:
+    """
+    The users (unique numbers) are given a report for their conflicts, the additional phone numbers none
+    """
+    unique = report is not None
+    queryset = manager.filter(normalized_phone_number=None).order_by("pk")
+    if unique:
+        queryset = queryset.only(*_USER_FIELDS)
+    else:
+        queryset = queryset.only("id", "phone_number")
+    done = 0
+    last_pk = 0
+
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return done
+        last_pk = batch[-1].pk
+
+        for row in batch:
+            row.normalized_phone_number = normalize_phone_number(row.phone_number)
+
+        with transaction.atomic(using=manager.db):
+            if unique:
+                batch = _resolve_conflicts(manager, batch, report)
+            manager.bulk_update(batch, ["normalized_phone_number"], batch_size=batch_size)
+
+        done += len(batch)
+        logger.info(f"{done} {manager.model._meta.verbose_name_plural} normalized")
+
+
+def _resolve_conflicts(manager, batch:List[CustomUser], report:BackfillReport) -> List[CustomUser]:
+    """
+    This function helps to keep a single user per canonical phone number, the one that is not deleted,
+    verified and logged in the most recently (the oldest account on a tie).
+    The other unverified users are deleted (unfinished signups), the verified ones are soft deleted.
+    Returns the users of the batch to update
+    """
+    candidates = defaultdict(list)
+    for row in batch:
+        candidates[row.normalized_phone_number].append(row)
+    #users already holding the numbers
+    for holder in manager.filter(normalized_phone_number__in=list(candidates)).only(*_USER_FIELDS):
+        candidates[holder.normalized_phone_number].append(holder)
+
+    batch_pks = {row.pk for row in batch}
+    winners = []
+    deleted = []
+    soft_deleted = []
+    for normalized_phone_number, rows in candidates.items():
+        winner = max(rows, key=_precedence)
+        for row in rows:
+            if row is winner:
+                continue
+            if row.is_deleted and row.phone_is_verified and row.pk in batch_pks:
+                #already resolved by a previous run
+                continue
+            (soft_deleted if row.phone_is_verified else deleted).append(row.pk)
+            (report.soft_deleted if row.phone_is_verified else report.deleted).append((row.pk, row.phone_number, winner.pk))
+            logger.warning(
+                f"User {row.pk} ({row.phone_number}) has the same number as user {winner.pk} ({winner.phone_number}), "
+                f"{'soft deleted' if row.phone_is_verified else 'deleted'}"
+            )
+        if winner.pk in batch_pks:
+            winners.append(winner)
+
+    #the numbers are released before being given to the winners (unique column)
+    if deleted:
+        manager.filter(pk__in=deleted).delete()
+    if soft_deleted:
+        manager.filter(pk__in=soft_deleted).update(is_deleted=True, normalized_phone_number=None)
+
+    return winners
+
+
+def _precedence(user:CustomUser):
+    last_login = user.last_login.timestamp() if user.last_login else 0
+    return (not user.is_deleted, user.phone_is_verified, last_login, -user.pk)
@@ -1,10 +1,12 @@
 import random
 from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Dict, List, Optional
 from django.contrib.auth import get_user_model
 from authentication.models import OTPToken
 from authentication.constants import TokenCts
-from common.key_manager import KeyManager
+from authentication.utils.otp_store import get_otp_store
+from common.config import config
 from django.utils import timezone
 
 
@@ -54,28 +56,67 @@ def generate_and_save_otp_for(kind:str, user:User, extra_data={})->OTPToken: # t
     This function helps to generate and save otp for a user
     """
     
-    assert kind in TokenCts.TOKEN_TYPES_AS_LIST, f"Invalid kind {kind}"
+    return generate_and_save_otps_for([kind], user, extra_data)[kind]
+
+
+def generate_and_save_otps_for(kinds:List[str], user:User, extra_data={}, keep_extra_data=False)->Dict[str, OTPToken]: # type: ignore
+    """
+    This function helps to generate and save several otps for a user in a single write,
+    existing otps of the same kinds are replaced
+    """
     
-    token_ttl_key = f"{kind}_TTL"
-    token_length_key = f"{kind}_LENGTH"
-    token_alphabet_key = f"{kind}_ALPHABET"
+    otp_tokens = {kind: _build_otp_token(kind, user, extra_data) for kind in kinds}
+    
+    # save the otps
+    get_otp_store().put(*otp_tokens.values(), keep_extra_data=keep_extra_data)
+    
+    return otp_tokens
+
+
+async def agenerate_and_save_otps_for(kinds:List[str], user:User, extra_data={}, keep_extra_data=False)->Dict[str, OTPToken]: # type: ignore
+    """
+    Async version of generate_and_save_otps_for
+    """
+    
+    otp_tokens = {kind: await _abuild_otp_token(kind, user, extra_data) for kind in kinds}
+    
+    await get_otp_store().aput(*otp_tokens.values(), keep_extra_data=keep_extra_data)
+    
+    return otp_tokens
+
+
+def _build_otp_token(kind:str, user:User, extra_data)->OTPToken: # type: ignore
+    #types and defaults are declared in authentication/config.py
+    values = config.get_many(*_get_config_names(kind))
+    return _new_otp_token(kind, user, extra_data, values)
+
+
+async def _abuild_otp_token(kind:str, user:User, extra_data)->OTPToken: # type: ignore
+    values = await config.aget_many(*_get_config_names(kind))
+    return _new_otp_token(kind, user, extra_data, values)
+
+
+def _get_config_names(kind:str):
+    assert kind in TokenCts.TOKEN_TYPES_AS_LIST, f"Invalid kind {kind}"
     
-    token_ttl_sec = KeyManager.get(token_ttl_key, 60*5, value_type=int)
-    token_length = KeyManager.get(token_length_key, 6, value_type=int)
-    token_alphabet = KeyManager.get(token_alphabet_key, "0123456789", value_type=str)
+    return f"{kind}_TTL", f"{kind}_LENGTH", f"{kind}_ALPHABET"
+
+
+def _new_otp_token(kind:str, user:User, extra_data, values)->OTPToken: # type: ignore
+    token_ttl_key, token_length_key, token_alphabet_key = _get_config_names(kind)
+    token_ttl_sec = values[token_ttl_key]
+    token_length = values[token_length_key]
+    token_alphabet = values[token_alphabet_key]
     
     otp = _generate_otp(length=token_length, ttl=timedelta(seconds=token_ttl_sec), alphabet=token_alphabet)
     
-    # save the otp
-    otp_token = OTPToken.objects.create(
+    return OTPToken(
         user=user,
         kind=kind,
         token=otp.code,
         token_epires_at=otp.expiration_date,
         extra_data=extra_data,
     )
-    
-    return otp_token
 
 
 
@@ -87,10 +128,41 @@ def verify_code(kind:str, user:User, code:str): # type: ignore
     
     assert kind in TokenCts.TOKEN_TYPES_AS_LIST, f"Invalid kind {kind}"
     
-    otp_token = OTPToken.objects.filter(
-        user=user,
-        kind=kind,
-    ).first()
+    otp_token = get_otp_store().get(kind, user)
+    
+    return check_code(otp_token, code)
+
+
+async def averify_code(kind:str, user:User, code:str): # type: ignore
+    """
+    Async version of verify_code
+    """
+    
+    assert kind in TokenCts.TOKEN_TYPES_AS_LIST, f"Invalid kind {kind}"
+    
+    otp_token = await get_otp_store().aget(kind, user)
+    
+    return check_code(otp_token, code)
+
+
+def get_otps(kinds:List[str], user:User)->Dict[str, OTPToken]: # type: ignore
+    """
+    This function helps to load several otps of a user with a single lookup,
+    the missing ones are not in the result
+    """
+    
+    return get_otp_store().get_many(kinds, user)
+
+
+async def aget_otps(kinds:List[str], user:User)->Dict[str, OTPToken]: # type: ignore
+    return await get_otp_store().aget_many(kinds, user)
+
+
+def check_code(otp_token:Optional[OTPToken], code:str)->OTPToken:
+    """
+    This function helps to check a code against an otp already loaded
+    
+    """
     
     if not otp_token:
         raise OTPNotFound(f"UnExisting code")
@@ -109,29 +181,33 @@ def regenerate_otp(kind:str, user:User): # type: ignore
     
     """
     
-    assert kind in TokenCts.TOKEN_TYPES_AS_LIST, f"Invalid kind {kind}"
-    
-    extra_data = {}
-    
-    otp_token = OTPToken.objects.filter(
-        user=user,
-        kind=kind,
-    ).first()
-    
-    if otp_token:
-        extra_data = otp_token.extra_data
-        otp_token.delete()
-    
-    return generate_and_save_otp_for(kind, user, extra_data)
+    #the existing otp is replaced in place and keeps its extra_data
+    return generate_and_save_otps_for([kind], user, keep_extra_data=True)[kind]
+
+
+async def aregenerate_otp(kind:str, user:User): # type: ignore
+    return (await agenerate_and_save_otps_for([kind], user, keep_extra_data=True))[kind]
 
 
 def clear_otps(kind:str, user:User): #type: ignore
     """
     This function helps to clear otp
     """
-    OTPToken.objects.filter(
-        user=user,
-        kind=kind,
-    ).delete()
+    get_otp_store().delete(kind, user)
+
+
+async def aclear_otps(kind:str, user:User): #type: ignore
+    await get_otp_store().adelete(kind, user)
+    
     
-    
\ No newline at end of file
+
+
+def clear_many_otps(kinds:List[str], user:User): #type: ignore
+    """
+    This function helps to clear several otps with a single delete
+    """
+    get_otp_store().delete_many(kinds, user)
+
+
+async def aclear_many_otps(kinds:List[str], user:User): #type: ignore
+    await get_otp_store().adelete_many(kinds, user)
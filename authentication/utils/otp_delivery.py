@@ -0,0 +1,216 @@
+import time
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import List
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.module_loading import import_string
+from authentication.models import OTPToken
+from common.utils.cache import is_shared_cache
+
+
+#seconds after which the lock of a flush is released even if the flush died
+FLUSH_LOCK_TIMEOUT = 60
+#seconds a slot may stay missing (its writer took the number but did not write it yet) before it is skipped as lost
+SLOT_WRITE_TIMEOUT = 10
+
+
+@dataclass
+class OTPMessage:
+    phone_number: str
+    code: str
+    kind: str
+
+
+class OTPDeliveryError(Exception):
+    pass
+
+
+class OTPGateway:
+    """
+    Sends otp messages through a provider (sms, whatsapp, ...).
+    Raise OTPDeliveryError on temporary failures, the batch is retried
+    """
+
+    def send_many(self, messages:List[OTPMessage]):
+        raise NotImplementedError
+
+
+class FakeOTPGateway(OTPGateway):
+    """
+    In process gateway keeping the messages in `outbox` instead of sending them, for tests and benchmarks
+    """
+    outbox: List[OTPMessage] = []
+
+    def send_many(self, messages:List[OTPMessage]):
+        FakeOTPGateway.outbox.extend(messages)
+
+
+@lru_cache(maxsize=None)
+def get_gateway(provider:str) -> OTPGateway:
+    return import_string(settings.OTP_DELIVERY_GATEWAYS[provider])()
+
+
+def deliver(provider:str, messages:List[OTPMessage]):
+    """
+    This function helps to send messages through the gateway of a provider, by batches
+    """
+    gateway = get_gateway(provider)
+    batch_size = settings.OTP_DELIVERY_BATCH_SIZE
+    for i in range(0, len(messages), batch_size):
+        gateway.send_many(messages[i:i + batch_size])
+
+
+def queue_otp_delivery(*otp_tokens:OTPToken, provider:str=None):
+    """
+    This function helps to send otps to their users without blocking the request:
+    once the transaction is committed, the messages are buffered and sent with the messages
+    of the other requests by the next flush, or queued right away when the delivery is not buffered
+    """
+    provider = provider or settings.OTP_DELIVERY_DEFAULT_PROVIDER
+    messages = _build_messages(otp_tokens)
+
+    def dispatch():
+        if is_buffered():
+            buffer_messages(provider, messages)
+        else:
+            queue_batches(provider, messages)
+
+    transaction.on_commit(dispatch)
+
+
+async def aqueue_otp_delivery(*otp_tokens:OTPToken, provider:str=None):
+    """
+    Async version of queue_otp_delivery, for the async views once their writes are committed:
+    the messages are buffered (or queued) right away
+    """
+    provider = provider or settings.OTP_DELIVERY_DEFAULT_PROVIDER
+    messages = _build_messages(otp_tokens)
+    if is_buffered():
+        await abuffer_messages(provider, messages)
+    else:
+        #publishing to the broker is blocking
+        await sync_to_async(queue_batches, thread_sensitive=False)(provider, messages)
+
+
+def is_buffered() -> bool:
+    """
+    This function helps to know if the messages are buffered for the flush_otp_deliveries task:
+    the buffer must be in a cache shared with the celery workers, a per process cache would never be flushed
+    """
+    return settings.OTP_DELIVERY_BUFFERED and is_shared_cache(settings.OTP_DELIVERY_CACHE_ALIAS)
+
+
+def queue_batches(provider:str, messages:List[dict]):
+    """
+    This function helps to queue one delivery task per batch of OTP_DELIVERY_BATCH_SIZE messages,
+    a retry only sends its own batch again
+    """
+    from authentication.tasks import deliver_otps
+
+    batch_size = settings.OTP_DELIVERY_BATCH_SIZE
+    for i in range(0, len(messages), batch_size):
+        deliver_otps.delay(provider, messages[i:i + batch_size])
+
+
+def get_delivery_cache():
+    return caches[settings.OTP_DELIVERY_CACHE_ALIAS]
+
+
+def _outbox_key(provider:str, name) -> str:
+    return f"otp_outbox:{provider}:{name}"
+
+
+def buffer_messages(provider:str, messages:List[dict]):
+    """
+    This function helps to add messages to the buffer of a provider: they are stored in the next slot,
+    numbered by the head counter of the buffer
+    """
+    cache = get_delivery_cache()
+    head_key = _outbox_key(provider, "head")
+    cache.add(head_key, 0, timeout=None)
+    slot = cache.incr(head_key)
+    cache.set(_outbox_key(provider, slot), messages, timeout=settings.OTP_DELIVERY_BUFFER_TTL)
+
+
+async def abuffer_messages(provider:str, messages:List[dict]):
+    """
+    Async version of buffer_messages
+    """
+    cache = get_delivery_cache()
+    head_key = _outbox_key(provider, "head")
+    await cache.aadd(head_key, 0, timeout=None)
+    slot = await cache.aincr(head_key)
+    await cache.aset(_outbox_key(provider, slot), messages, timeout=settings.OTP_DELIVERY_BUFFER_TTL)
+
+
+def flush(provider:str) -> int:
+    """
+    This function helps to send the buffered messages of a provider, by batches (see queue_batches),
+    returns the number of messages. When another flush is running, it is asked to run once more
+    before leaving, so the messages buffered meanwhile are never left behind
+    """
+    cache = get_delivery_cache()
+    lock_key, pending_key = _outbox_key(provider, "lock"), _outbox_key(provider, "pending")
+    cache.set(pending_key, 1, timeout=None)
+
+    count = 0
+    #a flush overlapping another one would send the same slots twice. The lock is released before
+    #checking the pending flag, a flush failing to take it after that is seen by the holder
+    while cache.get(pending_key) and cache.add(lock_key, 1, timeout=FLUSH_LOCK_TIMEOUT):
+        try:
+            cache.delete(pending_key)
+            count += _flush(cache, provider)
+        finally:
+            cache.delete(lock_key)
+    return count
+
+
+def _flush(cache, provider:str) -> int:
+    head_key, cursor_key, gap_key = _outbox_key(provider, "head"), _outbox_key(provider, "cursor"), _outbox_key(provider, "gap")
+    values = cache.get_many([head_key, cursor_key, gap_key])
+    head, cursor = values.get(head_key, 0), values.get(cursor_key, 0)
+    if head < cursor:
+        #the head counter was lost (evicted), the slots start again from 1
+        cursor = 0
+
+    slot_keys = {
+        _outbox_key(provider, slot): slot
+        for slot in range(cursor + 1, min(head, cursor + settings.OTP_DELIVERY_FLUSH_MAX_SLOTS) + 1)
+    }
+    slots = cache.get_many(list(slot_keys))
+
+    messages = []
+    for key, slot in slot_keys.items():
+        if key not in slots:
+            #a slot is written right after its number is taken, it may still be on its way.
+            #Still missing SLOT_WRITE_TIMEOUT seconds later, it is lost (expired or its writer died) and skipped
+            gap = values.get(gap_key)
+            if gap is None or gap[0] != slot:
+                cache.set(gap_key, (slot, time.time()), timeout=None)
+                break
+            if time.time() - gap[1] < SLOT_WRITE_TIMEOUT:
+                break
+        else:
+            messages += slots[key]
+        cursor = slot
+
+    queue_batches(provider, messages)
+
+    #the slots are released once their batches are queued
+    cache.set(cursor_key, cursor, timeout=None)
+    cache.delete_many([key for key, slot in slot_keys.items() if slot <= cursor])
+    return len(messages)
+
+
+def _build_messages(otp_tokens) -> List[dict]:
+    return [
+        asdict(OTPMessage(
+            phone_number=otp_token.user.phone_number,
+            code=otp_token.token,
+            kind=otp_token.kind,
+        ))
+        for otp_token in otp_tokens
+    ]
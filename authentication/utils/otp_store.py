@@ -0,0 +1,193 @@
+from datetime import timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from authentication.models import OTPToken
+
+
+User = get_user_model()
+
+
+class OTPStore:
+    """
+    Storage of the OTP tokens, there is at most one token per (kind, user)
+    """
+
+    def get(self, kind:str, user:User) -> Optional[OTPToken]: # type: ignore
+        return self.get_many([kind], user).get(kind)
+
+    def get_many(self, kinds:List[str], user:User) -> Dict[str, OTPToken]: # type: ignore
+        """
+        Tokens of the user for the given kinds, in a single lookup. The missing ones are not in the result
+        """
+        raise NotImplementedError
+
+    def put(self, *otp_tokens:OTPToken, keep_extra_data:bool=False) -> List[OTPToken]:
+        """
+        Save the tokens, replacing the existing ones of the same (kind, user).
+        With keep_extra_data, the replaced tokens keep their extra_data
+        (the returned instances still hold the given one)
+        """
+        raise NotImplementedError
+
+    def delete(self, kind:str, user:User): # type: ignore
+        self.delete_many([kind], user)
+
+    def delete_many(self, kinds:List[str], user:User): # type: ignore
+        raise NotImplementedError
+
+    #async versions, for the async views. They run the sync ones in a thread unless the store overrides them
+
+    async def aget(self, kind:str, user:User) -> Optional[OTPToken]: # type: ignore
+        return (await self.aget_many([kind], user)).get(kind)
+
+    async def aget_many(self, kinds:List[str], user:User) -> Dict[str, OTPToken]: # type: ignore
+        return await sync_to_async(self.get_many)(kinds, user)
+
+    async def aput(self, *otp_tokens:OTPToken, keep_extra_data:bool=False) -> List[OTPToken]:
+        return await sync_to_async(self.put)(*otp_tokens, keep_extra_data=keep_extra_data)
+
+    async def adelete(self, kind:str, user:User): # type: ignore
+        await self.adelete_many([kind], user)
+
+    async def adelete_many(self, kinds:List[str], user:User): # type: ignore
+        await sync_to_async(self.delete_many)(kinds, user)
+
+
+class DatabaseOTPStore(OTPStore):
+    """
+    Stores the tokens as OTPToken rows
+    """
+
+    def get_many(self, kinds:List[str], user:User) -> Dict[str, OTPToken]: # type: ignore
+        otp_tokens = self._filter(kinds, user)
+        return {otp_token.kind: otp_token for otp_token in otp_tokens}
+
+    async def aget_many(self, kinds:List[str], user:User) -> Dict[str, OTPToken]: # type: ignore
+        return {otp_token.kind: otp_token async for otp_token in self._filter(kinds, user)}
+
+    def put(self, *otp_tokens:OTPToken, keep_extra_data:bool=False) -> List[OTPToken]:
+        #single INSERT ... ON CONFLICT (kind, user) DO UPDATE, so concurrent resends can't conflict
+        return OTPToken.objects.bulk_create(list(otp_tokens), **self._upsert_kwargs(keep_extra_data))
+
+    async def aput(self, *otp_tokens:OTPToken, keep_extra_data:bool=False) -> List[OTPToken]:
+        return await OTPToken.objects.abulk_create(list(otp_tokens), **self._upsert_kwargs(keep_extra_data))
+
+    def delete_many(self, kinds:List[str], user:User): # type: ignore
+        self._filter(kinds, user).delete()
+
+    async def adelete_many(self, kinds:List[str], user:User): # type: ignore
+        await self._filter(kinds, user).adelete()
+
+    @staticmethod
+    def _filter(kinds:List[str], user:User): # type: ignore
+        return OTPToken.objects.filter(
+            user=user,
+            kind__in=kinds,
+        )
+
+    @staticmethod
+    def _upsert_kwargs(keep_extra_data:bool):
+        update_fields = ["token", "token_epires_at"]
+        if not keep_extra_data:
+            update_fields.append("extra_data")
+
+        return {
+            "update_conflicts": True,
+            "unique_fields": ["kind", "user"],
+            "update_fields": update_fields,
+        }
+
+
+class CacheOTPStore(OTPStore):
+    """
+    Stores the tokens in the django cache (OTP_STORE_CACHE_ALIAS), they expire on their own.
+    Tokens are kept OTP_EXPIRED_RETENTION seconds after their expiration,
+    so that verifying them still reports an expired code.
+    The returned OTPToken instances are not saved in db
+    """
+
+    @property
+    def cache(self):
+        return caches[settings.OTP_STORE_CACHE_ALIAS]
+
+    def _cache_key(self, kind:str, user:User) -> str: # type: ignore
+        return f"otp:{kind}:{user.pk}"
+
+    def get_many(self, kinds:List[str], user:User) -> Dict[str, OTPToken]: # type: ignore
+        cache_keys = self._cache_keys(kinds, user)
+        return self._to_otp_tokens(cache_keys, self.cache.get_many(list(cache_keys)), user)
+
+    async def aget_many(self, kinds:List[str], user:User) -> Dict[str, OTPToken]: # type: ignore
+        cache_keys = self._cache_keys(kinds, user)
+        return self._to_otp_tokens(cache_keys, await self.cache.aget_many(list(cache_keys)), user)
+
+    def put(self, *otp_tokens:OTPToken, keep_extra_data:bool=False) -> List[OTPToken]:
+        for otp_token in otp_tokens:
+            extra_data = otp_token.extra_data
+            if keep_extra_data:
+                existing = self.get(otp_token.kind, otp_token.user)
+                if existing:
+                    extra_data = existing.extra_data
+
+            #a set replaces the existing token, there is nothing to conflict with
+            self.cache.set(**self._cache_entry(otp_token, extra_data))
+        return list(otp_tokens)
+
+    async def aput(self, *otp_tokens:OTPToken, keep_extra_data:bool=False) -> List[OTPToken]:
+        for otp_token in otp_tokens:
+            extra_data = otp_token.extra_data
+            if keep_extra_data:
+                existing = await self.aget(otp_token.kind, otp_token.user)
+                if existing:
+                    extra_data = existing.extra_data
+
+            await self.cache.aset(**self._cache_entry(otp_token, extra_data))
+        return list(otp_tokens)
+
+    def delete_many(self, kinds:List[str], user:User): # type: ignore
+        self.cache.delete_many(list(self._cache_keys(kinds, user)))
+
+    async def adelete_many(self, kinds:List[str], user:User): # type: ignore
+        await self.cache.adelete_many(list(self._cache_keys(kinds, user)))
+
+    def _cache_keys(self, kinds:List[str], user:User) -> Dict[str, str]: # type: ignore
+        return {self._cache_key(kind, user): kind for kind in kinds}
+
+    @staticmethod
+    def _to_otp_tokens(cache_keys:Dict[str, str], values:dict, user:User) -> Dict[str, OTPToken]: # type: ignore
+        otp_tokens = {}
+        for cache_key, data in values.items():
+            kind = cache_keys[cache_key]
+            otp_tokens[kind] = OTPToken(
+                user=user,
+                kind=kind,
+                token=data["token"],
+                token_epires_at=data["token_epires_at"],
+                extra_data=data["extra_data"],
+            )
+        return otp_tokens
+
+    def _cache_entry(self, otp_token:OTPToken, extra_data) -> dict:
+        ttl = otp_token.token_epires_at - timezone.now()
+        timeout = max(ttl, timedelta(0)).total_seconds() + settings.OTP_EXPIRED_RETENTION
+
+        return {
+            "key": self._cache_key(otp_token.kind, otp_token.user),
+            "value": {
+                "token": otp_token.token,
+                "token_epires_at": otp_token.token_epires_at,
+                "extra_data": extra_data,
+            },
+            "timeout": timeout,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_otp_store() -> OTPStore:
+    return import_string(settings.OTP_STORE_BACKEND)()
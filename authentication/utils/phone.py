@@ -0,0 +1,19 @@
+from django.db.models import Q
+
+
+def normalize_phone_number(phone_number:str) -> str:
+    """
+    This function helps to get the canonical (E.164) form of a phone number, "+" followed by the digits.
+    The numbers are expected with their country code, with or without "+" and spaces (see RegexCts.PHONE_REGEX),
+    so "+237 6 00 00 00 01" and "237600000001" are both "+237600000001"
+    """
+    digits = "".join(char for char in phone_number if char.isdigit())
+    return f"+{digits}"
+
+
+def phone_number_q(phone_number:str) -> Q:
+    """
+    This function helps to look a user up by phone number, whatever its format,
+    through the unique index of normalized_phone_number (see backfill_normalized_phone_numbers for the older rows)
+    """
+    return Q(normalized_phone_number=normalize_phone_number(phone_number))
@@ -0,0 +1,79 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import QuerySet
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from authentication.models import OTPToken
+
+
+User = get_user_model()
+
+
+def _delete_in_batches(queryset:QuerySet, batch_size:int, pause:float) -> int:
+    """
+    This function helps to delete the rows of a queryset by bounded batches,
+    pausing between them so that the purge doesn't compete with the requests.
+    The batch is deleted through the queryset so its filters are checked again
+    (a user verifying his phone number between the select and the delete is kept)
+    """
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return deleted
+
+        _, deleted_by_model = queryset.filter(pk__in=pks).delete()
+        deleted += deleted_by_model.get(queryset.model._meta.label, 0)
+
+        if pause:
+            time.sleep(pause)
+
+
+def purge_expired_otps(batch_size:int=None, pause:float=None) -> int:
+    """
+    This function helps to delete the otps expired for more than OTP_EXPIRED_RETENTION seconds
+    """
+    expired_before = timezone.now() - timedelta(seconds=settings.OTP_EXPIRED_RETENTION)
+
+    #uses the token_epires_at index
+    queryset = OTPToken.objects.filter(token_epires_at__lt=expired_before).order_by("token_epires_at")
+
+    return _delete_in_batches(
+        queryset,
+        batch_size or settings.AUTH_PURGE_BATCH_SIZE,
+        settings.AUTH_PURGE_BATCH_PAUSE if pause is None else pause,
+    )
+
+
+def purge_unverified_users(older_than:timedelta=None, batch_size:int=None, pause:float=None) -> int:
+    """
+    This function helps to delete the users who started a signup and never verified their phone number.
+    The staff accounts are never purged (e.g. superusers created before create_superuser verified them)
+    """
+    older_than = older_than or timedelta(hours=settings.UNVERIFIED_USER_RETENTION_HOURS)
+    queryset = User.all_objects.filter(
+        phone_is_verified=False,
+        date_joined__lt=timezone.now() - older_than,
+    ).exclude(is_staff=True).exclude(is_superuser=True)
+
+    return _delete_in_batches(
+        queryset,
+        batch_size or settings.AUTH_PURGE_BATCH_SIZE,
+        settings.AUTH_PURGE_BATCH_PAUSE if pause is None else pause,
+    )
+
+
+def purge_expired_tokens(batch_size:int=None, pause:float=None) -> int:
+    """
+    This function helps to delete the expired jwt tokens of the blacklist app (outstanding and blacklisted),
+    keeping the revocation list sync cheap
+    """
+    queryset = OutstandingToken.objects.filter(expires_at__lt=timezone.now())
+
+    return _delete_in_batches(
+        queryset,
+        batch_size or settings.AUTH_PURGE_BATCH_SIZE,
+        settings.AUTH_PURGE_BATCH_PAUSE if pause is None else pause,
+    )
@@ -0,0 +1,147 @@
+import threading
+import time
+from typing import Dict, Optional
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+from common.singleton import Singleton
+
+
+class RevocationList(metaclass=Singleton):
+    """
+    In memory copy of the token blacklist, so that checking a token is a dict lookup.
+
+    The new BlacklistedToken rows are synced every JWT_REVOCATION_SYNC_INTERVAL seconds
+    (a single query on the primary key), the whole list is reloaded every
+    JWT_REVOCATION_FULL_SYNC_INTERVAL seconds to drop the expired tokens and catch the rows
+    committed out of order. The tokens revoked by this worker are seen immediately
+    """
+    #jti -> expiration timestamp, of the revoked tokens
+    _revoked: Dict[str, float] = {}
+
+    #guards the list and the sync state, never held during a query
+    _lock = threading.Lock()
+
+    #last BlacklistedToken synced
+    _last_id: int = 0
+    _synced_at: Optional[float] = None
+    _full_synced_at: Optional[float] = None
+
+
+    @staticmethod
+    def is_revoked(*jtis:Optional[str]) -> bool:
+        RevocationList._ensure_fresh()
+        return RevocationList._contains(jtis)
+
+    @staticmethod
+    async def ais_revoked(*jtis:Optional[str]) -> bool:
+        """
+        Async version of is_revoked, the sync goes through Django's async ORM
+        """
+        await RevocationList._aensure_fresh()
+        return RevocationList._contains(jtis)
+
+    @staticmethod
+    def _contains(jtis) -> bool:
+        now = time.time()
+        for jti in jtis:
+            expires_at = RevocationList._revoked.get(jti)
+            if expires_at is not None and expires_at > now:
+                return True
+        return False
+
+    @staticmethod
+    def revoke(token) -> None:
+        """
+        Blacklist the token (access or refresh), for every worker
+        """
+        jti = token[api_settings.JTI_CLAIM]
+        exp = token["exp"]
+
+        outstanding_token, _ = OutstandingToken.objects.get_or_create(
+            jti=jti,
+            defaults={
+                "token": str(token),
+                "expires_at": datetime_from_epoch(exp),
+            },
+        )
+        BlacklistedToken.objects.get_or_create(token=outstanding_token)
+
+        with RevocationList._lock:
+            RevocationList._revoked[jti] = exp
+
+    @staticmethod
+    def sync(full:bool=True) -> int:
+        """
+        Load the blacklisted tokens that are not expired, only the new ones unless full.
+        Returns the number of tokens loaded
+        """
+        with RevocationList._lock:
+            last_id = RevocationList._last_id
+
+        rows = list(RevocationList._get_rows(full, last_id))
+        RevocationList._apply(rows, full, last_id)
+        return len(rows)
+
+    @staticmethod
+    async def _async_sync(full:bool=True) -> int:
+        with RevocationList._lock:
+            last_id = RevocationList._last_id
+
+        rows = [row async for row in RevocationList._get_rows(full, last_id)]
+        RevocationList._apply(rows, full, last_id)
+        return len(rows)
+
+    @staticmethod
+    def _get_rows(full:bool, last_id:int):
+        blacklisted_tokens = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+        if not full:
+            blacklisted_tokens = blacklisted_tokens.filter(id__gt=last_id)
+        return blacklisted_tokens.values_list("id", "token__jti", "token__expires_at")
+
+    @staticmethod
+    def _apply(rows, full:bool, last_id:int):
+        revoked = {jti: expires_at.timestamp() for _, jti, expires_at in rows}
+        with RevocationList._lock:
+            if full:
+                #a revoked token stays revoked, including the ones revoked by this worker during the query
+                now = time.time()
+                for jti, expires_at in RevocationList._revoked.items():
+                    if expires_at > now:
+                        revoked.setdefault(jti, expires_at)
+                RevocationList._revoked = revoked
+                RevocationList._full_synced_at = time.monotonic()
+            else:
+                RevocationList._revoked.update(revoked)
+            RevocationList._last_id = max([last_id] + [row_id for row_id, _, _ in rows])
+            RevocationList._synced_at = time.monotonic()
+
+    @staticmethod
+    def _ensure_fresh():
+        full = RevocationList._start_sync()
+        if full is not None:
+            RevocationList.sync(full=full)
+
+    @staticmethod
+    async def _aensure_fresh():
+        full = RevocationList._start_sync()
+        if full is not None:
+            await RevocationList._async_sync(full=full)
+
+    @staticmethod
+    def _start_sync() -> Optional[bool]:
+        """
+        None when the list is fresh enough, whether the sync should be a full one otherwise
+        """
+        now = time.monotonic()
+        with RevocationList._lock:
+            synced_at = RevocationList._synced_at
+            if synced_at is not None and now - synced_at < settings.JWT_REVOCATION_SYNC_INTERVAL:
+                return None
+            full_synced_at = RevocationList._full_synced_at
+            #the other threads keep using the current list meanwhile
+            RevocationList._synced_at = now
+
+        return full_synced_at is None or now - full_synced_at >= settings.JWT_REVOCATION_FULL_SYNC_INTERVAL
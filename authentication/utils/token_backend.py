@@ -0,0 +1,76 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+from django.conf import settings
+from jwt.algorithms import get_default_algorithms
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.settings import api_settings
+
+
+class CachedTokenBackend(TokenBackend):
+    """
+    TokenBackend with the keys prepared once (PyJWT parses a PEM key on each call otherwise)
+    and the payloads of the verified tokens kept in a bounded LRU, keyed by the token digest.
+
+    An entry is dropped when its token expires or when it is the least recently used one
+    and the cache is full. The payloads are copied, the tokens may modify them
+    """
+
+    def __init__(self, *args, cache_size:int=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_size = cache_size
+        #digest -> (payload, expiration timestamp), least recently used first
+        self._cache: Dict[bytes, Tuple[Dict[str, Any], float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        #RS/ES: key objects instead of PEM strings, the verifying key is enough to verify (e.g. on edge verifiers)
+        if not self.algorithm.startswith("HS"):
+            algorithm = get_default_algorithms()[self.algorithm]
+            #verifiers have no signing key
+            if self.signing_key:
+                self.signing_key = algorithm.prepare_key(self.signing_key)
+            if self.verifying_key:
+                self.verifying_key = algorithm.prepare_key(self.verifying_key)
+
+    def decode(self, token, verify:bool=True) -> Dict[str, Any]:
+        if not verify or not self.cache_size:
+            return super().decode(token, verify=verify)
+
+        digest = hashlib.sha256(token if isinstance(token, bytes) else token.encode()).digest()
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(digest)
+            if entry is not None:
+                payload, expires_at = entry
+                if expires_at > now:
+                    self._cache.move_to_end(digest)
+                    return dict(payload)
+                del self._cache[digest]
+
+        #the signature check runs outside of the lock
+        payload = super().decode(token, verify=True)
+        if "exp" not in payload:
+            return payload
+
+        expires_at = payload["exp"] + self.get_leeway().total_seconds()
+        with self._lock:
+            self._cache[digest] = (payload, expires_at)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return dict(payload)
+
+
+token_backend = CachedTokenBackend(
+    api_settings.ALGORITHM,
+    api_settings.SIGNING_KEY,
+    api_settings.VERIFYING_KEY,
+    api_settings.AUDIENCE,
+    api_settings.ISSUER,
+    api_settings.JWK_URL,
+    api_settings.LEEWAY,
+    api_settings.JSON_ENCODER,
+    cache_size=settings.JWT_VERIFICATION_CACHE_SIZE,
+)
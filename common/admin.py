@@ -1,7 +1,9 @@
 from django.contrib import admin
+from common.config import config
 from common.key_manager import KeyManager
 from common.models import Location, Key
 from django import forms
+from django.core.exceptions import ValidationError
 # Register your models here.
 
 
@@ -14,6 +16,18 @@ class KeyAdminForm(forms.ModelForm):
         model=Key
         fields =( 'name', 'value')
 
+    def clean(self):
+        cleaned_data = super().clean()
+        name = cleaned_data.get('name')
+        value = cleaned_data.get('value')
+        if name and value is not None:
+            #reject values that don't match the declared config key
+            try:
+                config.validate(name, value)
+            except ValidationError as e:
+                self.add_error('value', e)
+        return cleaned_data
+
 class KeyAdmin(admin.ModelAdmin):
     list_display = ('name', 'value')
     search_fields = ('name', )
@@ -0,0 +1,59 @@
+from django.conf import settings
+from rest_framework import serializers
+from common.models import Location
+from common.utils.geo import decode_cursor
+
+
+class NearestLocationsQuerySerializer(serializers.Serializer):
+    latitude = serializers.FloatField(min_value=-90, max_value=90, required=True)
+    longitude = serializers.FloatField(min_value=-180, max_value=180, required=True)
+    radius = serializers.FloatField(min_value=0, required=False, help_text="In meters")
+    limit = serializers.IntegerField(min_value=1, max_value=settings.LOCATION_SEARCH_MAX_LIMIT, default=settings.LOCATION_SEARCH_DEFAULT_LIMIT)
+    cursor = serializers.CharField(required=False)
+    
+    def validate_cursor(self, value):
+        try:
+            return decode_cursor(value)
+        except (ValueError, UnicodeDecodeError):
+            raise serializers.ValidationError("Invalid cursor")
+
+
+class LocationSerializer(serializers.ModelSerializer):
+    latitude = serializers.FloatField(source="location.y")
+    longitude = serializers.FloatField(source="location.x")
+    
+    class Meta:
+        model = Location
+        fields = [
+            "id",
+            "label",
+            "latitude",
+            "longitude",
+        ]
+
+
+class NearLocationSerializer(LocationSerializer):
+    distance = serializers.FloatField(help_text="In meters")
+    
+    class Meta(LocationSerializer.Meta):
+        fields = LocationSerializer.Meta.fields + ["distance"]
+
+
+class ClusterLocationsQuerySerializer(serializers.Serializer):
+    zoom = serializers.IntegerField(min_value=0, max_value=settings.LOCATION_TILE_MAX_ZOOM, required=True)
+    west = serializers.FloatField(min_value=-180, max_value=180, required=True)
+    south = serializers.FloatField(min_value=-90, max_value=90, required=True)
+    east = serializers.FloatField(min_value=-180, max_value=180, required=True)
+    north = serializers.FloatField(min_value=-90, max_value=90, required=True)
+
+    def validate(self, attrs):
+        if attrs["west"] >= attrs["east"] or attrs["south"] >= attrs["north"]:
+            raise serializers.ValidationError("Invalid bounding box")
+        return attrs
+
+
+class LocationClusterSerializer(serializers.Serializer):
+    geohash = serializers.CharField(source="cell")
+    count = serializers.IntegerField()
+    latitude = serializers.FloatField(help_text="Centroid of the locations of the cell")
+    longitude = serializers.FloatField(help_text="Centroid of the locations of the cell")
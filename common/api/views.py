@@ -0,0 +1,258 @@
+from rest_framework import viewsets
+from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from django.conf import settings
+from django.http import HttpResponse
+from django.contrib.gis.gdal import GDALException
+from django.contrib.gis.geos import Point
+from common.api.serializers import (
+    ClusterLocationsQuerySerializer,
+    LocationClusterSerializer,
+    NearLocationSerializer,
+    NearestLocationsQuerySerializer,
+)
+from common.constants import GeoCts
+from common.key_manager import KeyManager
+from common.utils.geo import cluster_locations, cluster_precision, encode_cursor, nearest_locations
+from common.utils.ingest import GEOJSON, NDJSON, IngestInterrupted, IngestResult, ingest_locations, iter_features
+from common.utils.tiles import MVT_CONTENT_TYPE, get_tile, is_valid_tile
+from drf_yasg.utils import swagger_auto_schema
+from drf_yasg import openapi
+
+
+class ConfigViewSet(viewsets.ViewSet):
+    """
+    This viewset exposes the state of the dynamic configuration
+    """
+
+    @swagger_auto_schema(
+        responses={
+            status.HTTP_200_OK: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    field: openapi.Schema(type=openapi.TYPE_INTEGER)
+                    for field in KeyManager.stats()
+                },
+            ),
+            status.HTTP_403_FORBIDDEN: openapi.Response(description="Forbidden"),
+        },
+        tags=['Config'],
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        permission_classes=[IsAdminUser],
+        url_path="cache-stats",
+        url_name="cache_stats",
+    )
+    def cache_stats(self, request):
+        """
+        This endpoint returns the KeyManager cache counters of the worker serving the request
+        """
+        return Response(KeyManager.stats(), status=status.HTTP_200_OK)
+
+
+class LocationViewSet(viewsets.ViewSet):
+    """
+    This viewset handles the location search endpoints
+    """
+
+    @swagger_auto_schema(
+        query_serializer=NearestLocationsQuerySerializer,
+        responses={
+            status.HTTP_200_OK: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "results": openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                field: openapi.Schema(type=openapi.TYPE_STRING)
+                                for field in NearLocationSerializer().fields
+                            },
+                        ),
+                    ),
+                    "next": openapi.Schema(type=openapi.TYPE_STRING, description="Cursor of the next page"),
+                },
+            ),
+            status.HTTP_400_BAD_REQUEST: openapi.Response(description="Bad Request"),
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(description="Unauthorized"),
+        },
+        tags=['Locations'],
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path="nearest",
+        url_name="nearest",
+    )
+    def nearest(self, request):
+        """
+        This endpoint returns the locations nearest to a point, nearest first, with their distance in meters.
+        The next page is requested with the `next` cursor of the response
+        """
+        serializer = NearestLocationsQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        limit = params.get("limit")
+        point = Point(params.get("longitude"), params.get("latitude"), srid=GeoCts.DEFAULT_SRID)
+        locations = list(nearest_locations(
+            point,
+            #one more location tells if there is a next page
+            limit=limit + 1,
+            radius=params.get("radius"),
+            after=params.get("cursor"),
+        ))
+
+        next_cursor = None
+        if len(locations) > limit:
+            locations = locations[:limit]
+            last = locations[-1]
+            next_cursor = encode_cursor(last.distance, last.id)
+
+        data = {
+            "results": NearLocationSerializer(locations, many=True).data,
+            "next": next_cursor,
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        query_serializer=ClusterLocationsQuerySerializer,
+        responses={
+            status.HTTP_200_OK: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "precision": openapi.Schema(type=openapi.TYPE_INTEGER, description="Geohash length of the clusters"),
+                    "results": openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                field: openapi.Schema(type=openapi.TYPE_STRING)
+                                for field in LocationClusterSerializer().fields
+                            },
+                        ),
+                    ),
+                },
+            ),
+            status.HTTP_400_BAD_REQUEST: openapi.Response(description="Bad Request"),
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(description="Unauthorized"),
+        },
+        tags=['Locations'],
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path="clusters",
+        url_name="clusters",
+    )
+    def clusters(self, request):
+        """
+        This endpoint returns the number of locations per geohash cell of a bounding box, for the zoomed out maps.
+        The cells get smaller as the zoom grows
+        """
+        serializer = ClusterLocationsQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        precision = cluster_precision(params.get("zoom"))
+        bbox = (params.get("west"), params.get("south"), params.get("east"), params.get("north"))
+        clusters = cluster_locations(precision, bbox)
+
+        data = {
+            "precision": precision,
+            "results": LocationClusterSerializer(clusters, many=True).data,
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        operation_description="The body is the file itself, a GeoJSON FeatureCollection or NDJSON (Content-Type: application/x-ndjson) of Point features",
+        manual_parameters=[
+            openapi.Parameter("srid", openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description="SRID of the coordinates"),
+        ],
+        responses={
+            status.HTTP_201_CREATED: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "rows": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "rejected": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "seconds": openapi.Schema(type=openapi.TYPE_NUMBER),
+                    "rows_per_second": openapi.Schema(type=openapi.TYPE_NUMBER),
+                    "errors": openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING)),
+                },
+            ),
+            status.HTTP_400_BAD_REQUEST: openapi.Response(description="Bad Request, with the counts of the locations written before the error"),
+            status.HTTP_403_FORBIDDEN: openapi.Response(description="Forbidden"),
+        },
+        tags=['Locations'],
+    )
+    @action(
+        methods=["POST"],
+        detail=False,
+        permission_classes=[IsAdminUser],
+        url_path="ingest",
+        url_name="ingest",
+    )
+    def ingest(self, request):
+        """
+        This endpoint loads Locations from the request body, read as a stream (not loaded in memory)
+        and written by batches of LOCATION_INGEST_BATCH_SIZE
+        """
+        try:
+            srid = int(request.query_params.get("srid", GeoCts.DEFAULT_SRID))
+        except ValueError:
+            return Response({"srid": "Invalid SRID"}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = NDJSON if "ndjson" in (request.content_type or "") else GEOJSON
+        #no stream without a body
+        if request.stream is None:
+            return Response({"detail": "Empty body"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            result = ingest_locations(
+                iter_features(request.stream, file_format),
+                source_srid=srid,
+                batch_size=settings.LOCATION_INGEST_BATCH_SIZE,
+            )
+        except GDALException as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except IngestInterrupted as e:
+            #the locations written before the failure stay, the client resumes after them
+            data = {"detail": str(e), **self._ingest_result(e.result)}
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(self._ingest_result(result), status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def _ingest_result(result:IngestResult) -> dict:
+        return {
+            "rows": result.rows,
+            "rejected": result.rejected,
+            "seconds": result.seconds,
+            "rows_per_second": result.rows_per_second,
+            "errors": result.errors,
+        }
+
+    @swagger_auto_schema(
+        operation_description="Mapbox vector tile of the locations, in the 'locations' layer",
+        responses={
+            status.HTTP_200_OK: openapi.Response(description=MVT_CONTENT_TYPE),
+            status.HTTP_401_UNAUTHORIZED: openapi.Response(description="Unauthorized"),
+            status.HTTP_404_NOT_FOUND: openapi.Response(description="Not Found"),
+        },
+        tags=['Locations'],
+    )
+    def tile(self, request, z, x, y):
+        """
+        This endpoint returns the tile z/x/y of the locations, rendered once then served from the cache
+        until a location inside it changes
+        """
+        if not is_valid_tile(z, x, y):
+            return Response({"detail": "Invalid tile"}, status=status.HTTP_404_NOT_FOUND)
+
+        return HttpResponse(get_tile(z, x, y), content_type=MVT_CONTENT_TYPE)
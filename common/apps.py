@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
 
 
 class CommonConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'common'
+
+    def ready(self):
+        import common.checks  # noqa: F401
+        import common.signals  # noqa: F401
+        from common.config import config
+
+        #collect the config keys declared in the config.py module of each app
+        autodiscover_modules("config")
+        config.compile()
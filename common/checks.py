@@ -0,0 +1,23 @@
+from django.core.checks import Error, Tags, register
+from django.db import DatabaseError
+
+
+@register(Tags.database)
+def check_config_values(app_configs, databases=None, **kwargs):
+    """
+    The config values stored in db must match the types and validators of their keys.
+    Database checks only run when asked (manage.py check --database default, migrate), never while the apps load
+    """
+    from common.config import config
+
+    if not databases:
+        return []
+    try:
+        errors = config.invalid_values()
+    except DatabaseError:
+        #not migrated yet
+        return []
+    return [
+        Error(f"Invalid config value {error}", hint="Fix it through the KeyManager (admin or shell)", id="common.E001")
+        for error in errors
+    ]
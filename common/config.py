@@ -0,0 +1,133 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from common.key_manager import KeyManager, converter
+
+
+@dataclass(frozen=True)
+class ConfigKey:
+    name: str
+    value_type: type = str
+    default: Any = None
+    #django style validators, raising ValidationError on bad values
+    validators: Sequence[Callable[[Any], None]] = ()
+    description: str = ""
+
+    def run_validators(self, value):
+        for validator in self.validators:
+            validator(value)
+
+    def clean(self, raw_value:str):
+        """
+        Convert a raw (string) value to the type of the key and validate it
+        """
+        try:
+            value = converter.get(self.value_type, str)(raw_value)
+        except ValueError:
+            raise ValidationError(f"{self.name} must be of type {self.value_type.__name__}")
+
+        self.run_validators(value)
+        return value
+
+
+class ConfigRegistry:
+    """
+    Registry of the dynamic config keys (stored with the KeyManager).
+    Keys are declared once with their type, default and validators, then read as attributes:
+        config.PHONE_NUMBER_TOKEN_TTL
+    """
+
+    def __init__(self):
+        self._keys: Dict[str, ConfigKey] = {}
+
+    def register(self, *keys:ConfigKey):
+        for key in keys:
+            if key.name in self._keys:
+                raise ImproperlyConfigured(f"Config key {key.name} is already registered")
+            self._keys[key.name] = key
+
+    def __getattr__(self, name:str):
+        keys = self.__dict__.get("_keys", {})
+        if name not in keys:
+            raise AttributeError(f"Unknown config key {name}")
+
+        key = keys[name]
+        return KeyManager.get(name, key.default, value_type=key.value_type)
+
+    def __dir__(self):
+        return [*super().__dir__(), *self._keys]
+
+    def get_many(self, *names:str) -> Dict[str, Any]:
+        """
+        Read several keys with a single query for the ones that are not cached
+        """
+        return KeyManager.get_many(self._get_many_specs(names))
+
+    async def aget(self, name:str):
+        """
+        Async version of the attribute access, for async views
+        """
+        key = self._keys[name]
+        return await KeyManager.aget(name, key.default, value_type=key.value_type)
+
+    async def aget_many(self, *names:str) -> Dict[str, Any]:
+        return await KeyManager.aget_many(self._get_many_specs(names))
+
+    def _get_many_specs(self, names:Sequence[str]) -> Dict[str, Tuple[Any, type]]:
+        return {
+            name: (self._keys[name].default, self._keys[name].value_type)
+            for name in names
+        }
+
+    def preload(self):
+        """
+        Load all the registered keys with a single query, missing ones included
+        """
+        KeyManager.prefetch(self._keys)
+
+    def validate(self, name:str, raw_value:str):
+        """
+        Validate a raw value about to be stored for `name`, unregistered keys are accepted as is
+        """
+        if name in self._keys:
+            self._keys[name].clean(raw_value)
+
+    def compile(self):
+        """
+        Check the defaults of all the registered keys, called once at startup
+        """
+        errors = []
+        for key in self._keys.values():
+            if key.default is not None and not isinstance(key.default, key.value_type):
+                errors.append(f"{key.name}: default {key.default!r} is not of type {key.value_type.__name__}")
+                continue
+            if key.default is None:
+                continue
+            try:
+                key.run_validators(key.default)
+            except ValidationError as e:
+                errors.append(f"{key.name}: invalid default {key.default!r} ({'; '.join(e.messages)})")
+
+        if errors:
+            raise ImproperlyConfigured("Invalid config keys:\n" + "\n".join(errors))
+
+    def invalid_values(self) -> List[str]:
+        """
+        Check the values stored in db for all the registered keys, returns the problems found
+        (reported by the common.checks system check)
+        """
+        self.preload()
+        errors = []
+        for key in self._keys.values():
+            try:
+                value = getattr(self, key.name)
+                if value is not None:
+                    key.run_validators(value)
+            except (ValueError, TypeError):
+                errors.append(f"{key.name}: stored value is not of type {key.value_type.__name__}")
+            except ValidationError as e:
+                errors.append(f"{key.name}: invalid stored value ({'; '.join(e.messages)})")
+        return errors
+
+
+config = ConfigRegistry()
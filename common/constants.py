@@ -1,3 +1,6 @@
-
 class GeoCts:
-    DEFAULT_SRID=4326
\ No newline at end of file
+    DEFAULT_SRID=4326
+    #characters of the geohash stored on each location (cells of a few centimeters)
+    GEOHASH_PRECISION=12
+    #geohash lengths the locations can be clustered by, see LocationCluster
+    CLUSTER_PRECISIONS=range(1, 7)
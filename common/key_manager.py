@@ -1,6 +1,11 @@
-from typing import Dict
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Optional, Tuple
+from django.conf import settings
 from common.singleton import Singleton
-from common.models import Key
+from common.models import Key, KeyGeneration
 
 def list_converter(value:str):
     return value.split(",")
@@ -17,32 +22,276 @@ converter = {
     bool: lambda x: bool_converter(x)
 }
 
+
+@dataclass
+class _CacheEntry:
+    #decrypted value, None when the key does not exist in db (negative caching)
+    value: Optional[str]
+    expires_at: float
+    #the value already converted, per value_type
+    converted: Dict[type, Any] = field(default_factory=dict)
+
+
 class KeyManager(metaclass=Singleton):
-    _cache: Dict[str, Key] = {}
+    #least recently used entries first
+    _cache: Dict[str, _CacheEntry] = OrderedDict()
+
+    #guards the cache, the generation and the counters, never held during a query
+    _lock = threading.RLock()
+
+    #generation of the Key table the cache was built from
+    _generation: Optional[int] = None
+    _generation_checked_at: float = 0.0
+
+    #set by the first warm_up_once of the process
+    _warmed_up: bool = False
+
+    #per process counters, exposed by stats()
+    _stats: Dict[str, int] = {
+        "hits": 0,
+        "misses": 0,
+        "evictions": 0,
+        "expirations": 0,
+    }
 
 
     @staticmethod
     def get(name:str,default=None,value_type=str):
-        val = default
-        if name in KeyManager._cache:
-            val =  KeyManager._cache[name].value
+        KeyManager._ensure_fresh()
+        entry = KeyManager._get_entry(name)
+        if entry is None:
+            entry = KeyManager._load_from_db(name)
+
+        return KeyManager._value_of(entry, default, value_type)
+
+    @staticmethod
+    async def aget(name:str,default=None,value_type=str):
+        """
+        Async version of get, the queries go through Django's async ORM
+        """
+        await KeyManager._aensure_fresh()
+        entry = KeyManager._get_entry(name)
+        if entry is None:
+            entry = await KeyManager._aload_from_db(name)
+
+        return KeyManager._value_of(entry, default, value_type)
+
+    @staticmethod
+    def get_many(keys:Dict[str, Tuple[Any, type]]) -> Dict[str, Any]:
+        """
+        Get several keys at once, `keys` maps each name to its (default, value_type).
+        The names that are not cached are loaded with a single query
+        """
+        return KeyManager._values_of(KeyManager.prefetch(keys), keys)
+
+    @staticmethod
+    def prefetch(names:Iterable[str]) -> Dict[str, _CacheEntry]:
+        """
+        Make sure that the given keys are cached, the ones that are not are loaded with a single query
+        """
+        KeyManager._ensure_fresh()
+        entries = {name: KeyManager._get_entry(name) for name in names}
+
+        missing = [name for name, entry in entries.items() if entry is None]
+        if missing:
+            entries.update(KeyManager._load_many_from_db(missing))
+
+        return entries
+
+    @staticmethod
+    async def aget_many(keys:Dict[str, Tuple[Any, type]]) -> Dict[str, Any]:
+        """
+        Async version of get_many
+        """
+        await KeyManager._aensure_fresh()
+        entries = {name: KeyManager._get_entry(name) for name in keys}
+
+        missing = [name for name, entry in entries.items() if entry is None]
+        if missing:
+            entries.update(await KeyManager._aload_many_from_db(missing))
+
+        return KeyManager._values_of(entries, keys)
+
+    @staticmethod
+    def load_prefix(prefix:str) -> int:
+        """
+        Load all the keys of a namespace (e.g. "PHONE_NUMBER_TOKEN_") with a single query
+        """
+        KeyManager._ensure_fresh()
+        generation = KeyManager._generation
+        count = 0
+        for key in Key.objects.filter(name__startswith=prefix):
+            KeyManager._store(key.name, key.value, generation)
+            count += 1
+        return count
+
+    @staticmethod
+    def warm_up() -> int:
+        """
+        Load all the keys, so that the first requests of a worker don't pay for cold lookups
+        """
+        return KeyManager.load_prefix("")
+
+    @staticmethod
+    def warm_up_once() -> bool:
+        """
+        Warm up on the first call of the process only, returns whether this call did it
+        """
+        if KeyManager._warmed_up:
+            return False
+        with KeyManager._lock:
+            if KeyManager._warmed_up:
+                return False
+            KeyManager._warmed_up = True
+
+        KeyManager.warm_up()
+        return True
+
+    @staticmethod
+    def _values_of(entries:Dict[str, _CacheEntry], keys:Dict[str, Tuple[Any, type]]) -> Dict[str, Any]:
+        return {
+            name: KeyManager._value_of(entries[name], default, value_type)
+            for name, (default, value_type) in keys.items()
+        }
+
+    @staticmethod
+    def _value_of(entry:_CacheEntry, default, value_type):
+        if entry.value is None:
+            #defaults are not cached, they can differ between callers
+            val = KeyManager._convert(default, value_type)
+        elif value_type in entry.converted:
+            val = entry.converted[value_type]
         else:
-            key:Key = KeyManager._load_from_db(name)
-            if key:
-                val =  key.value
-        
+            #concurrent callers can only store the same converted value here
+            val = KeyManager._convert(entry.value, value_type)
+            entry.converted[value_type] = val
+
+        #cached lists are shared, don't let the callers mutate them
+        if isinstance(val, list):
+            val = list(val)
+        return val
+
+    @staticmethod
+    def _convert(val, value_type):
         #try to convert the value to the desired type
         if val and not isinstance(val, value_type):
             val = converter.get(value_type, str)(val)
         return val
-    
+
+    @staticmethod
+    def stats():
+        with KeyManager._lock:
+            return {
+                **KeyManager._stats,
+                "size": len(KeyManager._cache),
+                "max_size": settings.KEY_MANAGER_CACHE_MAX_SIZE,
+            }
+
+    @staticmethod
+    def _ensure_fresh():
+        """
+        Drop the cache when a Key was changed (possibly by another worker) since it was built.
+        The shared generation counter is read at most once every KEY_MANAGER_REFRESH_INTERVAL seconds,
+        so changes are picked up within that delay without a query on each get
+        """
+        if KeyManager._generation_check_is_due():
+            KeyManager._set_generation(KeyGeneration.current())
+
+    @staticmethod
+    async def _aensure_fresh():
+        if KeyManager._generation_check_is_due():
+            KeyManager._set_generation(await KeyGeneration.acurrent())
+
+    @staticmethod
+    def _generation_check_is_due() -> bool:
+        now = time.monotonic()
+        with KeyManager._lock:
+            if KeyManager._generation is not None and now - KeyManager._generation_checked_at < settings.KEY_MANAGER_REFRESH_INTERVAL:
+                return False
+
+            #the other threads skip the check until the next interval
+            KeyManager._generation_checked_at = now
+            return True
+
+    @staticmethod
+    def _set_generation(generation:int):
+        with KeyManager._lock:
+            if generation != KeyManager._generation:
+                KeyManager._cache = OrderedDict()
+                KeyManager._generation = generation
+
+    @staticmethod
+    def invalidate():
+        with KeyManager._lock:
+            KeyManager._cache = OrderedDict()
+
+    @staticmethod
+    def _get_entry(name:str) -> Optional[_CacheEntry]:
+        with KeyManager._lock:
+            entry = KeyManager._cache.get(name)
+            if entry is None:
+                KeyManager._stats["misses"] += 1
+                return None
+
+            if entry.expires_at <= time.monotonic():
+                del KeyManager._cache[name]
+                KeyManager._stats["expirations"] += 1
+                KeyManager._stats["misses"] += 1
+                return None
+
+            KeyManager._cache.move_to_end(name)
+            KeyManager._stats["hits"] += 1
+            return entry
+
     @staticmethod
-    def _load_from_db(name:str):
+    def _store(name:str, value:Optional[str], generation:Optional[int]=None) -> _CacheEntry:
+        """
+        Cache the value of a key, `generation` is the one the value was read at (if read from db)
+        """
+        entry = _CacheEntry(
+            value=value,
+            expires_at=time.monotonic() + settings.KEY_MANAGER_CACHE_TTL,
+        )
+        with KeyManager._lock:
+            #the cache was invalidated while the value was read, it may be stale
+            if generation is not None and generation != KeyManager._generation:
+                return entry
+
+            KeyManager._cache[name] = entry
+            KeyManager._cache.move_to_end(name)
+
+            #evict the least recently used entries
+            while len(KeyManager._cache) > settings.KEY_MANAGER_CACHE_MAX_SIZE:
+                KeyManager._cache.popitem(last=False)
+                KeyManager._stats["evictions"] += 1
+
+        return entry
+
+    @staticmethod
+    def _load_from_db(name:str) -> _CacheEntry:
+        generation = KeyManager._generation
         key:Key = Key.objects.filter(name=name).first()
-        if key:
-            KeyManager._cache[name] = key
-            return key
-        
+        #missing keys are cached too, so that defaults don't cost a query on each call
+        return KeyManager._store(name, key.value if key else None, generation)
+
+    @staticmethod
+    async def _aload_from_db(name:str) -> _CacheEntry:
+        generation = KeyManager._generation
+        key:Key = await Key.objects.filter(name=name).afirst()
+        return KeyManager._store(name, key.value if key else None, generation)
+
+    @staticmethod
+    def _load_many_from_db(names:Iterable[str]) -> Dict[str, _CacheEntry]:
+        generation = KeyManager._generation
+        values = {key.name: key.value for key in Key.objects.filter(name__in=names)}
+        return {name: KeyManager._store(name, values.get(name), generation) for name in names}
+
+    @staticmethod
+    async def _aload_many_from_db(names:Iterable[str]) -> Dict[str, _CacheEntry]:
+        generation = KeyManager._generation
+        values = {key.name: key.value async for key in Key.objects.filter(name__in=names)}
+        return {name: KeyManager._store(name, values.get(name), generation) for name in names}
+
     @staticmethod
     def set(name, value):
         #create a new instance
@@ -52,23 +301,24 @@ class KeyManager(metaclass=Singleton):
         key.save()
 
         #update cache
-        KeyManager._cache[name] = key
+        KeyManager._store(name, value)
 
         return key
 
     @staticmethod
     def update(key_id, name, value):
         key = Key.objects.get(id=key_id)
+        old_name = key.name
         key.name = name
         key.value = value
         key.save()
 
-        #filter out the old key from cache
-        KeyManager._cache = {k:v for k,v in KeyManager._cache.items() if v.id != key_id}
+        with KeyManager._lock:
+            #filter out the old key from cache
+            KeyManager._cache.pop(old_name, None)
 
-        #update cache
-        KeyManager._cache[name] = key
+            #update cache
+            KeyManager._store(name, value)
 
         return key
-       
-    
\ No newline at end of file
+
@@ -0,0 +1,33 @@
+import time
+from django.contrib.gis.db.models.functions import GeoHash
+from django.core.management.base import BaseCommand
+from common.constants import GeoCts
+from common.models import Location
+
+
+class Command(BaseCommand):
+    help = "Fill the geohash of the locations saved before it existed, by batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Number of locations updated at once")
+
+    def handle(self, *args, batch_size, **options):
+        started_at = time.monotonic()
+        queryset = Location.objects.filter(geohash=None).order_by("pk")
+        done = 0
+        last_pk = 0
+
+        while True:
+            pks = list(queryset.filter(pk__gt=last_pk).values_list("pk", flat=True)[:batch_size])
+            if not pks:
+                break
+            last_pk = pks[-1]
+
+            #computed by PostGIS, same value as Location.set_geohash
+            done += Location.objects.filter(pk__in=pks).update(
+                geohash=GeoHash("location", precision=GeoCts.GEOHASH_PRECISION),
+            )
+            self.stdout.write(f"{done} locations updated")
+
+        elapsed = time.monotonic() - started_at
+        self.stdout.write(self.style.SUCCESS(f"Backfill of {done} geohashes done in {elapsed:.1f}s"))
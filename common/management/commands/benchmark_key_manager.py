@@ -0,0 +1,53 @@
+from cryptography.fernet import Fernet, MultiFernet
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from common.key_manager import KeyManager, converter
+from common.models import Key, get_current_cipher_suite
+from common.utils.benchmark import measure
+
+
+PREFIX = "BENCHMARK_KEY_"
+
+
+class Command(BaseCommand):
+    help = "Compare the cost of a config read: decrypting and converting the Key value on each read vs the KeyManager cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keys", type=int, default=100, help="Number of keys created for the benchmark (deleted at the end)")
+        parser.add_argument("--iterations", type=int, default=20000, help="Number of reads per scenario")
+
+    def handle(self, *args, keys, iterations, **options):
+        names = [f"{PREFIX}{i}" for i in range(keys)]
+        Key.objects.bulk_create([Key(name=name, value=",".join(str(n) for n in range(10))) for name in names])
+        try:
+            self.run(names, iterations)
+        finally:
+            Key.objects.filter(name__startswith=PREFIX).delete()
+            KeyManager.invalidate()
+
+    def run(self, names, iterations):
+        key_objects = list(Key.objects.filter(name__in=names))
+        encryption_keys = [settings.ENCRIPTION_KEY, *settings.ENCRIPTION_OLD_KEYS]
+
+        def decrypt_with_new_cipher(i):
+            #a Fernet built on each read, as Key.value did
+            key = key_objects[i % len(key_objects)]
+            cipher_suite = MultiFernet([Fernet(encryption_key.encode()) for encryption_key in encryption_keys])
+            converter[list](cipher_suite.decrypt(key.encrypted_value_bytes).decode())
+
+        def decrypt_with_shared_cipher(i):
+            key = key_objects[i % len(key_objects)]
+            converter[list](get_current_cipher_suite().decrypt(key.encrypted_value_bytes).decode())
+
+        def cached_read(i):
+            KeyManager.get(names[i % len(names)], value_type=list)
+
+        KeyManager.load_prefix(PREFIX)
+        scenarios = [
+            ("decrypt (new cipher) + convert", decrypt_with_new_cipher),
+            ("decrypt (shared cipher) + convert", decrypt_with_shared_cipher),
+            ("KeyManager.get (cached)", cached_read),
+        ]
+        for label, func in scenarios:
+            timings = measure(func, iterations, warm_up=len(names))
+            self.stdout.write(f"{label}: {timings.summary()}")
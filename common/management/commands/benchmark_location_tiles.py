@@ -0,0 +1,44 @@
+import random
+from django.core.management.base import BaseCommand
+from common.models import Location
+from common.utils.benchmark import SYNTHETIC_LABEL, format_duration, generate_locations, measure
+from common.utils.tiles import get_tile, invalidate_all_tiles, point_tile, render_tile
+
+
+class Command(BaseCommand):
+    help = "Benchmark the vector tiles (tiles/s) at several zoom levels, rendered by PostGIS and served from the tile cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--points", type=int, default=1_000_000, help="Number of synthetic locations, the missing ones are generated")
+        parser.add_argument("--zooms", type=int, nargs="+", default=[2, 6, 10, 14], help="Zoom levels to benchmark")
+        parser.add_argument("--tiles", type=int, default=50, help="Number of random tiles per zoom level")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--clean", action="store_true", help="Delete the synthetic locations at the end")
+
+    def handle(self, *args, points, zooms, tiles, seed, clean, **options):
+        rng = random.Random(seed)
+        result = generate_locations(points, rng)
+        if result.rows:
+            self.stdout.write(f"Generated {result.rows} locations ({result.rows_per_second:.0f} rows/s)")
+        self.stdout.write(f"{Location.objects.count()} locations")
+
+        for z in zooms:
+            #tiles containing random points, the synthetic locations are spread uniformly
+            coordinates = [(z, *point_tile(rng.uniform(-180, 180), rng.uniform(-85, 85), z)) for _ in range(tiles)]
+            sizes = []
+
+            render = measure(lambda i: sizes.append(len(render_tile(*coordinates[i]))), tiles)
+            #rendered once and cached, then read from the cache
+            invalidate_all_tiles()
+            for tile in coordinates:
+                get_tile(*tile)
+            cached = measure(lambda i: get_tile(*coordinates[i]), tiles)
+
+            self.stdout.write(
+                f"zoom {z}: render {render.per_second:.1f} tiles/s (p99 {format_duration(render.percentile(99))}), "
+                f"cached {cached.per_second:.0f} tiles/s, {sum(sizes) / len(sizes) / 1024:.1f}KB per tile"
+            )
+
+        if clean:
+            deleted, _ = Location.objects.filter(label=SYNTHETIC_LABEL).delete()
+            self.stdout.write(f"Deleted {deleted} synthetic locations")
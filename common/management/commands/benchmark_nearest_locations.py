@@ -0,0 +1,47 @@
+import random
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+from common.constants import GeoCts
+from common.models import Location
+from common.utils.benchmark import SYNTHETIC_LABEL, generate_locations, measure
+from common.utils.geo import nearest_locations
+
+
+class Command(BaseCommand):
+    help = "Benchmark the nearest locations search (KNN on the geography index) over synthetic points, against a full distance sort"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--points", type=int, default=1_000_000, help="Number of synthetic locations, the missing ones are generated")
+        parser.add_argument("--queries", type=int, default=200, help="Number of searches per scenario")
+        parser.add_argument("--full-sort-queries", type=int, default=5, help="Number of searches sorting all the rows by distance (slow)")
+        parser.add_argument("--limit", type=int, default=20, help="Locations per search")
+        parser.add_argument("--radius", type=float, default=50_000, help="Radius (in meters) of the filtered scenario")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--clean", action="store_true", help="Delete the synthetic locations at the end")
+
+    def handle(self, *args, points, queries, full_sort_queries, limit, radius, seed, clean, **options):
+        rng = random.Random(seed)
+        result = generate_locations(points, rng)
+        if result.rows:
+            self.stdout.write(f"Generated {result.rows} locations ({result.rows_per_second:.0f} rows/s)")
+
+        targets = [Point(rng.uniform(-180, 180), rng.uniform(-85, 85), srid=GeoCts.DEFAULT_SRID) for _ in range(queries)]
+        self.stdout.write(f"{Location.objects.count()} locations, {limit} per search")
+
+        scenarios = [
+            ("KNN", queries, lambda i: list(nearest_locations(targets[i], limit))),
+            (f"KNN within {radius:.0f}m", queries, lambda i: list(nearest_locations(targets[i], limit, radius=radius))),
+            #the distance computed for every row, then sorted
+            ("full distance sort", full_sort_queries, lambda i: list(
+                Location.objects.annotate(distance=Distance("location", targets[i])).order_by("distance")[:limit]
+            )),
+        ]
+        for label, iterations, func in scenarios:
+            if iterations:
+                timings = measure(func, min(iterations, len(targets)), warm_up=1)
+                self.stdout.write(f"{label}: {timings.summary()}")
+
+        if clean:
+            deleted, _ = Location.objects.filter(label=SYNTHETIC_LABEL).delete()
+            self.stdout.write(f"Deleted {deleted} synthetic locations")
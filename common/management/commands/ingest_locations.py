@@ -0,0 +1,44 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from common.constants import GeoCts
+from common.utils.ingest import FORMATS, GEOJSON, NDJSON, IngestInterrupted, ingest_locations, iter_features
+
+
+class Command(BaseCommand):
+    help = "Load Locations from a GeoJSON FeatureCollection or NDJSON file of Point features, streamed by batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="GeoJSON (.geojson, .json) or NDJSON (.ndjson, .jsonl) file")
+        parser.add_argument("--format", dest="file_format", choices=FORMATS, default=None, help="File format, guessed from the extension otherwise")
+        parser.add_argument("--srid", type=int, default=GeoCts.DEFAULT_SRID, help="SRID of the coordinates, reprojected to the default one")
+        parser.add_argument("--batch-size", type=int, default=settings.LOCATION_INGEST_BATCH_SIZE, help="Number of locations written at once")
+
+    def handle(self, *args, path, file_format, srid, batch_size, **options):
+        file_format = file_format or self.guess_format(path)
+
+        def report(result):
+            self.stdout.write(f"{result.rows} locations loaded ({result.rows_per_second:.0f} rows/s), {result.rejected} rejected")
+
+        try:
+            with open(path, "rb") as stream:
+                result = ingest_locations(
+                    iter_features(stream, file_format),
+                    source_srid=srid,
+                    batch_size=batch_size,
+                    on_batch=report,
+                )
+        except IngestInterrupted as e:
+            #the batches written before stay
+            raise CommandError(f"Invalid {file_format} file after {e.result.rows} locations: {e}")
+
+        for error in result.errors:
+            self.stdout.write(self.style.WARNING(error))
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {result.rows} locations in {result.seconds:.1f}s ({result.rows_per_second:.0f} rows/s), {result.rejected} rejected"
+        ))
+
+    @staticmethod
+    def guess_format(path:str) -> str:
+        extension = os.path.splitext(path)[1].lower()
+        return NDJSON if extension in [".ndjson", ".jsonl"] else GEOJSON
@@ -0,0 +1,13 @@
+import time
+from django.core.management.base import BaseCommand
+from common.utils.clusters import rebuild_clusters
+
+
+class Command(BaseCommand):
+    help = "Compute the location clusters again from all the locations (after a bulk QuerySet.update() or delete() of locations)"
+
+    def handle(self, *args, **options):
+        started_at = time.monotonic()
+        cells = rebuild_clusters()
+        elapsed = time.monotonic() - started_at
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {cells} location clusters in {elapsed:.1f}s"))
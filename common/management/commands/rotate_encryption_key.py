@@ -0,0 +1,69 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import List, Tuple
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from common.models import Key, get_cipher_suite
+
+
+_cipher_suite = None
+
+
+def _init_worker(encryption_key:str, old_encryption_keys:Tuple[str, ...]):
+    global _cipher_suite
+    _cipher_suite = get_cipher_suite(encryption_key, old_encryption_keys)
+
+
+def _rotate(encrypted_values:List[bytes]) -> List[bytes]:
+    #decrypt with any of the keys, encrypt again with the current one
+    return [_cipher_suite.rotate(value) for value in encrypted_values]
+
+
+class Command(BaseCommand):
+    help = "Re-encrypt all the Key values with ENCRIPTION_KEY, the previous keys being in ENCRIPTION_OLD_KEYS"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Number of keys read, re-encrypted and written at once")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of processes re-encrypting the values")
+
+    def handle(self, *args, chunk_size, workers, **options):
+        queryset = Key.objects.exclude(encrypted_value=None).only("id", "encrypted_value").order_by("pk")
+        total = queryset.count()
+        self.stdout.write(f"Re-encrypting {total} keys with {workers} workers")
+
+        done = 0
+        started_at = time.monotonic()
+        keys = queryset.iterator(chunk_size=chunk_size)
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(settings.ENCRIPTION_KEY, tuple(settings.ENCRIPTION_OLD_KEYS)),
+        ) as executor:
+            while True:
+                chunk = list(islice(keys, chunk_size))
+                if not chunk:
+                    break
+
+                #split the chunk between the workers
+                values = [key.encrypted_value_bytes for key in chunk]
+                batch_size = max(1, len(values) // workers)
+                batches = [values[i:i + batch_size] for i in range(0, len(values), batch_size)]
+                rotated = [value for batch in executor.map(_rotate, batches) for value in batch]
+
+                for key, value in zip(chunk, rotated):
+                    key.encrypted_value = value
+
+                #the plaintext values don't change, so the KeyManager caches stay valid
+                with transaction.atomic():
+                    Key.objects.bulk_update(chunk, ["encrypted_value"], batch_size=chunk_size)
+
+                done += len(chunk)
+                elapsed = max(time.monotonic() - started_at, 1e-6)
+                self.stdout.write(f"{done}/{total} keys re-encrypted ({done / elapsed:.0f} keys/s)")
+
+        elapsed = time.monotonic() - started_at
+        self.stdout.write(self.style.SUCCESS(f"Re-encrypted {done} keys in {elapsed:.1f}s"))
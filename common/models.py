@@ -1,14 +1,84 @@
+from functools import lru_cache
+from typing import Tuple
 from django.contrib.gis.db import models
+from django.contrib.postgres.indexes import GistIndex
+from django.db.models.functions import Cast
 
 from common.constants import GeoCts
-from cryptography.fernet import Fernet
+from common.utils.geohash import encode_geohash
+from cryptography.fernet import Fernet, MultiFernet
 from django.conf import settings
 # Create your models here.
 
+
+@lru_cache(maxsize=None)
+def get_cipher_suite(encryption_key:str, old_encryption_keys:Tuple[str, ...]=()) -> MultiFernet:
+    #building a Fernet derives its keys, so one instance is reused per set of encryption keys
+    #the first key encrypts, all of them can decrypt (values encrypted before a rotation)
+    return MultiFernet([Fernet(key.encode()) for key in (encryption_key, *old_encryption_keys)])
+
+
+def get_current_cipher_suite() -> MultiFernet:
+    return get_cipher_suite(settings.ENCRIPTION_KEY, tuple(settings.ENCRIPTION_OLD_KEYS))
+
+
 class Location(models.Model):
     label = models.TextField(null=True, blank=True)
     location = models.PointField(srid=GeoCts.DEFAULT_SRID)
-    
+    #kept in sync with location on save and by the ingestion, see backfill_location_geohashes for the older rows
+    geohash = models.CharField(max_length=GeoCts.GEOHASH_PRECISION, null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            #nearest locations (KNN) and radius filtering with distances in meters, see common.utils.geo
+            GistIndex(
+                Cast("location", models.GeographyField(srid=GeoCts.DEFAULT_SRID)),
+                name="location_geography_idx",
+            ),
+        ]
+
+    def set_geohash(self):
+        location = self.location
+        if location is None:
+            self.geohash = None
+            return
+        if location.srid not in [None, GeoCts.DEFAULT_SRID]:
+            location = location.transform(GeoCts.DEFAULT_SRID, clone=True)
+        self.geohash = encode_geohash(location.x, location.y, GeoCts.GEOHASH_PRECISION)
+
+    def save(self, *args, **kwargs):
+        self.set_geohash()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "location" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "geohash"}
+        super().save(*args, **kwargs)
+
+
+
+class LocationCluster(models.Model):
+    """
+    Number of locations and sum of their coordinates per geohash cell, for each of the CLUSTER_PRECISIONS,
+    so that the clusters of a map are read instead of aggregated from the locations.
+    Kept in sync by the Location signals and the ingestion, see common.utils.clusters
+    """
+    precision = models.PositiveSmallIntegerField()
+    cell = models.CharField(unique=True, max_length=GeoCts.CLUSTER_PRECISIONS[-1])
+    #bounds of the cell, never change
+    bounds = models.PolygonField(srid=GeoCts.DEFAULT_SRID, spatial_index=False)
+    count = models.BigIntegerField(default=0)
+    longitude_sum = models.FloatField(default=0)
+    latitude_sum = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            #cells of a bounding box at a precision, one small index per precision
+            GistIndex(
+                fields=["bounds"],
+                condition=models.Q(precision=precision),
+                name=f"locationcluster_bounds_{precision}_idx",
+            )
+            for precision in GeoCts.CLUSTER_PRECISIONS
+        ]
 
 
 class Key(models.Model):
@@ -18,18 +88,46 @@ class Key(models.Model):
     def __str__(self):
         return self.name
     
+    @property
+    def encrypted_value_bytes(self) -> bytes:
+        #postgres returns memoryview objects for binary fields
+        if not isinstance(self.encrypted_value, bytes):
+            return self.encrypted_value.tobytes()
+        return self.encrypted_value
+
     @property
     def value(self):
         if self.encrypted_value:
-            if not isinstance(self.encrypted_value, bytes):
-                encrypted_value_bytes = self.encrypted_value.tobytes()
-            else:
-                encrypted_value_bytes = self.encrypted_value
-            cipher_suite = Fernet(settings.ENCRIPTION_KEY.encode())
-            return cipher_suite.decrypt(encrypted_value_bytes).decode()
+            cipher_suite = get_current_cipher_suite()
+            return cipher_suite.decrypt(self.encrypted_value_bytes).decode()
         return None
     
     @value.setter
     def value(self, value):
-        cipher_suite = Fernet(settings.ENCRIPTION_KEY.encode())
+        cipher_suite = get_current_cipher_suite()
         self.encrypted_value = cipher_suite.encrypt(value.encode())
+
+
+class KeyGeneration(models.Model):
+    """
+    Single row counter bumped on every Key change.
+    Workers compare it with the generation their KeyManager cache was built from
+    """
+    version = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def current(cls) -> int:
+        return cls.objects.filter(pk=1).values_list("version", flat=True).first() or 0
+
+    @classmethod
+    async def acurrent(cls) -> int:
+        return await cls.objects.filter(pk=1).values_list("version", flat=True).afirst() or 0
+
+    @classmethod
+    def bump(cls):
+        updated = cls.objects.filter(pk=1).update(version=models.F("version") + 1)
+        if not updated:
+            _, created = cls.objects.get_or_create(pk=1, defaults={"version": 1})
+            if not created:
+                #another worker created the row in the meantime
+                cls.objects.filter(pk=1).update(version=models.F("version") + 1)
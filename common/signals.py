@@ -0,0 +1,62 @@
+import logging
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import DatabaseError, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from common.key_manager import KeyManager
+from common.models import Key, KeyGeneration, Location
+from common.utils.clusters import update_clusters
+from common.utils.tiles import invalidate_point_tiles
+
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(request_started)
+def warm_up_key_manager(sender, **kwargs):
+    #on the first request of each process (after the fork of the workers), the app loading doesn't query
+    #the db: it runs for every management command, before the test database exists or the tables are migrated
+    if not settings.KEY_MANAGER_WARM_UP:
+        return
+    try:
+        if KeyManager.warm_up_once():
+            logger.info(f"KeyManager warmed up with {KeyManager.stats()['size']} keys")
+    except DatabaseError as e:
+        #the keys are loaded on their first use instead
+        logger.warning(f"KeyManager warm up skipped: {e}")
+
+
+@receiver([post_save, post_delete], sender=Key)
+def bump_key_generation(sender, **kwargs):
+    #let the other workers know that their cached keys are stale
+    KeyGeneration.bump()
+
+
+@receiver(pre_save, sender=Location)
+def remember_previous_location(sender, instance, **kwargs):
+    #a moved location must also leave the tiles of its previous position
+    instance._previous_location = None
+    if instance.pk is not None:
+        instance._previous_location = Location.objects.filter(pk=instance.pk).values_list("location", flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Location)
+def drop_location_tiles(sender, instance, **kwargs):
+    #QuerySet.update() and delete() don't send these signals, call invalidate_all_tiles after them
+    points = [instance.location, getattr(instance, "_previous_location", None)]
+    #after the commit, a tile rendered before it would be cached again with the old rows otherwise
+    transaction.on_commit(lambda: invalidate_point_tiles(points))
+
+
+@receiver(post_save, sender=Location)
+def count_saved_location(sender, instance, created, **kwargs):
+    #QuerySet.update() doesn't send this signal, run rebuild_location_clusters after it
+    previous = getattr(instance, "_previous_location", None)
+    if created or previous is None or not previous.equals_exact(instance.location):
+        update_clusters(added=[instance.location], removed=[previous])
+
+
+@receiver(post_delete, sender=Location)
+def uncount_deleted_location(sender, instance, **kwargs):
+    update_clusters(removed=[instance.location])
@@ -1,3 +1,623 @@
-from django.test import TestCase
+import io
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from cryptography.fernet import Fernet, InvalidToken
+from django.apps import apps
+from django.contrib.gis.geos import Point, Polygon
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.management import call_command
+from django.core.validators import MinValueValidator
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from authentication.models import CustomUser
+from authentication.utils.jwt_token import get_tokens_for_user
+from common.checks import check_config_values
+from common.config import ConfigKey, ConfigRegistry
+from common.constants import GeoCts
+from common.key_manager import KeyManager
+from common.models import Key, Location, LocationCluster
+from common.utils.geo import cluster_locations, cluster_precision, nearest_locations
+from common.utils.geohash import encode_geohash, geohash_bounds
+from common.utils.ingest import GEOJSON, NDJSON, IngestInterrupted, ingest_locations, iter_features
+from common.utils.tiles import MVT_CONTENT_TYPE, get_tile, invalidate_point_tiles, point_tile
 
-# Create your tests here.
+
+ENCRYPTION_KEY = Fernet.generate_key().decode()
+
+
+def _point(longitude, latitude):
+    return Point(longitude, latitude, srid=GeoCts.DEFAULT_SRID)
+
+
+def _analyze(model):
+    #fresh statistics, the planner would assume an empty table
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+
+
+def _reset_key_manager():
+    KeyManager.invalidate()
+    #the generation is checked again by the next get
+    KeyManager._generation = None
+
+
+@override_settings(
+    ENCRIPTION_KEY=ENCRYPTION_KEY,
+    ENCRIPTION_OLD_KEYS=[],
+    #the generation is checked once, by the first get
+    KEY_MANAGER_REFRESH_INTERVAL=60*60,
+)
+class KeyManagerTest(TestCase):
+
+    def setUp(self):
+        Key.objects.create(name="A", value="1")
+        Key.objects.create(name="B", value="2")
+        _reset_key_manager()
+
+    def tearDown(self):
+        _reset_key_manager()
+
+    def _update(self, name, value):
+        #as another worker would, without going through this KeyManager
+        key = Key.objects.get(name=name)
+        key.value = value
+        key.save()
+
+    def test_value_cached(self):
+        #generation check and lookup
+        with self.assertNumQueries(2):
+            self.assertEqual(KeyManager.get("A"), "1")
+        with self.assertNumQueries(0):
+            self.assertEqual(KeyManager.get("A"), "1")
+
+    def test_missing_key_cached(self):
+        KeyManager.get("MISSING", "default")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(KeyManager.get("MISSING", "default"), "default")
+            #defaults are the caller's
+            self.assertEqual(KeyManager.get("MISSING", 5, value_type=int), 5)
+
+    def test_converted_value_cached(self):
+        with mock.patch.object(KeyManager, "_convert", wraps=KeyManager._convert) as convert:
+            self.assertEqual(KeyManager.get("A", value_type=int), 1)
+            self.assertEqual(KeyManager.get("A", value_type=int), 1)
+
+        self.assertEqual(convert.call_count, 1)
+
+    @override_settings(KEY_MANAGER_CACHE_TTL=0)
+    def test_expired_value_loaded_again(self):
+        KeyManager.get("A")
+
+        with self.assertNumQueries(1):
+            KeyManager.get("A")
+        self.assertGreaterEqual(KeyManager.stats()["expirations"], 1)
+
+    @override_settings(KEY_MANAGER_CACHE_MAX_SIZE=2)
+    def test_least_recently_used_evicted(self):
+        KeyManager.get("A")
+        KeyManager.get("B")
+        KeyManager.get("A")
+        KeyManager.get("MISSING")
+
+        with self.assertNumQueries(0):
+            KeyManager.get("A")
+        with self.assertNumQueries(1):
+            KeyManager.get("B")
+
+    def test_changes_of_other_workers_seen_after_the_refresh_interval(self):
+        KeyManager.get("A")
+        self._update("A", "updated")
+
+        self.assertEqual(KeyManager.get("A"), "1")
+
+        #the refresh interval elapsed
+        KeyManager._generation_checked_at = float("-inf")
+        self.assertEqual(KeyManager.get("A"), "updated")
+
+    def test_get_many_single_query(self):
+        KeyManager.get("A")
+
+        with self.assertNumQueries(1):
+            values = KeyManager.get_many({"A": (None, int), "B": (None, int), "MISSING": (3, int)})
+
+        self.assertEqual(values, {"A": 1, "B": 2, "MISSING": 3})
+
+    def test_warm_up(self):
+        self.assertEqual(KeyManager.warm_up(), 2)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(KeyManager.get("B"), "2")
+
+    def test_warm_up_on_the_first_request(self):
+        KeyManager._warmed_up = False
+
+        self.client.get("/")
+        with self.assertNumQueries(0):
+            self.assertEqual(KeyManager.get("B"), "2")
+
+        #once per process
+        KeyManager.invalidate()
+        self.client.get("/")
+        self.assertEqual(KeyManager.stats()["size"], 0)
+
+    def test_no_query_while_the_apps_load(self):
+        with self.assertNumQueries(0):
+            apps.get_app_config("common").ready()
+
+    async def test_aget(self):
+        self.assertEqual(await KeyManager.aget("A", value_type=int), 1)
+        self.assertEqual(await KeyManager.aget_many({"B": (None, str), "MISSING": ("x", str)}), {"B": "2", "MISSING": "x"})
+
+    def test_value_read_during_an_invalidation_not_cached(self):
+        KeyManager.get("B")
+        filter_keys = Key.objects.filter
+
+        def invalidated_meanwhile(*args, **kwargs):
+            #another thread sees a newer generation while this one reads the key
+            KeyManager._set_generation(KeyManager._generation + 1)
+            return filter_keys(*args, **kwargs)
+
+        with mock.patch.object(Key.objects, "filter", side_effect=invalidated_meanwhile):
+            self.assertEqual(KeyManager.get("A"), "1")
+
+        with self.assertNumQueries(1):
+            self.assertEqual(KeyManager.get("A"), "1")
+
+    def test_concurrent_gets(self):
+        KeyManager.warm_up()
+        hits = KeyManager.stats()["hits"]
+
+        def get(i):
+            return KeyManager.get("A" if i % 2 else "B", value_type=int)
+
+        #cache hits only, the threads have their own connection which doesn't see the test data
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            values = list(executor.map(get, range(800)))
+
+        self.assertEqual(values, [2, 1] * 400)
+        self.assertEqual(KeyManager.stats()["hits"] - hits, 800)
+
+
+@override_settings(
+    ENCRIPTION_KEY=ENCRYPTION_KEY,
+    ENCRIPTION_OLD_KEYS=[],
+    KEY_MANAGER_REFRESH_INTERVAL=60*60,
+)
+class ConfigRegistryTest(TestCase):
+
+    def setUp(self):
+        _reset_key_manager()
+        self.registry = ConfigRegistry()
+        self.registry.register(ConfigKey(name="RETRIES", value_type=int, default=3, validators=[MinValueValidator(1)]))
+
+    def tearDown(self):
+        _reset_key_manager()
+
+    def test_typed_value(self):
+        self.assertEqual(self.registry.RETRIES, 3)
+
+        Key.objects.create(name="RETRIES", value="5")
+        _reset_key_manager()
+
+        self.assertEqual(self.registry.RETRIES, 5)
+
+    def test_unknown_key(self):
+        with self.assertRaises(AttributeError):
+            self.registry.UNKNOWN
+
+    def test_registered_twice(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.registry.register(ConfigKey(name="RETRIES"))
+
+    def test_invalid_default(self):
+        self.registry.register(ConfigKey(name="DELAY", value_type=int, default="1"))
+
+        with self.assertRaises(ImproperlyConfigured):
+            self.registry.compile()
+
+    def test_invalid_value(self):
+        with self.assertRaises(ValidationError):
+            self.registry.validate("RETRIES", "0")
+        with self.assertRaises(ValidationError):
+            self.registry.validate("RETRIES", "many")
+
+    def test_invalid_stored_value(self):
+        Key.objects.create(name="RETRIES", value="0")
+
+        self.assertEqual(len(self.registry.invalid_values()), 1)
+
+    def test_invalid_stored_value_reported_by_the_checks(self):
+        with mock.patch("common.config.config", self.registry):
+            self.assertEqual(check_config_values(None, databases=["default"]), [])
+
+            Key.objects.create(name="RETRIES", value="many")
+            _reset_key_manager()
+
+            errors = check_config_values(None, databases=["default"])
+            #not run without databases, e.g. by runserver and the other commands
+            self.assertEqual(check_config_values(None), [])
+
+        self.assertEqual([error.id for error in errors], ["common.E001"])
+        self.assertIn("RETRIES", errors[0].msg)
+
+
+class KeyEncryptionTest(TestCase):
+
+    def setUp(self):
+        _reset_key_manager()
+        self.old_key, self.new_key = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+        with override_settings(ENCRIPTION_KEY=self.old_key, ENCRIPTION_OLD_KEYS=[]):
+            Key.objects.create(name="SECRET", value="value")
+
+    def tearDown(self):
+        _reset_key_manager()
+
+    def test_value_encrypted(self):
+        key = Key.objects.get(name="SECRET")
+
+        self.assertNotIn(b"value", key.encrypted_value_bytes)
+
+    def test_old_key_still_decrypts(self):
+        with override_settings(ENCRIPTION_KEY=self.new_key, ENCRIPTION_OLD_KEYS=[self.old_key]):
+            self.assertEqual(Key.objects.get(name="SECRET").value, "value")
+
+    def test_rotation(self):
+        with override_settings(ENCRIPTION_KEY=self.new_key, ENCRIPTION_OLD_KEYS=[self.old_key]):
+            call_command("rotate_encryption_key", workers=1, stdout=io.StringIO())
+
+        #the old key can be dropped
+        with override_settings(ENCRIPTION_KEY=self.new_key, ENCRIPTION_OLD_KEYS=[]):
+            self.assertEqual(Key.objects.get(name="SECRET").value, "value")
+        with override_settings(ENCRIPTION_KEY=self.old_key, ENCRIPTION_OLD_KEYS=[]):
+            with self.assertRaises(InvalidToken):
+                Key.objects.get(name="SECRET").value
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class NearestLocationsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        user = CustomUser.objects.create_user(phone_number="+237600000001", password="secret-password")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {get_tokens_for_user(user)['access']}")
+
+        #along the equator, about 111 km per degree
+        self.locations = [
+            Location.objects.create(label=f"{i}", location=_point(i * 0.01, 0))
+            for i in range(5)
+        ]
+
+    def _nearest(self, **params):
+        response = self.client.get(reverse("locations-nearest"), {"latitude": 0, "longitude": 0, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_nearest_first(self):
+        data = self._nearest(limit=3)
+
+        self.assertEqual([location["label"] for location in data["results"]], ["0", "1", "2"])
+        #geography distances, in meters
+        self.assertAlmostEqual(data["results"][1]["distance"], 1113, delta=5)
+
+    def test_radius(self):
+        data = self._nearest(radius=2500)
+
+        self.assertEqual([location["label"] for location in data["results"]], ["0", "1", "2"])
+        self.assertIsNone(data["next"])
+
+    def test_radius_measured_like_the_distance(self):
+        #along the equator the spheroid distances are about 0.1% (5 m here) longer than the sphere ones
+        distance = self._nearest(limit=5)["results"][4]["distance"]
+
+        data = self._nearest(radius=distance + 0.5)
+
+        self.assertEqual([location["label"] for location in data["results"]], ["0", "1", "2", "3", "4"])
+
+    def test_cursor_pagination(self):
+        labels = []
+        params = {"limit": 2}
+        while True:
+            data = self._nearest(**params)
+            labels += [location["label"] for location in data["results"]]
+            if data["next"] is None:
+                break
+            params["cursor"] = data["next"]
+
+        self.assertEqual(labels, ["0", "1", "2", "3", "4"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("locations-nearest"), {"latitude": 0, "longitude": 0, "cursor": "invalid"})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_knn_uses_the_geography_index(self):
+        #enough locations for the planner to prefer the index to a sort of all the rows
+        rng = random.Random(0)
+        ingest_locations(
+            _feature(rng.uniform(-180, 180), rng.uniform(-85, 85), "random")
+            for _ in range(5000)
+        )
+        _analyze(Location)
+
+        plan = nearest_locations(_point(0, 0), limit=10, radius=5000).explain()
+
+        self.assertIn("location_geography_idx", plan, msg=plan)
+
+
+def _feature(longitude, latitude, name):
+    return {"type": "Feature", "geometry": {"type": "Point", "coordinates": [longitude, latitude]}, "properties": {"name": name}}
+
+
+class LocationIngestTest(TestCase):
+
+    def test_geojson_by_batches(self):
+        collection = {"type": "FeatureCollection", "features": [_feature(i, i, f"{i}") for i in range(5)]}
+        batches = []
+
+        result = ingest_locations(
+            iter_features(io.BytesIO(json.dumps(collection).encode()), GEOJSON),
+            batch_size=2,
+            on_batch=lambda result: batches.append(result.rows),
+        )
+
+        self.assertEqual((result.rows, result.rejected), (5, 0))
+        self.assertEqual(batches, [2, 4, 5])
+        self.assertEqual(Location.objects.get(label="3").location.coords, (3, 3))
+
+    def test_ndjson_invalid_features_rejected(self):
+        lines = [
+            json.dumps(_feature(1, 1, "valid")),
+            "not json",
+            json.dumps(_feature(200, 1, "out of range")),
+            json.dumps({"type": "LineString", "coordinates": [[0, 0], [1, 1]]}),
+        ]
+
+        result = ingest_locations(iter_features(io.BytesIO("\n".join(lines).encode()), NDJSON))
+
+        self.assertEqual((result.rows, result.rejected), (1, 3))
+        self.assertEqual(len(result.errors), 3)
+        self.assertEqual(list(Location.objects.values_list("label", flat=True)), ["valid"])
+
+    def test_reprojection(self):
+        #web mercator
+        result = ingest_locations([_feature(1113194.9, 0, "mercator")], source_srid=3857)
+
+        self.assertEqual(result.rows, 1)
+        self.assertAlmostEqual(Location.objects.get().location.x, 10, places=3)
+
+    def test_truncated_stream(self):
+        body = json.dumps({"type": "FeatureCollection", "features": [_feature(i, i, f"{i}") for i in range(3)]})[:-10]
+
+        with self.assertRaises(IngestInterrupted) as context:
+            ingest_locations(iter_features(io.BytesIO(body.encode()), GEOJSON), batch_size=1)
+
+        #the features read before the failure are written
+        self.assertEqual(context.exception.result.rows, 2)
+        self.assertEqual(Location.objects.count(), 2)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class LocationIngestViewTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        user = CustomUser.objects.create_user(phone_number="+237600000001", password="secret-password", is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {get_tokens_for_user(user)['access']}")
+
+    def _ingest(self, body:bytes):
+        return self.client.generic("POST", reverse("locations-ingest"), body, content_type="application/geo+json")
+
+    def test_ingest(self):
+        response = self._ingest(json.dumps({"type": "FeatureCollection", "features": [_feature(1, 1, "a")]}).encode())
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data["rows"], 1)
+
+    def test_empty_body(self):
+        response = self._ingest(b"")
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_truncated_body(self):
+        body = json.dumps({"type": "FeatureCollection", "features": [_feature(i, i, f"{i}") for i in range(3)]})[:-10]
+
+        response = self._ingest(body.encode())
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["rows"], 2)
+        self.assertIn("detail", response.data)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class LocationTilesTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        user = CustomUser.objects.create_user(phone_number="+237600000001", password="secret-password")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {get_tokens_for_user(user)['access']}")
+        self.location = Location.objects.create(label="paris", location=_point(2.35, 48.85))
+
+    def _tile(self, z, x, y):
+        return self.client.get(reverse("locations-tile", kwargs={"z": z, "x": x, "y": y}))
+
+    def test_point_tile(self):
+        self.assertEqual(point_tile(0, 0, 0), (0, 0))
+        self.assertEqual(point_tile(2.35, 48.85, 10), (518, 352))
+        self.assertIsNone(point_tile(0, 89, 1))
+
+    def test_tile(self):
+        response = self._tile(10, 518, 352)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], MVT_CONTENT_TYPE)
+        self.assertIn(b"paris", response.content)
+        self.assertEqual(self._tile(10, 0, 0).content, b"")
+
+    def test_invalid_tile(self):
+        self.assertEqual(self._tile(1, 2, 0).status_code, 404)
+
+    def test_cached_until_a_location_changes(self):
+        self._tile(10, 518, 352)
+        with CaptureQueriesContext(connection) as queries:
+            self._tile(10, 518, 352)
+        self.assertFalse([query for query in queries if "ST_AsMVT" in query["sql"]])
+
+        #moved to another tile, both tiles are rendered again once committed
+        self.location.location = _point(-0.12, 51.5)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.location.save()
+            self.assertIn(b"paris", self._tile(10, 518, 352).content)
+
+        self.assertNotIn(b"paris", self._tile(10, 518, 352).content)
+        self.assertIn(b"paris", self._tile(*((10,) + point_tile(-0.12, 51.5, 10))).content)
+
+    def test_ingestion_drops_the_cached_tiles(self):
+        self._tile(10, 518, 352)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_locations([_feature(2.36, 48.86, "louvre")])
+
+        self.assertIn(b"louvre", self._tile(10, 518, 352).content)
+
+    def test_render_racing_with_an_invalidation_is_not_served(self):
+        def render(z, x, y):
+            #the location moves while the tile is rendered from the previous rows
+            invalidate_point_tiles([self.location.location])
+            return b"stale"
+
+        with mock.patch("common.utils.tiles.render_tile", side_effect=render):
+            self.assertEqual(get_tile(10, 518, 352), b"stale")
+
+        self.assertIn(b"paris", get_tile(10, 518, 352))
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class LocationClustersTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        user = CustomUser.objects.create_user(phone_number="+237600000001", password="secret-password")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {get_tokens_for_user(user)['access']}")
+
+    def _clusters(self, zoom, west=-180, south=-90, east=180, north=90):
+        response = self.client.get(reverse("locations-clusters"), {
+            "zoom": zoom, "west": west, "south": south, "east": east, "north": north,
+        })
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_encode_geohash(self):
+        self.assertEqual(encode_geohash(-5.6, 42.6, 5), "ezs42")
+        self.assertEqual(encode_geohash(10.40744, 57.64911, 11), "u4pruydqqvj")
+
+    def test_geohash_kept_in_sync(self):
+        location = Location.objects.create(label="paris", location=_point(2.35, 48.85))
+        self.assertEqual(location.geohash, encode_geohash(2.35, 48.85))
+
+        location.location = _point(-0.12, 51.5)
+        location.save(update_fields=["location"])
+
+        location.refresh_from_db()
+        self.assertEqual(location.geohash, encode_geohash(-0.12, 51.5))
+
+    def test_ingestion_sets_the_geohash(self):
+        ingest_locations([_feature(2.35, 48.85, "paris")])
+
+        self.assertEqual(Location.objects.get().geohash, encode_geohash(2.35, 48.85))
+
+    def test_clusters(self):
+        for longitude, latitude in [(2.35, 48.85), (2.36, 48.86), (-0.12, 51.5)]:
+            Location.objects.create(location=_point(longitude, latitude))
+
+        data = self._clusters(zoom=4)
+
+        self.assertEqual(data["precision"], cluster_precision(4))
+        counts = sorted(cluster["count"] for cluster in data["results"])
+        self.assertEqual(counts, [1, 2])
+        paris = max(data["results"], key=lambda cluster: cluster["count"])
+        self.assertAlmostEqual(paris["longitude"], 2.355)
+        self.assertAlmostEqual(paris["latitude"], 48.855)
+
+    def test_bounding_box(self):
+        Location.objects.create(location=_point(2.35, 48.85))
+        Location.objects.create(location=_point(-74, 40.7))
+
+        data = self._clusters(zoom=4, west=-10, south=30, east=30, north=60)
+
+        self.assertEqual([cluster["count"] for cluster in data["results"]], [1])
+
+    def test_invalid_bounding_box(self):
+        response = self.client.get(reverse("locations-clusters"), {"zoom": 4, "west": 10, "south": 0, "east": 0, "north": 10})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_moved_and_deleted_locations(self):
+        location = Location.objects.create(location=_point(2.35, 48.85))
+        location.location = _point(-74, 40.7)
+        location.save()
+
+        data = self._clusters(zoom=4)
+        self.assertEqual([(cluster["count"], round(cluster["longitude"])) for cluster in data["results"]], [(1, -74)])
+
+        location.delete()
+        self.assertEqual(self._clusters(zoom=4)["results"], [])
+
+    def test_ingestion_counts_the_locations(self):
+        ingest_locations([_feature(2.35, 48.85, "paris"), _feature(2.36, 48.86, "paris")], batch_size=1)
+
+        data = self._clusters(zoom=4)
+
+        self.assertEqual([cluster["count"] for cluster in data["results"]], [2])
+
+    def test_rebuild(self):
+        for longitude, latitude in [(2.35, 48.85), (2.36, 48.86), (-0.12, 51.5)]:
+            Location.objects.create(location=_point(longitude, latitude))
+        clusters = {precision: list(cluster_locations(precision, (-180, -90, 180, 90))) for precision in GeoCts.CLUSTER_PRECISIONS}
+        #as after a QuerySet.update() of the locations
+        LocationCluster.objects.update(count=0, longitude_sum=0, latitude_sum=0)
+
+        call_command("rebuild_location_clusters", stdout=io.StringIO())
+
+        for precision, expected in clusters.items():
+            rebuilt = list(cluster_locations(precision, (-180, -90, 180, 90)))
+            self.assertEqual([(c["cell"], c["count"]) for c in rebuilt], [(c["cell"], c["count"]) for c in expected])
+            for cluster, expected_cluster in zip(rebuilt, expected):
+                self.assertAlmostEqual(cluster["longitude"], expected_cluster["longitude"])
+                self.assertAlmostEqual(cluster["latitude"], expected_cluster["latitude"])
+
+    def test_geohash_bounds(self):
+        west, south, east, north = geohash_bounds("u09")
+
+        self.assertTrue(encode_geohash(2.35, 48.85).startswith("u09"))
+        self.assertTrue(west <= 2.35 < east and south <= 48.85 < north)
+        self.assertAlmostEqual(east - west, 360 / 2 ** 8)
+        self.assertAlmostEqual(north - south, 180 / 2 ** 7)
+
+    def test_clusters_read_from_the_cell_index(self):
+        #the cells of a few areas at every precision, as many as a populated map would have
+        cells = set()
+        rng = random.Random(0)
+        for _ in range(2000):
+            geohash = encode_geohash(rng.uniform(-180, 180), rng.uniform(-85, 85))
+            cells.update(geohash[:precision] for precision in GeoCts.CLUSTER_PRECISIONS)
+        LocationCluster.objects.bulk_create([
+            LocationCluster(precision=len(cell), cell=cell, bounds=Polygon.from_bbox(geohash_bounds(cell)), count=1)
+            for cell in cells
+        ])
+        _analyze(LocationCluster)
+
+        plan = cluster_locations(4, (-10, 30, 30, 60)).explain()
+
+        self.assertIn("locationcluster_bounds_4_idx", plan, msg=plan)
+        #the locations are neither read nor aggregated
+        self.assertNotIn("Aggregate", plan, msg=plan)
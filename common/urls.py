@@ -0,0 +1,19 @@
+from django.urls import path
+from rest_framework import routers
+from rest_framework.permissions import IsAuthenticated
+
+from common.api.views import ConfigViewSet, LocationViewSet
+
+router = routers.SimpleRouter()
+
+router.register(r"config" , ConfigViewSet , basename="config")
+router.register(r"locations" , LocationViewSet , basename="locations")
+
+urlpatterns = router.urls + [
+    #no trailing slash after the .mvt extension
+    path(
+        "locations/tiles/<int:z>/<int:x>/<int:y>.mvt",
+        LocationViewSet.as_view({"get": "tile"}, permission_classes=[IsAuthenticated]),
+        name="locations-tile",
+    ),
+]
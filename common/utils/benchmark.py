@@ -0,0 +1,82 @@
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable, List
+from django.db import connection
+from common.models import Location
+from common.utils.ingest import IngestResult, ingest_locations
+
+
+#label of the synthetic locations
+SYNTHETIC_LABEL = "benchmark"
+
+
+@dataclass
+class Timings:
+    """
+    Durations (in seconds) of the calls of a benchmark
+    """
+    durations: List[float]
+
+    @property
+    def per_second(self) -> float:
+        return len(self.durations) / max(sum(self.durations), 1e-9)
+
+    def percentile(self, p:float) -> float:
+        durations = sorted(self.durations)
+        return durations[min(int(len(durations) * p / 100), len(durations) - 1)]
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.durations)} calls, {self.per_second:,.0f}/s, "
+            f"p50 {format_duration(self.percentile(50))}, p99 {format_duration(self.percentile(99))}, "
+            f"max {format_duration(max(self.durations))}"
+        )
+
+
+def measure(func:Callable[[int], object], iterations:int, warm_up:int=0) -> Timings:
+    """
+    This function helps to time `iterations` calls of func (given the call number),
+    after `warm_up` calls which are not timed
+    """
+    for i in range(warm_up):
+        func(i)
+
+    durations = []
+    for i in range(iterations):
+        started_at = time.perf_counter()
+        func(i)
+        durations.append(time.perf_counter() - started_at)
+    return Timings(durations)
+
+
+def format_duration(seconds:float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f}µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f}ms"
+    return f"{seconds:.2f}s"
+
+
+def generate_locations(points:int, rng:random.Random) -> IngestResult:
+    """
+    This function helps to add the synthetic locations missing to reach `points` of them,
+    spread uniformly over the web mercator latitudes
+    """
+    missing = points - Location.objects.filter(label=SYNTHETIC_LABEL).count()
+    features = (
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [rng.uniform(-180, 180), rng.uniform(-85, 85)]},
+            "properties": {"label": SYNTHETIC_LABEL},
+        }
+        for _ in range(max(missing, 0))
+    )
+    #COPY by batches
+    result = ingest_locations(features, batch_size=10_000)
+
+    if result.rows:
+        #fresh statistics for the planner
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {connection.ops.quote_name(Location._meta.db_table)}")
+    return result
@@ -0,0 +1,37 @@
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+
+def is_shared_cache(alias:str) -> bool:
+    """
+    This function helps to know if a cache is shared by all the processes (web workers, celery),
+    the memory cache is per process and the dummy cache keeps nothing
+    """
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+def incr_with_ttl(cache:BaseCache, key:str, delta:int, timeout:float) -> int:
+    """
+    This function helps to add delta to a counter in a single atomic operation, creating it with the timeout when missing.
+    BaseCache.incr checks that the key exists then increments it, a key expiring in between would be
+    created again by redis without any expiry
+    """
+    if isinstance(cache, RedisCache):
+        key = cache.make_and_validate_key(key)
+        client = cache._cache.get_client(key, write=True)
+        #MULTI/EXEC, the counter can't expire between the two commands
+        with client.pipeline() as pipeline:
+            pipeline.set(key, 0, ex=int(timeout), nx=True)
+            pipeline.incrby(key, delta)
+            return pipeline.execute()[-1]
+
+    #the other backends increment under a lock, only the expiry between add and incr has to be handled
+    cache.add(key, 0, timeout=timeout)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.set(key, delta, timeout=timeout)
+        return delta
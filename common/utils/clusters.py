@@ -0,0 +1,85 @@
+from typing import Dict, Iterable, List, Optional
+from django.contrib.gis.geos import Point
+from django.db import connection, transaction
+from common.constants import GeoCts
+from common.models import Location, LocationCluster
+from common.utils.geohash import encode_geohash, geohash_bounds
+
+
+#cells written by one INSERT
+UPSERT_BATCH_SIZE = 1000
+
+def _coordinates(point:Point):
+    if point.srid not in [None, GeoCts.DEFAULT_SRID]:
+        point = point.transform(GeoCts.DEFAULT_SRID, clone=True)
+    return point.x, point.y
+
+
+def update_clusters(added:Iterable[Optional[Point]]=(), removed:Iterable[Optional[Point]]=()):
+    """
+    This function helps to count added locations in the cells containing them (one per precision)
+    and removed ones out of them, by atomic increments of the LocationCluster rows
+    """
+    #cell: [count, longitude sum, latitude sum]
+    deltas: Dict[str, List[float]] = {}
+    for sign, points in [(1, added), (-1, removed)]:
+        for point in points:
+            if point is None:
+                continue
+            longitude, latitude = _coordinates(point)
+            geohash = encode_geohash(longitude, latitude, GeoCts.CLUSTER_PRECISIONS[-1])
+            for precision in GeoCts.CLUSTER_PRECISIONS:
+                delta = deltas.setdefault(geohash[:precision], [0, 0.0, 0.0])
+                delta[0] += sign
+                delta[1] += sign * longitude
+                delta[2] += sign * latitude
+
+    #a location moved inside its cell only changes the sums
+    rows = [(cell, *delta) for cell, delta in deltas.items() if any(delta)]
+    if rows:
+        _upsert_clusters(rows)
+
+
+def _upsert_clusters(rows:list):
+    table = connection.ops.quote_name(LocationCluster._meta.db_table)
+    #always in the same order, two writers can't lock the same rows the other way around
+    rows = sorted(rows)
+
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[i:i + UPSERT_BATCH_SIZE]
+            values = ", ".join([f"(%s, %s, ST_MakeEnvelope(%s, %s, %s, %s, {GeoCts.DEFAULT_SRID}), %s, %s, %s)"] * len(batch))
+            params = []
+            for cell, count, longitude_sum, latitude_sum in batch:
+                params += [len(cell), cell, *geohash_bounds(cell), count, longitude_sum, latitude_sum]
+
+            cursor.execute(
+                f"INSERT INTO {table} (precision, cell, bounds, count, longitude_sum, latitude_sum) VALUES {values} "
+                f"ON CONFLICT (cell) DO UPDATE SET "
+                f"count = {table}.count + EXCLUDED.count, "
+                f"longitude_sum = {table}.longitude_sum + EXCLUDED.longitude_sum, "
+                f"latitude_sum = {table}.latitude_sum + EXCLUDED.latitude_sum",
+                params,
+            )
+
+
+def rebuild_clusters() -> int:
+    """
+    This function helps to compute the clusters again from all the locations (for the locations saved before
+    the clusters existed, or changed by QuerySet.update()/delete() which skip the signals), returns the number of cells
+    """
+    table = connection.ops.quote_name(LocationCluster._meta.db_table)
+    locations = connection.ops.quote_name(Location._meta.db_table)
+    count = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table}")
+        for precision in GeoCts.CLUSTER_PRECISIONS:
+            #a full aggregate of the locations, run once instead of for every map
+            cursor.execute(
+                f"INSERT INTO {table} (precision, cell, bounds, count, longitude_sum, latitude_sum) "
+                f"SELECT %s, cell, ST_SetSRID(ST_GeomFromGeoHash(cell), {GeoCts.DEFAULT_SRID}), COUNT(*), SUM(ST_X(location)), SUM(ST_Y(location)) "
+                f"FROM (SELECT ST_GeoHash(location, %s) AS cell, location FROM {locations}) AS cells GROUP BY cell",
+                [precision, precision],
+            )
+            count += cursor.rowcount
+    return count
@@ -0,0 +1,97 @@
+import base64
+from typing import Optional, Tuple
+from django.contrib.gis.db.models import GeographyField
+from django.contrib.gis.geos import Point, Polygon
+from django.db.models import BooleanField, ExpressionWrapper, F, FloatField, Func, Q, QuerySet, Value
+from django.db.models.functions import Cast
+from common.constants import GeoCts
+from common.models import Location, LocationCluster
+
+
+def as_geography(expression):
+    #same expression as the Location geography index, so that the index is used
+    return Cast(expression, GeographyField(srid=GeoCts.DEFAULT_SRID))
+
+
+class KNNDistance(Func):
+    """
+    PostGIS <-> operator, on geographies the distance in meters between the points.
+    Ordering by it walks a gist index (KNN) instead of computing the distance to every row
+    """
+    arg_joiner = " <-> "
+    template = "(%(expressions)s)"
+    output_field = FloatField()
+
+
+class DWithin(Func):
+    """
+    ST_DWithin on geographies, the distance is in meters and uses the gist index.
+    Takes use_spheroid as last argument, true by default where <-> is on the sphere
+    """
+    function = "ST_DWithin"
+    output_field = BooleanField()
+
+
+def nearest_locations(
+    point:Point,
+    limit:int,
+    radius:Optional[float]=None,
+    after:Optional[Tuple[float, int]]=None,
+) -> QuerySet:
+    """
+    This function helps to get the `limit` nearest locations of a point, with their distance (in meters),
+    optionally within `radius` meters and after the (distance, id) of the last location of the previous page
+    """
+    location = as_geography(F("location"))
+    target = as_geography(Value(point.ewkt))
+
+    locations = Location.objects.annotate(distance=KNNDistance(location, target))
+    if radius is not None:
+        #on the sphere like the distance, a location at the edge would be filtered out while its distance is below the radius
+        locations = locations.filter(DWithin(location, target, Value(radius), Value(False)))
+    if after is not None:
+        distance, location_id = after
+        locations = locations.filter(Q(distance__gt=distance) | Q(distance=distance, id__gt=location_id))
+
+    return locations.order_by("distance", "id")[:limit]
+
+
+def encode_cursor(distance:float, location_id:int) -> str:
+    return base64.urlsafe_b64encode(f"{distance!r}:{location_id}".encode()).decode()
+
+
+def decode_cursor(cursor:str) -> Tuple[float, int]:
+    """
+    Raises ValueError when the cursor is invalid
+    """
+    distance, location_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+    return float(distance), int(location_id)
+
+
+def cluster_precision(zoom:int) -> int:
+    """
+    This function helps to get the geohash length of the clusters at a map zoom level,
+    about 8x8 cells per 256px tile
+    """
+    #each geohash character splits a cell by 32 (5 bits), each zoom level splits a tile by 2 on both axes
+    precision = round((zoom + 3) * 2 / 5)
+    return min(max(precision, GeoCts.CLUSTER_PRECISIONS[0]), GeoCts.CLUSTER_PRECISIONS[-1])
+
+
+def cluster_locations(precision:int, bbox:Tuple[float, float, float, float]) -> QuerySet:
+    """
+    This function helps to get the geohash cells of `precision` characters overlapping a bounding box
+    (west, south, east, north), with the number of locations of each cell and their centroid.
+    The cells are counted beforehand (see LocationCluster), only the cells of the box are read through
+    the index of their precision
+    """
+    return (
+        LocationCluster.objects
+        .filter(precision=precision, bounds__bboverlaps=Polygon.from_bbox(bbox), count__gt=0)
+        .annotate(
+            longitude=ExpressionWrapper(F("longitude_sum") / F("count"), output_field=FloatField()),
+            latitude=ExpressionWrapper(F("latitude_sum") / F("count"), output_field=FloatField()),
+        )
+        .values("cell", "count", "longitude", "latitude")
+        .order_by("cell")
+    )
@@ -0,0 +1,59 @@
+from typing import Tuple
+
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode_geohash(longitude:float, latitude:float, precision:int=12) -> str:
+    """
+    This function helps to get the geohash of a point (same as PostGIS ST_GeoHash),
+    each leading character is a bigger cell containing the point
+    """
+    longitude_range = [-180.0, 180.0]
+    latitude_range = [-90.0, 90.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    #even bits split the longitudes, odd ones the latitudes
+    even = True
+
+    while len(geohash) < precision:
+        value, interval = (longitude, longitude_range) if even else (latitude, latitude_range)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(geohash)
+
+
+def geohash_bounds(geohash:str) -> Tuple[float, float, float, float]:
+    """
+    This function helps to get the (west, south, east, north) bounds of a geohash cell
+    """
+    longitude_range = [-180.0, 180.0]
+    latitude_range = [-90.0, 90.0]
+    even = True
+
+    for character in geohash:
+        bits = _BASE32.index(character)
+        for shift in range(4, -1, -1):
+            interval = longitude_range if even else latitude_range
+            middle = (interval[0] + interval[1]) / 2
+            if bits >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+
+    return longitude_range[0], latitude_range[0], longitude_range[1], latitude_range[1]
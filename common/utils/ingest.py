@@ -0,0 +1,253 @@
+import codecs
+import io
+import json
+import math
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, List, Optional
+from django.contrib.gis.gdal import CoordTransform, SpatialReference
+from django.contrib.gis.geos import Point
+from django.db import connection, transaction
+from common.constants import GeoCts
+from common.models import Location
+from common.utils.clusters import update_clusters
+from common.utils.tiles import invalidate_all_tiles
+
+
+GEOJSON = "geojson"
+NDJSON = "ndjson"
+FORMATS = [GEOJSON, NDJSON]
+
+#first errors kept in the result
+MAX_REPORTED_ERRORS = 10
+
+_FEATURES_START = re.compile(r'"features"\s*:\s*\[')
+_SEPARATORS = re.compile(r"[\s,]*")
+
+
+class InvalidFeature(ValueError):
+    pass
+
+
+@dataclass
+class IngestResult:
+    rows: int = 0
+    rejected: int = 0
+    seconds: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / max(self.seconds, 1e-6)
+
+
+class IngestInterrupted(Exception):
+    """
+    The stream failed after some locations were written, `result` holds them
+    """
+
+    def __init__(self, message:str, result:IngestResult):
+        super().__init__(message)
+        self.result = result
+
+
+def iter_ndjson_features(stream:Iterable[bytes]) -> Iterator[dict]:
+    """
+    One GeoJSON feature (or geometry) per line, an invalid line is yielded as an InvalidFeature
+    so that the next lines are still read
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield InvalidFeature(f"Invalid JSON line: {e}")
+
+
+def iter_geojson_features(stream, read_size:int=64 * 1024) -> Iterator[dict]:
+    """
+    The features of a FeatureCollection, decoded one at a time from a binary stream,
+    only a read_size window of the file is in memory besides the feature being decoded
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    eof = False
+
+    def read_more():
+        nonlocal buffer, position, eof
+        chunk = stream.read(read_size)
+        eof = not chunk
+        buffer = buffer[position:] + text_decoder.decode(chunk or b"", final=eof)
+        position = 0
+
+    #skip everything up to the features array
+    while True:
+        match = _FEATURES_START.search(buffer)
+        if match:
+            position = match.end()
+            break
+        if eof:
+            raise InvalidFeature("No features array found")
+        #the key may be split between two reads
+        position = max(0, len(buffer) - 32)
+        read_more()
+
+    while True:
+        position = _SEPARATORS.match(buffer, position).end()
+        if position == len(buffer):
+            if eof:
+                raise InvalidFeature("Unterminated features array")
+            read_more()
+            continue
+        if buffer[position] == "]":
+            return
+
+        try:
+            feature, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise InvalidFeature(f"Invalid feature: {e}")
+            #the feature continues in the next read
+            read_more()
+            continue
+        position = end
+        yield feature
+
+
+def iter_features(stream, file_format:str) -> Iterator[dict]:
+    if file_format == NDJSON:
+        return iter_ndjson_features(stream)
+    return iter_geojson_features(stream)
+
+
+def get_transform(source_srid:int) -> Optional[CoordTransform]:
+    if source_srid == GeoCts.DEFAULT_SRID:
+        return None
+    return CoordTransform(SpatialReference(source_srid), SpatialReference(GeoCts.DEFAULT_SRID))
+
+
+def to_location(feature, source_srid:int, transform:Optional[CoordTransform]) -> Location:
+    """
+    This function helps to build a Location from a GeoJSON Point feature (or geometry), reprojected to DEFAULT_SRID.
+    The label is the "label" (or "name") property
+    """
+    if isinstance(feature, InvalidFeature):
+        raise feature
+    if not isinstance(feature, dict):
+        raise InvalidFeature("A feature must be an object")
+
+    if feature.get("type") == "Feature":
+        geometry = feature.get("geometry")
+        properties = feature.get("properties") or {}
+    else:
+        geometry = feature
+        properties = {}
+
+    if not isinstance(geometry, dict) or geometry.get("type") != "Point":
+        raise InvalidFeature("Only Point geometries are supported")
+
+    coordinates = geometry.get("coordinates")
+    if (
+        not isinstance(coordinates, list)
+        or len(coordinates) < 2
+        or not all(_is_number(value) for value in coordinates[:2])
+    ):
+        raise InvalidFeature(f"Invalid coordinates: {coordinates!r}")
+
+    point = Point(coordinates[0], coordinates[1], srid=source_srid)
+    if transform is not None:
+        point.transform(transform)
+    if not (-180 <= point.x <= 180 and -90 <= point.y <= 90):
+        raise InvalidFeature(f"Coordinates out of range: {coordinates!r}")
+
+    label = properties.get("label", properties.get("name"))
+    location = Location(label=None if label is None else str(label), location=point)
+    #bulk writes skip Location.save
+    location.set_geohash()
+    return location
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def ingest_locations(
+    features:Iterable[dict],
+    source_srid:int=GeoCts.DEFAULT_SRID,
+    batch_size:int=5000,
+    on_batch:Optional[Callable[[IngestResult], None]]=None,
+) -> IngestResult:
+    """
+    This function helps to save Locations from a stream of features, by batches of batch_size rows
+    (COPY on postgres), so that the memory used doesn't depend on the number of features.
+    The invalid features are counted and skipped, each batch is committed on its own.
+    Raises IngestInterrupted when the stream itself fails
+    """
+    result = IngestResult()
+    transform = get_transform(source_srid)
+    started_at = time.monotonic()
+    batch = []
+
+    def flush():
+        with transaction.atomic():
+            _write_locations(batch)
+            #bulk writes don't send the post_save signals which count the locations in their clusters
+            update_clusters(added=[location.location for location in batch])
+        result.rows += len(batch)
+        result.seconds = time.monotonic() - started_at
+        batch.clear()
+        #bulk writes don't send the post_save signals which drop the cached tiles
+        transaction.on_commit(invalidate_all_tiles)
+        if on_batch is not None:
+            on_batch(result)
+
+    try:
+        for index, feature in enumerate(features):
+            try:
+                batch.append(to_location(feature, source_srid, transform))
+            except InvalidFeature as e:
+                result.rejected += 1
+                if len(result.errors) < MAX_REPORTED_ERRORS:
+                    result.errors.append(f"Feature {index}: {e}")
+                continue
+
+            if len(batch) >= batch_size:
+                flush()
+    except (InvalidFeature, OSError) as e:
+        #broken document or stream: the locations read before are written and reported with the error
+        if batch:
+            flush()
+        result.seconds = time.monotonic() - started_at
+        raise IngestInterrupted(str(e), result) from e
+
+    if batch:
+        flush()
+    result.seconds = time.monotonic() - started_at
+    return result
+
+
+def _write_locations(locations:List[Location]):
+    if connection.vendor != "postgresql":
+        Location.objects.bulk_create(locations, batch_size=len(locations))
+        return
+
+    #COPY skips the per row INSERT parsing, the geometries are sent as hex EWKB
+    data = io.StringIO()
+    for location in locations:
+        data.write(f"{_copy_text(location.label)}\t{location.location.hexewkb.decode()}\t{location.geohash}\n")
+    data.seek(0)
+
+    table = connection.ops.quote_name(Location._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table} (label, location, geohash) FROM STDIN", data)
+
+
+def _copy_text(value:Optional[str]) -> str:
+    if value is None:
+        return "\\N"
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
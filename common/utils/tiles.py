@@ -0,0 +1,141 @@
+import math
+import uuid
+from typing import Iterable, List, Optional, Tuple
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.core.cache import caches
+from django.db import connection
+from common.constants import GeoCts
+from common.models import Location
+
+
+MVT_CONTENT_TYPE = "application/vnd.mapbox-vector-tile"
+LAYER_NAME = "locations"
+WEB_MERCATOR_SRID = 3857
+#latitude range of the web mercator tiles
+MAX_LATITUDE = 85.0511287798
+
+_GENERATION_KEY = "location_tile:generation"
+
+
+def get_tile_cache():
+    return caches[settings.LOCATION_TILE_CACHE_ALIAS]
+
+
+def is_valid_tile(z:int, x:int, y:int) -> bool:
+    return 0 <= z <= settings.LOCATION_TILE_MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def point_tile(longitude:float, latitude:float, z:int) -> Optional[Tuple[int, int]]:
+    """
+    This function helps to get the x, y of the tile of zoom z containing a point,
+    None when the point is out of the web mercator latitudes
+    """
+    if not -MAX_LATITUDE <= latitude <= MAX_LATITUDE:
+        return None
+    n = 2 ** z
+    x = int((longitude + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2 * n)
+    #the east and south edges belong to the last tile
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def _generation() -> int:
+    return get_tile_cache().get_or_set(_GENERATION_KEY, 0, timeout=None)
+
+
+def tile_cache_key(z:int, x:int, y:int, generation:int) -> str:
+    return f"location_tile:{generation}:{z}:{x}:{y}"
+
+
+def tile_version_key(z:int, x:int, y:int, generation:int) -> str:
+    return f"location_tile_version:{generation}:{z}:{x}:{y}"
+
+
+def get_tile(z:int, x:int, y:int) -> bytes:
+    """
+    This function helps to get the MVT of a tile, from the cache when it was already rendered.
+    The cached tile holds the version of the tile read before its render, so a render racing with
+    an invalidation is stored with the old version and never served
+    """
+    cache = get_tile_cache()
+    generation = _generation()
+    key, version_key = tile_cache_key(z, x, y, generation), tile_version_key(z, x, y, generation)
+    cached = cache.get_many([key, version_key])
+    version = cached.get(version_key, "")
+
+    if key in cached:
+        tile_version, tile = cached[key]
+        if tile_version == version:
+            return tile
+
+    tile = render_tile(z, x, y)
+    cache.set(key, (version, tile), timeout=settings.LOCATION_TILE_CACHE_TTL)
+    return tile
+
+
+def render_tile(z:int, x:int, y:int) -> bytes:
+    """
+    This function helps to build the MVT of a tile with PostGIS (ST_AsMVT), the locations are
+    selected by the bounding box of the tile, which walks the spatial index of the location field
+    """
+    table = connection.ops.quote_name(Location._meta.db_table)
+    query = f"""
+        WITH bounds AS (SELECT ST_TileEnvelope(%s, %s, %s) AS geom)
+        SELECT ST_AsMVT(tile, %s, %s, 'geom') FROM (
+            SELECT
+                l.id,
+                l.label,
+                ST_AsMVTGeom(ST_Transform(l.location, {WEB_MERCATOR_SRID}), bounds.geom, %s, %s, true) AS geom
+            FROM {table} l, bounds
+            WHERE l.location && ST_Transform(bounds.geom, {GeoCts.DEFAULT_SRID})
+        ) AS tile
+    """
+    extent = settings.LOCATION_TILE_EXTENT
+    with connection.cursor() as cursor:
+        cursor.execute(query, [z, x, y, LAYER_NAME, extent, extent, settings.LOCATION_TILE_BUFFER])
+        tile = cursor.fetchone()[0]
+    return bytes(tile) if tile is not None else b""
+
+
+def invalidate_point_tiles(points:Iterable[Optional[Point]]):
+    """
+    This function helps to drop the cached tiles containing the points, at every zoom level,
+    by giving them a new version (a random one, it never matches a version stored before)
+    """
+    generation = _generation()
+    keys = []
+    for point in points:
+        if point is None:
+            continue
+        keys += _point_tile_keys(point, generation)
+    if keys:
+        version = uuid.uuid4().hex
+        #outlives the tiles stored before, which are stored with the missing version ""
+        get_tile_cache().set_many({key: version for key in keys}, timeout=2 * settings.LOCATION_TILE_CACHE_TTL)
+
+
+def _point_tile_keys(point:Point, generation:int) -> List[str]:
+    if point.srid not in [None, GeoCts.DEFAULT_SRID]:
+        point = point.transform(GeoCts.DEFAULT_SRID, clone=True)
+
+    keys = []
+    for z in range(settings.LOCATION_TILE_MAX_ZOOM + 1):
+        tile = point_tile(point.x, point.y, z)
+        if tile is None:
+            break
+        keys.append(tile_version_key(z, *tile, generation))
+    return keys
+
+
+def invalidate_all_tiles():
+    """
+    This function helps to drop all the cached tiles at once (e.g. after a bulk ingestion), the keys
+    of the previous generation are never read again and expire with LOCATION_TILE_CACHE_TTL
+    """
+    cache = get_tile_cache()
+    try:
+        cache.incr(_GENERATION_KEY)
+    except ValueError:
+        #no generation yet, nothing was cached with it
+        cache.add(_GENERATION_KEY, 1, timeout=None)
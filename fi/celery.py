@@ -0,0 +1,13 @@
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fi.settings')
+
+app = Celery('fi')
+
+# all the celery settings are prefixed with CELERY_ in fi/settings.py
+app.config_from_object('django.conf:settings', namespace='CELERY')
+
+# load the tasks.py module of each app
+app.autodiscover_tasks()
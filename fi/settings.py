@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.gis',
+    'rest_framework_simplejwt.token_blacklist',
     # my apps
     "authentication",
     "common",
@@ -162,7 +163,109 @@ if CELERY_BROKER_URL:
     CELERY_RESULT_BACKEND = os.environ.get(
         "CELERY_RESULT_BACKEND", "django-db"
     )
+else:
+    #without a broker, the tasks run in process
+    CELERY_TASK_ALWAYS_EAGER = True
     
+
+
+######################### CACHE CONFIGURATION ##########################
+#shared by all the workers when set, the default per process memory cache is used otherwise
+REDIS_URL = os.environ.get("REDIS_URL", None)
+if REDIS_URL:
+    logger.info(f"REDIS_URL: {REDIS_URL}")
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+
+
+######################### CONTACT DISCOVERY CONFIGURATION ##########################
+#max phone numbers per request
+CONTACT_DISCOVERY_MAX_NUMBERS = int(os.getenv("CONTACT_DISCOVERY_MAX_NUMBERS", 10000))
+#phone numbers looked up per query
+CONTACT_DISCOVERY_CHUNK_SIZE = int(os.getenv("CONTACT_DISCOVERY_CHUNK_SIZE", 1000))
+
+
+######################### LOCATION SEARCH CONFIGURATION ##########################
+#locations per page of the nearest locations search
+LOCATION_SEARCH_DEFAULT_LIMIT = int(os.getenv("LOCATION_SEARCH_DEFAULT_LIMIT", 20))
+LOCATION_SEARCH_MAX_LIMIT = int(os.getenv("LOCATION_SEARCH_MAX_LIMIT", 100))
+#locations written at once by the ingestion (ingest_locations command and endpoint)
+LOCATION_INGEST_BATCH_SIZE = int(os.getenv("LOCATION_INGEST_BATCH_SIZE", 5000))
+
+
+######################### LOCATION TILES CONFIGURATION ##########################
+#vector tiles (MVT) of the locations, /locations/tiles/{z}/{x}/{y}.mvt
+LOCATION_TILE_MAX_ZOOM = int(os.getenv("LOCATION_TILE_MAX_ZOOM", 22))
+#tile coordinates resolution and margin (in tile coordinates) kept around the tile
+LOCATION_TILE_EXTENT = int(os.getenv("LOCATION_TILE_EXTENT", 4096))
+LOCATION_TILE_BUFFER = int(os.getenv("LOCATION_TILE_BUFFER", 64))
+LOCATION_TILE_CACHE_ALIAS = os.getenv("LOCATION_TILE_CACHE_ALIAS", "default")
+LOCATION_TILE_CACHE_TTL = int(os.getenv("LOCATION_TILE_CACHE_TTL", 60 * 60))
+
+
+######################### PASSWORD HASHING CONFIGURATION ##########################
+#pool running the password hashing of the async views: "thread" or "process"
+PASSWORD_HASHING_EXECUTOR = os.getenv("PASSWORD_HASHING_EXECUTOR", "thread")
+PASSWORD_HASHING_WORKERS = int(os.getenv("PASSWORD_HASHING_WORKERS", os.cpu_count() or 1))
+#max hashing operations running or queued, the next requests get a 503
+PASSWORD_HASHING_MAX_PENDING = int(os.getenv("PASSWORD_HASHING_MAX_PENDING", 4 * PASSWORD_HASHING_WORKERS))
+
+
+######################### OTP CONFIGURATION ##########################
+#where the otp tokens are stored: authentication.utils.otp_store.DatabaseOTPStore or CacheOTPStore
+OTP_STORE_BACKEND = os.getenv("OTP_STORE_BACKEND", "authentication.utils.otp_store.DatabaseOTPStore")
+OTP_STORE_CACHE_ALIAS = os.getenv("OTP_STORE_CACHE_ALIAS", "default")
+#seconds an expired token is kept (by the cache store or until purged), to report it as expired instead of missing
+OTP_EXPIRED_RETENTION = int(os.getenv("OTP_EXPIRED_RETENTION", 60*60))
+
+
+######################### OTP DELIVERY CONFIGURATION ##########################
+#gateway class of each provider (see authentication.constants.OTPDeliveryCts)
+OTP_DELIVERY_GATEWAYS = {
+    "sms": os.getenv("OTP_SMS_GATEWAY", "authentication.utils.otp_delivery.FakeOTPGateway"),
+    "whatsapp": os.getenv("OTP_WHATSAPP_GATEWAY", "authentication.utils.otp_delivery.FakeOTPGateway"),
+}
+OTP_DELIVERY_DEFAULT_PROVIDER = os.getenv("OTP_DELIVERY_DEFAULT_PROVIDER", "sms")
+#max number of messages given to a gateway at once
+OTP_DELIVERY_BATCH_SIZE = int(os.getenv("OTP_DELIVERY_BATCH_SIZE", 100))
+OTP_DELIVERY_MAX_RETRIES = int(os.getenv("OTP_DELIVERY_MAX_RETRIES", 5))
+#the messages of all the requests are buffered per provider (in a cache shared by the web and celery processes)
+#and sent by batches by the flush_otp_deliveries periodic task. Without a broker (no beat) or a shared cache (REDIS_URL),
+#each request queues its own messages right away
+OTP_DELIVERY_BUFFERED = os.getenv("OTP_DELIVERY_BUFFERED", "true" if CELERY_BROKER_URL and REDIS_URL else "false").lower() in ["true", "1", "yes"]
+OTP_DELIVERY_CACHE_ALIAS = os.getenv("OTP_DELIVERY_CACHE_ALIAS", "default")
+#seconds between two flushes of the buffers
+OTP_DELIVERY_FLUSH_INTERVAL = float(os.getenv("OTP_DELIVERY_FLUSH_INTERVAL", 2))
+#max number of buffered requests sent by a flush
+OTP_DELIVERY_FLUSH_MAX_SLOTS = int(os.getenv("OTP_DELIVERY_FLUSH_MAX_SLOTS", 10000))
+#seconds a buffered message waits for a flush before being dropped
+OTP_DELIVERY_BUFFER_TTL = int(os.getenv("OTP_DELIVERY_BUFFER_TTL", 10*60))
+
+
+######################### PURGE CONFIGURATION ##########################
+#expired otps and abandoned signups are deleted by batches, pausing between them not to load the db
+AUTH_PURGE_BATCH_SIZE = int(os.getenv("AUTH_PURGE_BATCH_SIZE", 1000))
+AUTH_PURGE_BATCH_PAUSE = float(os.getenv("AUTH_PURGE_BATCH_PAUSE", 0.1))
+#hours after which an unverified signup is considered abandoned
+UNVERIFIED_USER_RETENTION_HOURS = int(os.getenv("UNVERIFIED_USER_RETENTION_HOURS", 24))
+#minutes between two runs of the purge task
+AUTH_PURGE_INTERVAL_MINUTES = int(os.getenv("AUTH_PURGE_INTERVAL_MINUTES", 15))
+
+CELERY_BEAT_SCHEDULE = {
+    "purge-stale-auth-data": {
+        "task": "authentication.tasks.purge_stale_auth_data",
+        "schedule": timedelta(minutes=AUTH_PURGE_INTERVAL_MINUTES),
+    },
+    "flush-otp-deliveries": {
+        "task": "authentication.tasks.flush_otp_deliveries",
+        "schedule": timedelta(seconds=OTP_DELIVERY_FLUSH_INTERVAL),
+    },
+}
+
     
 ######################### REST FRAMEWORK ##########################""
 
@@ -175,31 +278,63 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         # 'rest_framework.authentication.SessionAuthentication',
         # "rest_framework.authentication.BasicAuthentication",
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "authentication.authentication.CachedJWTAuthentication",
     ],
     #"DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
     
+    #reverse proxies in front of the app, the client address is taken from X-Forwarded-For after them
+    #(REMOTE_ADDR when 0), unset DRF would trust the whole header sent by the client
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", 0)),
+    #rates of the authentication.throttling classes, as "<view action>.<ident type>"
+    #counters are shared by the workers when REDIS_URL is set (check authentication.W002 otherwise)
+    "DEFAULT_THROTTLE_RATES": {
+        "login.ip": os.getenv("LOGIN_IP_THROTTLE_RATE", "30/min"),
+        "login.phone_number": os.getenv("LOGIN_PHONE_NUMBER_THROTTLE_RATE", "5/min"),
+        "verify_phone_number.ip": os.getenv("VERIFY_PHONE_NUMBER_IP_THROTTLE_RATE", "30/min"),
+        "verify_phone_number.user_id": os.getenv("VERIFY_PHONE_NUMBER_USER_THROTTLE_RATE", "5/min"),
+        "resend_phone_verification.ip": os.getenv("RESEND_PHONE_VERIFICATION_IP_THROTTLE_RATE", "10/min"),
+        "resend_phone_verification.user_id": os.getenv("RESEND_PHONE_VERIFICATION_USER_THROTTLE_RATE", "3/min"),
+        "refresh.ip": os.getenv("REFRESH_IP_THROTTLE_RATE", "30/min"),
+        "discover.user_id": os.getenv("CONTACT_DISCOVERY_USER_THROTTLE_RATE", "10/hour"),
+    },
+    
     "PAGE_SIZE": "1",
 }
 
 
 ####################### JWT ############################################""
 
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=6 * 31),  # 6 months
     "REFRESH_TOKEN_LIFETIME": timedelta(days=12 * 31),  # 1 year
     "ROTATE_REFRESH_TOKENS": True,
     "BLACKLIST_AFTER_ROTATION": True,
-    "ALGORITHM": "HS256",
-    "SIGNING_KEY": SECRET_KEY,
-    "VERIFYING_KEY": None,
+    #RS256/ES256 with PEM keys ("\n" escaped), the verifying (public) key is enough to verify the tokens
+    "ALGORITHM": JWT_ALGORITHM,
+    #SECRET_KEY is only a valid key for the HMAC algorithms, verifiers of RS/ES tokens have no signing key
+    "SIGNING_KEY": os.getenv("JWT_SIGNING_KEY", "").replace("\\n", "\n") or (SECRET_KEY if JWT_ALGORITHM.startswith("HS") else ""),
+    "VERIFYING_KEY": os.getenv("JWT_VERIFYING_KEY", "").replace("\\n", "\n") or None,
     "AUTH_HEADER_TYPES": ("JWT", "Bearer"),
     "USER_ID_FIELD": "id",
     "USER_ID_CLAIM": "user_id",
-    "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
+    "AUTH_TOKEN_CLASSES": ("authentication.utils.jwt_token.AccessToken",),
     "TOKEN_TYPE_CLAIM": "token_type",
 }
 
+#authenticated users are cached (shared by the workers with REDIS_URL), dropped when the user is saved
+JWT_USER_CACHE_ALIAS = os.getenv("JWT_USER_CACHE_ALIAS", "default")
+JWT_USER_CACHE_TTL = int(os.getenv("JWT_USER_CACHE_TTL", 5 * 60))
+#build the user from the token claims, without any lookup (the claims are as old as the token)
+JWT_STATELESS_AUTH = os.getenv("JWT_STATELESS_AUTH", "false").lower() in ["true", "1", "yes"]
+#max number of verified tokens whose payload is kept in memory, per worker (0 disables the cache)
+JWT_VERIFICATION_CACHE_SIZE = int(os.getenv("JWT_VERIFICATION_CACHE_SIZE", 10000))
+#max delay (in seconds) before a worker rejects the tokens revoked by another worker
+JWT_REVOCATION_SYNC_INTERVAL = int(os.getenv("JWT_REVOCATION_SYNC_INTERVAL", 5))
+#the expired tokens are dropped from the in memory blacklist by a full reload
+JWT_REVOCATION_FULL_SYNC_INTERVAL = int(os.getenv("JWT_REVOCATION_FULL_SYNC_INTERVAL", 10 * 60))
+
 ######################### LOGGIN CONFIGURATION ##########################
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
@@ -207,6 +342,19 @@ LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
 ######################### CRYPTOGRAPHY CONFIGURATION ##########################
 ENCRIPTION_KEY = os.getenv("ENCRIPTION_KEY", "1" * 32)
+#previous keys (comma separated), still accepted for decryption until `manage.py rotate_encryption_key` is run
+ENCRIPTION_OLD_KEYS = [key for key in os.getenv("ENCRIPTION_OLD_KEYS", "").split(",") if key]
+
+
+######################### KEY MANAGER CONFIGURATION ##########################
+#max delay (in seconds) before a worker sees the Key changes made by another worker
+KEY_MANAGER_REFRESH_INTERVAL = int(os.getenv("KEY_MANAGER_REFRESH_INTERVAL", 5))
+#time to live (in seconds) of a cached key, existing or not
+KEY_MANAGER_CACHE_TTL = int(os.getenv("KEY_MANAGER_CACHE_TTL", 300))
+#max number of cached keys, the least recently used ones are evicted first
+KEY_MANAGER_CACHE_MAX_SIZE = int(os.getenv("KEY_MANAGER_CACHE_MAX_SIZE", 1024))
+#preload all the keys on the first request of each worker process
+KEY_MANAGER_WARM_UP = os.getenv("KEY_MANAGER_WARM_UP", "true").lower() in ["true", "1", "yes"]
 
 
 ########################## SWAGGER CONFIGURATION ##########################